@@ -0,0 +1,101 @@
+"""
+Benchmarks the pandas and SQLite query backends against each other.
+
+Generates synthetic promise data with the app's typed schema (synthetic_data.py), builds the
+PromiseIndex (pandas) and the SQLite database, and times a set of structured
+queries on both. Every query's results are compared first; the run fails if
+the backends disagree. The report lists per-query timings, the time to the
+first page of SQLite results, and the smallest size at which SQLite was
+faster for each query (the crossover).
+
+Usage:
+    python benchmarks/bench_backends.py [--sizes 1000 10000 100000 1000000] [--repeat 5]
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import pandas as pd
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(BENCH_DIR), "src"))
+sys.path.insert(0, BENCH_DIR)
+
+from indexes import PromiseIndex  # noqa: E402
+from sql_backend import SQLiteBackend  # noqa: E402
+from synthetic_data import generate_promises  # noqa: E402
+from utils import apply_structured_query, dataset_version  # noqa: E402
+
+QUERIES = {
+    "city": {"city": {"$eq": "Seattle"}},
+    "late+city": {"status": "late", "city": "Chicago"},
+    "date range": {"due_date": {"$between": ["2025-03-01", "2025-03-31"]}},
+    "late+date": {"status": {"$eq": "late"}, "due_date": {"$gt": "2025-06-01"}},
+    "text": {"promise_description": "bridge"},
+    "or": {"$or": [{"category": {"$eq": "Water"}}, {"status": {"$eq": "late"}}]},
+    "not late": {"status": {"$ne": "late"}},
+}
+
+def best_time(function, repeat):
+    """Returns the fastest of repeat runs, in seconds, and the last result."""
+    best, result = float("inf"), None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000, 1000000])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    crossover = {}
+    with tempfile.TemporaryDirectory() as directory:
+        for n_rows in args.sizes:
+            data_df = generate_promises(n_rows)
+            start = time.perf_counter()
+            index = PromiseIndex(data_df)
+            index_seconds = time.perf_counter() - start
+            start = time.perf_counter()
+            backend = SQLiteBackend(data_df, dataset_version(data_df), os.path.join(directory, f"{n_rows}.sqlite3"))
+            build_seconds = time.perf_counter() - start
+
+            print(
+                f"\n{n_rows} rows: DataFrame {data_df.memory_usage(deep=True).sum() / 1e6:.1f} MB, "
+                f"index {index_seconds:.2f}s; SQLite file {os.path.getsize(backend.db_path) / 1e6:.1f} MB, "
+                f"build {build_seconds:.2f}s"
+            )
+            print(f"{'query':>12} {'matches':>9} {'pandas ms':>10} {'sqlite ms':>10} {'1st page ms':>12}")
+            for name, plan in QUERIES.items():
+                pandas_seconds, expected = best_time(
+                    lambda: apply_structured_query(data_df, plan, index), args.repeat
+                )
+                sqlite_seconds, actual = best_time(
+                    lambda: apply_structured_query(data_df, plan, backend=backend), args.repeat
+                )
+                pd.testing.assert_frame_equal(expected, actual, obj=f"{name} at {n_rows} rows")
+                streamed = pd.concat(backend.iter_pages(plan)) if len(expected) else expected
+                pd.testing.assert_frame_equal(expected, streamed, obj=f"{name} pages at {n_rows} rows")
+                first_page_seconds, _ = best_time(lambda: next(backend.iter_pages(plan), None), args.repeat)
+
+                print(
+                    f"{name:>12} {len(expected):>9} {pandas_seconds * 1e3:>10.2f} "
+                    f"{sqlite_seconds * 1e3:>10.2f} {first_page_seconds * 1e3:>12.2f}"
+                )
+                if sqlite_seconds < pandas_seconds:
+                    crossover.setdefault(name, n_rows)
+
+    print("\nAll queries returned identical results on both backends.")
+    print("Smallest size at which SQLite was faster:")
+    for name in QUERIES:
+        print(f"{name:>12}: {crossover.get(name, 'never (in the sizes tested)')}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""
+Benchmarks LLM query planning during bursts, with and without micro-batching.
+
+Starts the fake Gemini server from fake_llm_server.py and, for each burst
+size, sends that many distinct queries at once through llm.get_structured_query
+(with the plan cache disabled), first one request per query and then with
+micro-batching. The report lists the upstream requests made, per-query
+latency and the queries that could not be planned (e.g. because the
+concurrency limit was reached).
+
+Usage:
+    python benchmarks/bench_llm_batching.py [--bursts 1 4 16 32] [--latency 0.3]
+        [--window 0.05] [--max-batch 8]
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import threading
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(BENCH_DIR), "src"))
+sys.path.insert(0, BENCH_DIR)
+
+from fake_llm_server import start_server  # noqa: E402
+
+COLUMNS = ["city", "promise_id", "promise_description", "due_date", "status", "latitude", "longitude", "category"]
+
+
+def run_burst(llm, size, round_id):
+    """Sends size distinct queries at once; returns (latencies, failures)."""
+    latencies, failures = [], []
+    lock = threading.Lock()
+    start_barrier = threading.Barrier(size)
+
+    def worker(i):
+        start_barrier.wait()
+        start = time.perf_counter()
+        try:
+            llm.get_structured_query(f"promises matching topic {round_id}-{i}", COLUMNS)
+            with lock:
+                latencies.append(time.perf_counter() - start)
+        except (llm.LLMUnavailableError, llm.LLMPlanError) as e:
+            with lock:
+                failures.append(str(e))
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(size)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--bursts", type=int, nargs="+", default=[1, 4, 16, 32])
+    parser.add_argument("--latency", type=float, default=0.3)
+    parser.add_argument("--window", type=float, default=0.05)
+    parser.add_argument("--max-batch", type=int, default=8)
+    args = parser.parse_args()
+
+    server = start_server(port=0, latency=args.latency, jitter=args.latency / 10)
+    os.environ.update(
+        GEMINI_API_KEY="fake",
+        GEMINI_API_ENDPOINT=f"http://127.0.0.1:{server.server_address[1]}",
+        PLAN_CACHE_ENABLED="0",
+    )
+    import llm
+    from llm_executor import LLMExecutor
+    from plan_batcher import MicroBatcher
+
+    llm.get_structured_query("warm up the client", COLUMNS)
+
+    print(f"Fake upstream latency {args.latency * 1000:.0f} ms, window {args.window * 1000:.0f} ms, "
+          f"max batch {args.max_batch}, {llm.llm_executor.max_concurrency} calls in flight per process")
+    print(f"{'mode':>8} {'burst':>6} {'requests':>9} {'p50 ms':>8} {'p95 ms':>8} {'max ms':>8} {'failed':>7}")
+    for mode in ("single", "batched"):
+        for round_id, size in enumerate(args.bursts):
+            llm.llm_executor = LLMExecutor()
+            llm.plan_batcher = MicroBatcher(llm._plan_batch, args.window, args.max_batch) if mode == "batched" else None
+            before = server.counts["requests"]
+            latencies, failures = run_burst(llm, size, f"{mode}{round_id}")
+            requests = server.counts["requests"] - before
+            latencies.sort()
+            p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))] if latencies else float("nan")
+            print(
+                f"{mode:>8} {size:>6} {requests:>9} "
+                f"{statistics.median(latencies) * 1000 if latencies else float('nan'):>8.0f} "
+                f"{p95 * 1000:>8.0f} {(latencies[-1] if latencies else float('nan')) * 1000:>8.0f} {len(failures):>7}"
+            )
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,409 @@
+"""
+Benchmarks every stage of answering a query, and the full callback chain, at several data sizes.
+
+For each size, synthetic_data.py writes a promise CSV, which is then loaded
+and queried like the app does. The LLM is replaced by the replay provider
+(llm_providers.ReplayProvider) with a recording made for the suite's
+queries, optionally with a simulated latency. The stages are:
+
+    load csv          data_loader.load_promises, parsing the CSV
+    build dataset     indexes, KPIs and query engine (dataset.Dataset)
+    filter            utils.filter_dataframe_from_query for each query
+    map payload       live_map.marker_payload of each result, as JSON
+    report write      reports.write_report of each result
+    cb <name>         each Dash callback a query click triggers, posted to
+                      /_dash-update-component with a cold result and map cache
+    callback chain    all of those callbacks for each query
+
+Each stage reports its best wall time over --repeat runs, the peak memory
+allocated during one more run (tracemalloc, so memory outside Python's
+allocators, e.g. in SQLite, is not counted) and the bytes it produced (HTML,
+JSON responses or report files). Save the results with --save-baseline and
+compare a later run with --baseline: stages that got slower, allocate or
+produce more by more than --tolerance are flagged, and the script exits with
+status 1.
+
+Usage:
+    python benchmarks/bench_suite.py [--sizes 1000 10000 100000 1000000] [--repeat 3]
+        [--llm-latency 0] [--history 100] [--max-report-rows 100000]
+        [--save-baseline benchmarks/baseline.json] [--baseline benchmarks/baseline.json]
+        [--tolerance 0.25]
+"""
+
+import argparse
+import datetime
+import json
+import os
+import platform
+import resource
+import sys
+import tempfile
+import time
+import tracemalloc
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(BENCH_DIR), "src"))
+sys.path.insert(0, BENCH_DIR)
+
+# The suite's queries and the answers the replayed LLM gives for them; the
+# first two are simple enough for the local parser, "" shows every promise
+QUERIES = {
+    "late promises in Boston": None,
+    "water projects due after 2025": None,
+    "bridge or streetlight repairs that are behind schedule": {
+        "conditions": [{"column": "status", "op": "eq", "value": "late"}],
+        "any_of": [
+            {"conditions": [{"column": "promise_description", "op": "contains", "value": "bridge"}]},
+            {"conditions": [{"column": "promise_description", "op": "contains", "value": "streetlights"}]},
+        ],
+    },
+    "what has the mayor promised the biggest city": {
+        "conditions": [{"column": "city", "op": "eq", "value": "New York"}]
+    },
+    "": None,
+}
+
+# (callback name, outputs, inputs, state); values are filled in per query
+CALLBACKS = [
+    (
+        "run_query",
+        [("query-result-store", "data")],
+        [("show-results-button", "n_clicks")],
+        [("query-input", "value")],
+    ),
+    (
+        "results_content",
+        [
+            ("results-cards-view", "style"),
+            ("results-table-view", "style"),
+            ("record-count-display", "children"),
+            ("results-pagination", "max_value"),
+            ("results-pagination", "active_page"),
+            ("results-pagination", "style"),
+            ("results-table", "page_current"),
+        ],
+        [("query-result-store", "data"), ("results-tabs", "active_tab")],
+        [],
+    ),
+    (
+        "results_cards",
+        [("results-cards", "children")],
+        [("query-result-store", "data"), ("results-pagination", "active_page")],
+        [],
+    ),
+    (
+        "results_table",
+        [("results-table", "data"), ("results-table", "page_count"), ("results-table-info", "children")],
+        [
+            ("query-result-store", "data"),
+            ("results-tabs", "active_tab"),
+            ("results-table", "page_current"),
+            ("results-table", "page_size"),
+            ("results-table", "sort_by"),
+            ("results-table", "filter_query"),
+        ],
+        [],
+    ),
+    (
+        "map_and_history",
+        [
+            ("map-markers-store", "data"),
+            ("download-button", "disabled"),
+            ("chat-history-count", "data"),
+            ("chat-history-output", "children"),
+        ],
+        [("query-result-store", "data")],
+        [("chat-history-count", "data"), ("history-session-id", "data")],
+    ),
+]
+
+
+def configure_environment(workdir, llm_latency):
+    """Points every cache at workdir and the LLM at a replayed recording of QUERIES; call before importing the app."""
+    recording = os.path.join(workdir, "llm_recording.jsonl")
+    os.environ.update(
+        LLM_PROVIDER="replay",
+        LLM_REPLAY_PATH=recording,
+        LLM_REPLAY_LATENCY="recorded" if llm_latency else "none",
+        PLAN_CACHE_ENABLED="0",
+        PLAN_CACHE_PATH=os.path.join(workdir, "plan_cache.sqlite3"),
+        DATA_SNAPSHOT_DIR=workdir,
+        DATA_RELOAD_ENABLED="0",
+        REPORTS_DIR=os.path.join(workdir, "reports"),
+        MAP_DOCUMENT_CACHE_PATH="",
+        SQL_BACKEND_PATH=os.path.join(workdir, "promises.sqlite3"),
+    )
+
+    from config import PROMPT_VERSION
+
+    with open(recording, "w", encoding="utf-8") as f:
+        for query, answer in QUERIES.items():
+            if answer is not None:
+                entry = {"query": query, "answer": answer, "seconds": llm_latency, "prompt_version": PROMPT_VERSION}
+                f.write(json.dumps(entry) + "\n")
+
+
+def measure(function, repeat):
+    """
+    Times function and measures its peak allocations.
+
+    Returns:
+        dict: The best seconds of repeat runs, the peak traced bytes of one
+        more run and the bytes function returned (None if it returned None).
+    """
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+    tracemalloc.start()
+    try:
+        output_bytes = function()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {"seconds": best, "peak_bytes": peak, "payload_bytes": output_bytes}
+
+
+def callback_body(outputs, inputs, state, values):
+    """Builds a /_dash-update-component request body like the Dash renderer sends."""
+    if len(outputs) == 1:
+        output = "{}.{}".format(*outputs[0])
+        output_spec = {"id": outputs[0][0], "property": outputs[0][1]}
+    else:
+        output = ".." + "...".join("{}.{}".format(*item) for item in outputs) + ".."
+        output_spec = [{"id": id, "property": prop} for id, prop in outputs]
+    return {
+        "output": output,
+        "outputs": output_spec,
+        "inputs": [{"id": id, "property": prop, "value": values.get((id, prop))} for id, prop in inputs],
+        "changedPropIds": ["{}.{}".format(*inputs[0])],
+        "state": [{"id": id, "property": prop, "value": values.get((id, prop))} for id, prop in state],
+    }
+
+
+def run_size(n_rows, args, workdir):
+    """Runs every stage on n_rows synthetic promises; returns stage -> measurement."""
+    import dash
+
+    from callbacks import register_callbacks
+    from data_loader import load_promises
+    from dataset import Dataset, DatasetHolder
+    from layout import create_layout
+    from live_map import marker_payload
+    from map_cache import map_cache
+    from pagination import table_view_cache
+    from query_engine import QueryEngine
+    from reports import write_report
+    from synthetic_data import write_promises_csv
+    from utils import filter_dataframe_from_query
+
+    csv_path = write_promises_csv(os.path.join(workdir, f"promises_{n_rows}.csv"), n_rows)
+    results = {}
+
+    def load():
+        load_promises(csv_path, use_snapshot=False)
+
+    results["load csv"] = measure(load, args.repeat)
+    data_df, _ = load_promises(csv_path, use_snapshot=False)
+
+    def build():
+        Dataset(data_df)
+
+    results["build dataset"] = measure(build, args.repeat)
+    data = Dataset(data_df)
+
+    def filter_all():
+        for query in QUERIES:
+            filter_dataframe_from_query(data_df, query, data.index)
+
+    filtered = {query: filter_dataframe_from_query(data_df, query, data.index) for query in QUERIES}
+    results["filter"] = measure(filter_all, args.repeat)
+    results["map payload"] = measure(
+        lambda: sum(len(json.dumps(marker_payload(df)).encode("utf-8")) for df in filtered.values()), args.repeat
+    )
+    if n_rows <= args.max_report_rows:
+        report_path = os.path.join(workdir, "report.html")
+        results["report write"] = measure(
+            lambda: sum(os.path.getsize(write_report(report_path, df, query)) for query, df in filtered.items()),
+            args.repeat,
+        )
+
+    # The app's callbacks, served by Dash for a dataset already loaded
+    holder = DatasetHolder(csv_path, reload_enabled=False)
+    holder.load()
+    app = dash.Dash(__name__)
+    kpis = holder.current.kpis
+    app.layout = create_layout(kpis["total"], kpis["late"], kpis["due"], kpis["on_time"], "")
+    register_callbacks(app, holder)
+    client = app.server.test_client()
+
+    def post(name, values):
+        _, outputs, inputs, state = next(spec for spec in CALLBACKS if spec[0] == name)
+        response = client.post("/_dash-update-component", json=callback_body(outputs, inputs, state, values))
+        if response.status_code not in (200, 204):
+            raise RuntimeError(f"{name} returned HTTP {response.status_code}")
+        return response.get_data(), response.get_json(silent=True) or {}
+
+    def chain(timings):
+        """Runs every callback of a click for each query, from a cold result and map cache."""
+        current = holder.current
+        current.engine = QueryEngine(current.df, current.index, backend=current.backend)
+        map_cache.clear()
+        table_view_cache.clear()
+        total_bytes = 0
+        for number, query in enumerate(QUERIES, 1):
+            values = {
+                ("show-results-button", "n_clicks"): number,
+                ("query-input", "value"): query,
+                ("results-pagination", "active_page"): 1,
+                ("results-table", "page_current"): 0,
+                ("results-table", "page_size"): 20,
+                ("results-table", "sort_by"): [],
+                ("results-table", "filter_query"): "",
+                ("chat-history-count", "data"): args.history + number - 1,
+                ("history-session-id", "data"): "bench",
+            }
+            for name, *_ in CALLBACKS:
+                # The table only renders rows while the Tabular View is open
+                tab = "tabular-tab" if name == "results_table" else "results-tab"
+                values[("results-tabs", "active_tab")] = tab
+                start = time.perf_counter()
+                body, response = post(name, values)
+                timings[name] = timings.get(name, 0.0) + time.perf_counter() - start
+                total_bytes += len(body)
+                timings[name + " bytes"] = timings.get(name + " bytes", 0) + len(body)
+                if name == "run_query":
+                    values[("query-result-store", "data")] = response["response"]["query-result-store"]["data"]
+        return total_bytes
+
+    runs = []
+    for _ in range(args.repeat):
+        timings = {}
+        start = time.perf_counter()
+        chain(timings)
+        timings["callback chain"] = time.perf_counter() - start
+        runs.append(timings)
+    chain_memory = measure(lambda: chain({}), 0)
+    for name, *_ in CALLBACKS:
+        results[f"cb {name}"] = {
+            "seconds": min(run[name] for run in runs),
+            "peak_bytes": None,
+            "payload_bytes": runs[-1][name + " bytes"],
+        }
+    results["callback chain"] = {
+        "seconds": min(run["callback chain"] for run in runs),
+        "peak_bytes": chain_memory["peak_bytes"],
+        "payload_bytes": chain_memory["payload_bytes"],
+    }
+    return results
+
+
+def compare(results, baseline, tolerance, min_seconds):
+    """
+    Lists the stages that regressed against the baseline.
+
+    Args:
+        results (dict): size -> stage -> measurement of this run.
+        baseline (dict): The same for the saved baseline.
+        tolerance (float): Allowed relative increase (0.25 = 25%).
+        min_seconds (float): Time increases below this are ignored as noise.
+
+    Returns:
+        list: (size, stage, metric, baseline value, new value) per regression.
+    """
+    floors = {"seconds": min_seconds, "peak_bytes": 1024 * 1024, "payload_bytes": 1024}
+    regressions = []
+    for size, stages in results.items():
+        for stage, measurement in stages.items():
+            base = baseline.get(size, {}).get(stage)
+            if not base:
+                continue
+            for metric, floor in floors.items():
+                old, new = base.get(metric), measurement.get(metric)
+                if old is None or new is None:
+                    continue
+                if new > old * (1 + tolerance) and new - old > floor:
+                    regressions.append((size, stage, metric, old, new))
+    return regressions
+
+
+def format_bytes(value):
+    if value is None:
+        return ""
+    return f"{value / 1e6:.1f} MB" if value >= 1e6 else f"{value / 1e3:.1f} kB"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000, 1000000])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--llm-latency", type=float, default=0.0, help="Seconds each replayed LLM call takes")
+    parser.add_argument(
+        "--history", type=int, default=100, help="Entries already in the query history (the oldest is trimmed)"
+    )
+    parser.add_argument(
+        "--max-report-rows", type=int, default=100000, help="Skip report writing above this many rows"
+    )
+    parser.add_argument("--save-baseline", help="Write the results to this JSON file")
+    parser.add_argument("--baseline", help="Compare the results with this JSON file")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    parser.add_argument("--min-seconds", type=float, default=0.005)
+    args = parser.parse_args()
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)["results"]
+
+    results = {}
+    with tempfile.TemporaryDirectory() as workdir:
+        configure_environment(workdir, args.llm_latency)
+        for n_rows in args.sizes:
+            stages = run_size(n_rows, args, workdir)
+            results[str(n_rows)] = stages
+            rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+            print(f"\n{n_rows} rows (process max RSS so far {format_bytes(rss)})")
+            print(f"{'stage':>20} {'ms':>10} {'peak alloc':>12} {'bytes':>12} {'vs baseline':>12}")
+            for stage, measurement in stages.items():
+                base = (baseline or {}).get(str(n_rows), {}).get(stage)
+                ratio = f"x{measurement['seconds'] / base['seconds']:.2f}" if base and base["seconds"] else ""
+                print(
+                    f"{stage:>20} {measurement['seconds'] * 1000:>10.1f} "
+                    f"{format_bytes(measurement['peak_bytes']):>12} "
+                    f"{format_bytes(measurement['payload_bytes']):>12} {ratio:>12}"
+                )
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w", encoding="utf-8") as f:
+            json.dump(
+                {
+                    "created": datetime.datetime.now().isoformat(timespec="seconds"),
+                    "python": platform.python_version(),
+                    "machine": platform.machine(),
+                    "llm_latency": args.llm_latency,
+                    "results": results,
+                },
+                f,
+                indent=1,
+            )
+        print(f"\nSaved the results to {args.save_baseline}")
+
+    if baseline is not None:
+        regressions = compare(results, baseline, args.tolerance, args.min_seconds)
+        if not regressions:
+            print(f"\nNo regressions against {args.baseline} (tolerance {args.tolerance:.0%}).")
+            return 0
+        print(f"\n{len(regressions)} regressions against {args.baseline} (tolerance {args.tolerance:.0%}):")
+        for size, stage, metric, old, new in regressions:
+            if metric == "seconds":
+                change = f"{old * 1000:.1f} ms -> {new * 1000:.1f} ms"
+            else:
+                change = f"{format_bytes(old)} -> {format_bytes(new)}"
+            print(f"  {size:>8} rows  {stage:<20} {metric:<14} {change}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,155 @@
+"""
+A local stand-in for the Gemini REST API, for exercising the LLM call path.
+
+It answers generateContent requests with a fixed answer in the response
+schema of llm_prompt (a JSON array of them for a batch prompt) after a
+configurable latency, and fails a share of them with 503 responses or by not
+answering until the client gives up. Point the app at it with
+
+    GEMINI_API_KEY=fake GEMINI_API_ENDPOINT=http://127.0.0.1:8089 python src/app.py
+
+and watch the executor's deadlines, retries and circuit breaker at work
+(llm.get_llm_call_stats()).
+
+Usage:
+    python benchmarks/fake_llm_server.py [--port 8089] [--latency 0.2] [--jitter 0.1]
+        [--error-rate 0.0] [--hang-rate 0.0] [--hang-seconds 60] [--answer ANSWER_JSON]
+"""
+
+import argparse
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# The numbered query lines of a batch prompt (llm_prompt.build_batch_prompt)
+BATCH_QUERY_PATTERN = re.compile(r'^\s*\d+\. "', re.MULTILINE)
+
+DEFAULT_ANSWER = {"conditions": [{"column": "status", "op": "eq", "value": "late"}]}
+
+
+def prompt_text(body):
+    """Returns the prompt text of a generateContent request body."""
+    try:
+        request = json.loads(body)
+        return "".join(part.get("text", "") for content in request["contents"] for part in content["parts"])
+    except (ValueError, KeyError, TypeError):
+        return ""
+
+
+class FakeGeminiHandler(BaseHTTPRequestHandler):
+    """Serves POST .../models/<model>:generateContent like the Gemini REST API."""
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        prompt = prompt_text(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+        server = self.server
+        batch_size = len(BATCH_QUERY_PATTERN.findall(prompt)) if "JSON array" in prompt else 0
+        with server.lock:
+            server.counts["requests"] += 1
+            server.counts["queries"] += max(batch_size, 1)
+
+        if not self.path.split("?")[0].endswith(":generateContent"):
+            self._send_json(404, {"error": {"code": 404, "message": "Not found", "status": "NOT_FOUND"}})
+            return
+
+        roll = random.random()
+        if roll < server.hang_rate:
+            with server.lock:
+                server.counts["hangs"] += 1
+            time.sleep(server.hang_seconds)
+        elif roll < server.hang_rate + server.error_rate:
+            with server.lock:
+                server.counts["errors"] += 1
+            self._send_json(
+                503, {"error": {"code": 503, "message": "The model is overloaded.", "status": "UNAVAILABLE"}}
+            )
+            return
+
+        time.sleep(max(0.0, random.gauss(server.latency, server.jitter)))
+        text = json.dumps([server.answer] * batch_size if batch_size else server.answer)
+        self._send_json(
+            200,
+            {
+                "candidates": [
+                    {"content": {"parts": [{"text": text}], "role": "model"}, "finishReason": "STOP", "index": 0}
+                ],
+                "usageMetadata": {
+                    # Roughly four characters per token
+                    "promptTokenCount": len(prompt) // 4,
+                    "candidatesTokenCount": len(text) // 4,
+                    "totalTokenCount": (len(prompt) + len(text)) // 4,
+                },
+            },
+        )
+
+
+def start_server(port=8089, latency=0.2, jitter=0.1, error_rate=0.0, hang_rate=0.0, hang_seconds=60.0,
+                 answer=None, verbose=False):
+    """
+    Starts the fake server on a background thread.
+
+    Args:
+        port (int): The port to listen on (0 picks a free one).
+        latency (float): Mean response time in seconds.
+        jitter (float): Standard deviation of the response time.
+        error_rate (float): Share of requests answered with 503.
+        hang_rate (float): Share of requests left unanswered for hang_seconds.
+        hang_seconds (float): How long a hanging request stalls.
+        answer (dict, optional): The answer returned for every query (default: status eq "late").
+        verbose (bool): Log every request.
+
+    Returns:
+        ThreadingHTTPServer: The running server; its "counts" dict tallies
+        requests, the queries they carried, errors and hangs. Call shutdown() to stop it.
+    """
+    server = ThreadingHTTPServer(("127.0.0.1", port), FakeGeminiHandler)
+    server.daemon_threads = True
+    server.latency, server.jitter = latency, jitter
+    server.error_rate, server.hang_rate, server.hang_seconds = error_rate, hang_rate, hang_seconds
+    server.answer = answer if answer is not None else DEFAULT_ANSWER
+    server.verbose = verbose
+    server.lock = threading.Lock()
+    server.counts = {"requests": 0, "queries": 0, "errors": 0, "hangs": 0}
+    threading.Thread(target=server.serve_forever, name="fake-llm", daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--latency", type=float, default=0.2)
+    parser.add_argument("--jitter", type=float, default=0.1)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--hang-rate", type=float, default=0.0)
+    parser.add_argument("--hang-seconds", type=float, default=60.0)
+    parser.add_argument("--answer", type=json.loads, default=None)
+    args = parser.parse_args()
+
+    server = start_server(
+        args.port, args.latency, args.jitter, args.error_rate, args.hang_rate, args.hang_seconds,
+        args.answer, verbose=True,
+    )
+    print(f"Fake Gemini API listening on http://127.0.0.1:{server.server_address[1]}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
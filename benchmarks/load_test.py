@@ -0,0 +1,178 @@
+"""
+Load-tests a running app end to end by sending queries through its Dash callbacks.
+
+Each simulated user clicks "Show Results" for a query (the run_query
+callback, which plans and filters it) and then loads the record count (the
+update_results_content callback), like the browser does. The report lists
+throughput, latency percentiles and how many queries were answered, could
+not be planned because the LLM was unavailable or gave an unusable answer,
+or failed.
+
+To load-test without Gemini, record a session once with LLM_PROVIDER=record
+and start the app under test with the recorded answers and timing:
+
+    LLM_PROVIDER=replay PLAN_CACHE_ENABLED=0 gunicorn -c gunicorn.conf.py src.app:server
+    python benchmarks/load_test.py --url http://127.0.0.1:8050 --queries-from cache/llm_recording.jsonl
+
+Usage:
+    python benchmarks/load_test.py [--url http://127.0.0.1:8050] [--users 8] [--requests 200]
+        [--queries-from RECORDING.jsonl] [--timeout 60]
+"""
+
+import argparse
+import json
+import statistics
+import threading
+import time
+import urllib.error
+import urllib.request
+
+# Queries used unless --queries-from names a recording; most need the LLM
+DEFAULT_QUERIES = [
+    "promises about roads that are running late",
+    "what did the mayor promise for parks",
+    "late promises in Boston",
+    "water infrastructure projects due next year",
+    "completed school renovations",
+    "anything about public transport",
+    "housing promises that are not done yet",
+    "bike lanes or street lighting",
+]
+
+RESULT_OUTPUTS = [
+    ("results-cards-view", "style"),
+    ("results-table-view", "style"),
+    ("record-count-display", "children"),
+    ("results-pagination", "max_value"),
+    ("results-pagination", "active_page"),
+    ("results-pagination", "style"),
+    ("results-table", "page_current"),
+]
+
+
+def load_queries(path):
+    """Returns the distinct queries of a recording made with LLM_PROVIDER=record."""
+    queries = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                query = json.loads(line).get("query")
+            except json.JSONDecodeError:
+                continue
+            if query and query not in queries:
+                queries.append(query)
+    return queries
+
+
+def post_callback(url, payload, timeout):
+    """POSTs one callback request and returns the decoded response."""
+    request = urllib.request.Request(
+        url.rstrip("/") + "/_dash-update-component",
+        data=json.dumps(payload).encode("utf-8"),
+        headers={"Content-Type": "application/json"},
+    )
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        return json.loads(response.read() or b"{}")
+
+
+def run_query(url, query, n_clicks, timeout):
+    """
+    Runs a query like a click on "Show Results".
+
+    Returns:
+        str: "answered", "unavailable" (the LLM could not be reached),
+        "unplanned" (its answer could not be used) or "empty".
+    """
+    response = post_callback(
+        url,
+        {
+            "output": "query-result-store.data",
+            "outputs": {"id": "query-result-store", "property": "data"},
+            "inputs": [{"id": "show-results-button", "property": "n_clicks", "value": n_clicks}],
+            "changedPropIds": ["show-results-button.n_clicks"],
+            "state": [{"id": "query-input", "property": "value", "value": query}],
+        },
+        timeout,
+    )
+    query_ref = response.get("response", {}).get("query-result-store", {}).get("data")
+    if not query_ref:
+        return "empty"
+
+    response = post_callback(
+        url,
+        {
+            "output": ".." + "...".join(f"{id}.{prop}" for id, prop in RESULT_OUTPUTS) + "..",
+            "outputs": [{"id": id, "property": prop} for id, prop in RESULT_OUTPUTS],
+            "inputs": [
+                {"id": "query-result-store", "property": "data", "value": query_ref},
+                {"id": "results-tabs", "property": "active_tab", "value": "cards-tab"},
+            ],
+            "changedPropIds": ["query-result-store.data"],
+        },
+        timeout,
+    )
+    message = response.get("response", {}).get("record-count-display", {}).get("children", "")
+    if "matched" in str(message):
+        return "answered"
+    if "could not be turned into filters" in str(message):
+        return "unplanned"
+    return "unavailable" if message else "empty"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://127.0.0.1:8050")
+    parser.add_argument("--users", type=int, default=8, help="concurrent simulated users")
+    parser.add_argument("--requests", type=int, default=200, help="queries to send in total")
+    parser.add_argument("--queries-from", help="a JSONL recording whose queries are sent in turn")
+    parser.add_argument("--timeout", type=float, default=60.0)
+    args = parser.parse_args()
+
+    queries = load_queries(args.queries_from) if args.queries_from else DEFAULT_QUERIES
+    if not queries:
+        parser.error(f"no queries in {args.queries_from}")
+
+    lock = threading.Lock()
+    next_request = [0]
+    latencies = []
+    outcomes = {"answered": 0, "unavailable": 0, "unplanned": 0, "empty": 0, "failed": 0}
+
+    def user():
+        while True:
+            with lock:
+                number = next_request[0]
+                if number >= args.requests:
+                    return
+                next_request[0] += 1
+            start = time.perf_counter()
+            try:
+                outcome = run_query(args.url, queries[number % len(queries)], number + 1, args.timeout)
+            except (OSError, urllib.error.URLError, ValueError) as e:
+                print(f"Error sending query {number}: {e}")
+                outcome = "failed"
+            with lock:
+                latencies.append(time.perf_counter() - start)
+                outcomes[outcome] += 1
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=user) for _ in range(args.users)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+
+    def percentile(share):
+        return latencies[min(len(latencies) - 1, int(len(latencies) * share))] * 1000
+
+    print(f"{args.requests} queries ({len(queries)} distinct) from {args.users} users in {elapsed:.1f}s: "
+          f"{args.requests / elapsed:.1f} queries/s")
+    print(f"latency ms: p50 {statistics.median(latencies) * 1000:.0f}  p90 {percentile(0.90):.0f}  "
+          f"p99 {percentile(0.99):.0f}  max {latencies[-1] * 1000:.0f}")
+    print("outcomes: " + ", ".join(f"{name} {count}" for name, count in outcomes.items()))
+
+
+if __name__ == "__main__":
+    main()
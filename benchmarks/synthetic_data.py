@@ -0,0 +1,178 @@
+"""
+Generates synthetic promise datasets with the schema of promises.csv.
+
+The data is shaped like the real thing rather than uniform noise: a few
+large cities hold most promises (Zipf-distributed), Roads, Water and Power
+dominate the categories, descriptions are built from per-category phrases
+and places, and promises cluster on a limited number of sites around
+each city centre, so many of them share exact coordinates. Statuses follow
+the due dates: promises due before REFERENCE_DATE are late or on time, later
+ones mostly due. The output is deterministic for a given seed.
+
+generate_promises returns the typed DataFrame produced by data_loader (for
+benchmarks that skip CSV parsing); write_promises_csv writes a CSV the app
+can load instead of promises.csv.
+
+Usage:
+    python benchmarks/synthetic_data.py --rows 100000 --out cache/promises_100k.csv [--seed 0]
+        [--cities 48] [--locations 1920]
+"""
+
+import argparse
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+from config import DATA_DATE_FORMAT  # noqa: E402
+from data_loader import PROMISE_SCHEMA  # noqa: E402
+
+# City centres, largest first; further cities are placed at random
+CITIES = [
+    ("New York", 40.7128, -74.0060), ("Los Angeles", 34.0522, -118.2437), ("Chicago", 41.8781, -87.6298),
+    ("Houston", 29.7604, -95.3698), ("Phoenix", 33.4484, -112.0740), ("Philadelphia", 39.9526, -75.1652),
+    ("San Antonio", 29.4241, -98.4936), ("San Diego", 32.7157, -117.1611), ("Dallas", 32.7767, -96.7970),
+    ("Austin", 30.2672, -97.7431), ("Jacksonville", 30.3322, -81.6557), ("Columbus", 39.9612, -82.9988),
+    ("Charlotte", 35.2271, -80.8431), ("Indianapolis", 39.7684, -86.1581), ("Seattle", 47.6062, -122.3321),
+    ("Denver", 39.7392, -104.9903), ("Boston", 42.3601, -71.0589), ("Nashville", 36.1627, -86.7816),
+    ("Detroit", 42.3314, -83.0458), ("Portland", 45.5152, -122.6784), ("Las Vegas", 36.1699, -115.1398),
+    ("Louisville", 38.2527, -85.7585), ("Baltimore", 39.2904, -76.6122), ("Milwaukee", 43.0389, -87.9065),
+    ("Albuquerque", 35.0844, -106.6504), ("Atlanta", 33.7490, -84.3880), ("Omaha", 41.2565, -95.9345),
+    ("Miami", 25.7617, -80.1918), ("Minneapolis", 44.9778, -93.2650), ("New Orleans", 29.9511, -90.0715),
+    ("Wichita", 37.6872, -97.3301), ("St. Louis", 38.6270, -90.1994), ("Newark", 40.7357, -74.1724),
+    ("Salt Lake City", 40.7608, -111.8910), ("Richmond", 37.5407, -77.4360), ("Des Moines", 41.5868, -93.6250),
+    ("Boise", 43.6150, -116.2023), ("Providence", 41.8240, -71.4128), ("Jackson", 32.2988, -90.1848),
+    ("Charleston", 32.7765, -79.9311), ("Honolulu", 21.3069, -157.8583), ("Sioux Falls", 43.5446, -96.7311),
+    ("Manchester", 42.9956, -71.4548), ("Fargo", 46.8772, -96.7898), ("Billings", 45.7833, -108.5007),
+    ("Burlington", 44.4759, -73.2121), ("Wilmington", 39.7391, -75.5398), ("Cheyenne", 41.1400, -104.8202),
+]
+
+# Category -> (share of promises, description phrases)
+CATEGORIES = {
+    "Roads": (0.30, ["Fix potholes", "Repave", "Repair the bridge", "Add bike lanes", "Widen sidewalks",
+                     "Install crosswalks", "Resurface the road", "Replace guardrails"]),
+    "Water": (0.25, ["Replace lead pipes", "Repair the water main", "Restore water pressure",
+                     "Upgrade storm drains", "Fix sewer overflows", "Clean the reservoir inlet"]),
+    "Power": (0.22, ["Repair streetlights", "Upgrade traffic signals", "Bury power lines",
+                     "Install solar lighting", "Replace the substation transformer"]),
+    "Parks": (0.10, ["Renovate the playground", "Plant street trees", "Ensure park lighting is operational",
+                     "Rebuild the community pool"]),
+    "Transit": (0.08, ["Add bus shelters", "Extend the bus line", "Repair the light rail platform"]),
+    "Housing": (0.05, ["Build affordable housing", "Renovate public housing", "Open a shelter"]),
+}
+
+PLACES = [
+    "on Main St", "on 5th Ave", "on Oak St", "on Park Ave", "on Elm St", "on 2nd St", "on Maple Ave",
+    "on Washington Blvd", "on Lake Shore Dr", "on Broadway", "on Market St", "on Commonwealth Ave",
+    "on Harbor Rd", "on Pine St", "on Riverside Dr", "downtown", "along the waterfront",
+    "on the east side", "in the university district", "near City Hall",
+]
+
+# Promises due before this date are late or on time; later ones are mostly due
+REFERENCE_DATE = pd.Timestamp("2025-10-01")
+DUE_DATE_RANGE = (pd.Timestamp("2023-01-01"), pd.Timestamp("2027-12-31"))
+
+
+def _zipf_weights(n, exponent=1.1):
+    weights = 1.0 / np.arange(1, n + 1) ** exponent
+    return weights / weights.sum()
+
+
+def _cities(n_cities, rng):
+    """Returns (names, latitudes, longitudes) of n_cities cities, the listed ones first."""
+    cities = list(CITIES[:n_cities])
+    for number in range(len(cities), n_cities):
+        cities.append((f"City {number}", rng.uniform(25.0, 48.0), rng.uniform(-123.0, -71.0)))
+    names, lat, lon = zip(*cities)
+    return np.array(names, dtype=object), np.array(lat), np.array(lon)
+
+
+def generate_promises(n_rows, seed=0, n_cities=len(CITIES), n_locations=None):
+    """
+    Builds n_rows synthetic promises with the dtypes produced by data_loader.
+
+    Args:
+        n_rows (int): Number of promises.
+        seed (int): Random seed; the same seed gives the same data.
+        n_cities (int): Number of distinct cities (beyond the listed ones, "City N" at random places).
+        n_locations (int, optional): Distinct coordinates across all cities (default 40 per city).
+
+    Returns:
+        pd.DataFrame: The promises, with the columns and dtypes of PROMISE_SCHEMA and a datetime due_date.
+    """
+    rng = np.random.default_rng(seed)
+    names, city_lat, city_lon = _cities(n_cities, rng)
+    sites_per_city = max(1, (n_locations or 40 * n_cities) // n_cities)
+
+    city = rng.choice(n_cities, n_rows, p=_zipf_weights(n_cities))
+    # Sites lie within a few kilometres of the centre; a promise sits on one of its city's sites
+    site_lat = city_lat[:, None] + rng.normal(0.0, 0.04, (n_cities, sites_per_city))
+    site_lon = city_lon[:, None] + rng.normal(0.0, 0.05, (n_cities, sites_per_city))
+    site = rng.integers(0, sites_per_city, n_rows)
+
+    category_names = list(CATEGORIES)
+    shares = np.array([CATEGORIES[name][0] for name in category_names])
+    category = rng.choice(len(category_names), n_rows, p=shares / shares.sum())
+    phrase = np.empty(n_rows, dtype=object)
+    for number, name in enumerate(category_names):
+        mask = category == number
+        phrase[mask] = rng.choice(np.array(CATEGORIES[name][1], dtype=object), mask.sum())
+    description = phrase + " " + rng.choice(np.array(PLACES, dtype=object), n_rows)
+
+    start, end = DUE_DATE_RANGE
+    due_date = start + pd.to_timedelta(rng.integers(0, (end - start).days + 1, n_rows), unit="D")
+    past = np.asarray(due_date < REFERENCE_DATE)
+    roll = rng.random(n_rows)
+    status = np.where(past, np.where(roll < 0.55, "late", "on-time"), np.where(roll < 0.85, "due", "on-time"))
+
+    data_df = pd.DataFrame(
+        {
+            "city": names[city],
+            "promise_id": np.char.add("P", np.char.zfill(np.arange(1, n_rows + 1).astype(str), 7)),
+            "promise_description": description,
+            "due_date": due_date,
+            "status": status,
+            "latitude": site_lat[city, site].round(4),
+            "longitude": site_lon[city, site].round(4),
+            "category": np.array(category_names, dtype=object)[category],
+        }
+    )
+    return data_df.astype({column: dtype for column, dtype in PROMISE_SCHEMA.items() if dtype is not None})
+
+
+def write_promises_csv(path, n_rows, seed=0, **kwargs):
+    """
+    Writes synthetic promises as a CSV in the format of promises.csv.
+
+    Args:
+        path (str): The destination file.
+        n_rows (int): Number of promises.
+        seed (int): Random seed.
+        **kwargs: Passed on to generate_promises.
+
+    Returns:
+        str: The path of the written file.
+    """
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    generate_promises(n_rows, seed, **kwargs).to_csv(path, index=False, date_format=DATA_DATE_FORMAT)
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, required=True)
+    parser.add_argument("--out", required=True)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--cities", type=int, default=len(CITIES))
+    parser.add_argument("--locations", type=int, default=None, help="Distinct coordinates (default 40 per city)")
+    args = parser.parse_args()
+
+    write_promises_csv(args.out, args.rows, args.seed, n_cities=args.cities, n_locations=args.locations)
+    print(f"Wrote {args.rows} promises to {args.out} ({os.path.getsize(args.out) / 1e6:.1f} MB)")
+
+
+if __name__ == "__main__":
+    main()
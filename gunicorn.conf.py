@@ -0,0 +1,75 @@
+"""
+Gunicorn configuration for the City Promise Tracker.
+
+The app is imported once in the master (preload_app), so the promise data, its
+indexes and the prerendered map are built once and shared with every worker
+through copy-on-write pages instead of being loaded by each worker. gc.freeze()
+moves everything created during the import into the collector's permanent
+generation before forking, so garbage collection in the workers does not write
+to (and thereby copy) the shared pages.
+
+Each worker serves requests on several threads (gthread), so a query waiting
+on Gemini holds one thread rather than the whole worker.
+
+Only the data loaded at startup is shared. When promises.csv changes, every
+worker reloads it on its own (dataset.DatasetHolder): one of them rebuilds
+the Feather snapshot and the others memory-map it, so the CSV is parsed once
+and the text columns stay in the shared page cache, but each worker keeps a
+private copy of the other columns, the indexes and the KPIs. Restart the
+server after large data changes to return to a single shared copy.
+
+The metric hooks keep /metrics covering every worker: the shared metrics
+directory is emptied at startup, and the counts of a worker that exits are
+kept in its archive.
+
+Settings can be overridden with GUNICORN_* environment variables; command line
+flags (e.g. -b :$PORT on App Engine) take precedence over this file.
+"""
+
+import gc
+import os
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# The app modules import each other as top-level modules (from config import ...)
+pythonpath = os.path.join(APP_DIR, "src")
+
+bind = os.environ.get("GUNICORN_BIND", "0.0.0.0:8050")
+workers = int(os.environ.get("GUNICORN_WORKERS", os.environ.get("WEB_CONCURRENCY", "4")))
+threads = int(os.environ.get("GUNICORN_THREADS", "4"))
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", "120"))
+preload_app = os.environ.get("GUNICORN_PRELOAD", "1") != "0"
+
+
+def on_starting(server):
+    from metrics import metrics
+
+    # Counters start from zero with every start of the server
+    metrics.reset()
+
+
+def pre_fork(server, worker):
+    if preload_app:
+        gc.collect()
+        gc.freeze()
+
+
+def post_worker_init(worker):
+    # Imported here because pythonpath is only applied once the app is loaded
+    from memory_stats import format_memory, process_memory
+
+    worker.log.info("Worker %s memory: %s", worker.pid, format_memory(process_memory()))
+
+
+def worker_exit(server, worker):
+    from metrics import metrics
+
+    # Runs in the exiting worker: the counts since its last snapshot are kept
+    metrics.write_snapshot()
+
+
+def child_exit(server, worker):
+    from metrics import metrics
+
+    # Runs in the master, which folds the worker's counts into the archive
+    metrics.mark_process_dead(worker.pid)
@@ -2,61 +2,133 @@
 Main application file for the City Promise Tracker.
 """
 
-import dash
-import pandas as pd
-import dash_bootstrap_components as dbc
+# The timer is started first so the report covers every import below
+from startup import startup_timer, register_startup_routes
+
+with startup_timer.stage("import dash"):
+    import dash
+    import dash_bootstrap_components as dbc
 import os
+import uuid
 from dotenv import load_dotenv
-from layout import create_layout
-from callbacks import register_callbacks
+from config import METRICS_ENABLED, REPORTS_DIR
+
+with startup_timer.stage("import data modules"):
+    from dataset import DatasetHolder
+with startup_timer.stage("import layout and callbacks"):
+    from layout import create_layout
+    from callbacks import register_callbacks
+import llm
+with startup_timer.stage("import caches and routes"):
+    from map_cache import map_cache
+    from pagination import table_view_cache
+    from report_store import report_store, register_report_routes
+    from export import register_export_routes
+    from memory_stats import register_memory_routes
+    from metrics import metrics, register_metrics_routes
+    from query_parser import get_plan_source_stats
+    from query_history import query_history
 
 # Load environment variables from .env file
 load_dotenv()
 
 # --- Data Loading ---
-try:
-    # Create reports directory if it doesn't exist
-    os.makedirs("reports", exist_ok=True)
-
-    # Load promise data from CSV (located in parent directory)
-    csv_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), "promises.csv")
-    df = pd.read_csv(csv_path)
-    df["due_date"] = pd.to_datetime(df["due_date"])
-except FileNotFoundError:
-    print(
-        "Error: promises.csv not found. Make sure the file is in the correct directory."
-    )
-    df = pd.DataFrame()  # Create empty dataframe to avoid further errors
-except Exception as e:
-    print(f"An error occurred while loading data: {e}")
-    df = pd.DataFrame()
+# Create reports directory if it doesn't exist
+os.makedirs(REPORTS_DIR, exist_ok=True)
+
+# Promise data from CSV (located in parent directory). The holder reloads it in
+# the background when the file changes and swaps the new version in atomically.
+csv_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), "promises.csv")
+dataset = DatasetHolder(csv_path)
+
+
+# --- Map Cache ---
+# Render the persistent map document and the unfiltered markers once per data version
+def refresh_map_cache(new, old):
+    map_cache.clear()
+    map_cache.prerender(new.df, new.version)
+
+
+dataset.on_swap(refresh_map_cache)
+with startup_timer.stage("load data and prerender map"):
+    dataset.load()
+
+# --- Report Store ---
+# Trim reports that outlived REPORT_STORE_MAX_AGE_SECONDS or overflow REPORT_STORE_MAX_BYTES
+with startup_timer.stage("evict reports"):
+    report_store.evict()
+
+# --- Plan Cache ---
+# Drop shared plans produced by a previous model or prompt version
+with startup_timer.stage("invalidate stale plans"):
+    llm.invalidate_plan_cache(stale_only=True)
+
+# --- Query History ---
+# Drop server-side histories of sessions idle for longer than QUERY_HISTORY_TTL_SECONDS
+if query_history.enabled:
+    with startup_timer.stage("prune query history"):
+        query_history.prune()
+
+# --- LLM ---
+# Without an API key the app runs without Gemini; only locally parsed and cached queries work
+if not llm.is_available():
+    print("GEMINI_API_KEY is not set; running without the LLM (only simple queries are supported).")
 
 # --- Initialize the Dash app ---
-app = dash.Dash(
-    __name__, external_stylesheets=[dbc.themes.BOOTSTRAP, dbc.icons.FONT_AWESOME]
-)
-app.title = "City Promise Tracker"
-server = app.server
-
-# --- KPI Calculations ---
-try:
-    if not df.empty:
-        total_promises = len(df)
-        late_promises = len(df[df["status"] == "late"])
-        due_promises = len(df[df["status"] == "due"])
-        on_time_promises = len(df[df["status"] == "on-time"])
-    else:
-        total_promises = late_promises = due_promises = on_time_promises = 0
-except Exception as e:
-    print(f"Error calculating KPIs: {e}")
-    total_promises = late_promises = due_promises = on_time_promises = "Error"
+with startup_timer.stage("create app"):
+    app = dash.Dash(
+        __name__, external_stylesheets=[dbc.themes.BOOTSTRAP, dbc.icons.FONT_AWESOME]
+    )
+    app.title = "City Promise Tracker"
+    server = app.server
+
+# --- Metrics ---
+# Registered first so request timings include the other request hooks
+if METRICS_ENABLED:
+    register_metrics_routes(server)
+    metrics.register_stats("plan_cache", "Query plan cache counter", llm.get_plan_cache_stats)
+    metrics.register_stats("result_cache", "Query result cache counter", lambda: dataset.current.engine.stats())
+    metrics.register_stats("map_cache", "Map marker cache counter", map_cache.stats)
+    metrics.register_stats("table_view_cache", "Tabular View order cache counter", table_view_cache.stats)
+    metrics.register_stats("plan_sources", "Queries planned per source", get_plan_source_stats)
+    metrics.register_stats("llm", "LLM call counter", llm.get_llm_call_stats)
+    metrics.register_stats("query_history", "Server-side query history counter", query_history.stats)
+
+# Polls promises.csv for changes (at most every DATA_RELOAD_INTERVAL_SECONDS)
+server.before_request(dataset.poll)
+server.before_request(startup_timer.mark_first_request)
+
 
 # --- App Layout and Callbacks ---
-app.layout = create_layout(
-    total_promises, late_promises, due_promises, on_time_promises
-)
-register_callbacks(app, df)
+def serve_layout():
+    """
+    Builds the layout on every page load, so the KPIs reflect the current data.
+    A new tab also gets the session id of its server-side query history.
+    """
+    kpis = dataset.current.kpis
+    return create_layout(
+        kpis["total"],
+        kpis["late"],
+        kpis["due"],
+        kpis["on_time"],
+        map_cache.live_map(),
+        session_id=uuid.uuid4().hex,
+    )
+
+
+with startup_timer.stage("register callbacks and routes"):
+    app.layout = serve_layout
+    register_callbacks(app, dataset)
+    register_report_routes(server, report_store)
+    register_export_routes(server, dataset)
+    register_memory_routes(server)
+    register_startup_routes(server, startup_timer)
+
+startup_timer.ready()
+print(startup_timer.format())
 
 # --- Main Execution Block ---
 if __name__ == "__main__":
+    # gunicorn.conf.py does this for the gunicorn master
+    metrics.reset()
     app.run(debug=False)
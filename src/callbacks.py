@@ -3,53 +3,156 @@ This module contains the callback functions for the City Promise Tracker app.
 """
 
 from dash.dependencies import Input, Output, State
-from dash import html, dcc
+from dash import MATCH, Patch, html, callback_context, no_update
 import dash_bootstrap_components as dbc
 from datetime import datetime
-import markdown2
-import os
-from utils import create_map, get_status_badge, filter_dataframe_from_query
-from report_templates import REPORT_CSS, REPORT_SEARCH_SCRIPT
+import numpy as np
+from config import QUERY_HISTORY_MAX_ENTRIES, RESULTS_PAGE_SIZE, TABLE_COLUMNS
+from utils import get_status_badge
+from map_cache import map_cache
+from metrics import instrument_callback, stage
+from query_history import query_history, make_entry, history_element
+from pagination import (
+    page_count,
+    page_bounds,
+    column_page,
+    table_records,
+    table_view_cache,
+)
+from report_store import report_store, report_key, report_url
 
-def register_callbacks(app, df):
+# Shown for queries the local parser cannot answer while the LLM is not
+# configured (no GEMINI_API_KEY), too slow or failing
+LLM_UNAVAILABLE_MESSAGE = (
+    "This query needs the language model, which is not configured or not responding right now. "
+    "Simple queries naming a status, city, category or due date still work."
+)
+
+# Shown when the LLM answered but its answer could not be turned into filters
+LLM_INVALID_MESSAGE = (
+    "This query could not be turned into filters. "
+    "Try rephrasing it, e.g. naming a status, city, category or due date."
+)
+
+def register_callbacks(app, dataset):
     """
     Registers all the callbacks for the application.
 
+    Each callback reads dataset.current once and uses that version throughout,
+    so a reload swapping in new data mid-request does not mix versions.
+
     Args:
         app (dash.Dash): The Dash application instance.
-        df (pd.DataFrame): The DataFrame containing the promise data.
+        dataset (DatasetHolder): Holds the current promise data, its indexes and query engine.
     """
 
+    def load_result(query_ref, data):
+        """Returns the shared QueryResult referenced by a query-result-store value."""
+        return data.engine.get(query_ref["result_id"], query_ref["query"])
+
     @app.callback(
-        [Output("results-content", "children"),
-         Output("record-count-display", "children")],
-        [Input("show-results-button", "n_clicks"), Input("results-tabs", "active_tab")],
-        [State("query-input", "value")],
+        Output("query-result-store", "data"),
+        Input("show-results-button", "n_clicks"),
+        State("query-input", "value"),
     )
-    def update_results_content(n_clicks, active_tab, query):
-        """Renders the content for the active results tab and updates record count."""
+    @instrument_callback
+    def run_query(n_clicks, query):
+        """Resolves the query once per click and stores a reference to the shared result."""
         try:
-            if n_clicks == 0 or df.empty:
-                return html.P("Enter a query and click 'Show Results'."), ""
+            data = dataset.current
+            if n_clicks == 0 or data.df.empty:
+                return None
 
-            filtered_df = filter_dataframe_from_query(df, query)
-            record_count = len(filtered_df)
+            result = data.engine.execute(query)
+            # n_clicks is kept so repeating the same query still refreshes the outputs
+            return {"result_id": result.result_id, "query": query, "n_clicks": n_clicks}
+        except Exception as e:
+            print(f"Error running query: {e}")
+            return None
 
-            if filtered_df.empty:
-                return html.P("No results found for your query."), "No records matched your search criteria."
+    @app.callback(
+        [
+            Output("results-cards-view", "style"),
+            Output("results-table-view", "style"),
+            Output("record-count-display", "children"),
+            Output("results-pagination", "max_value"),
+            Output("results-pagination", "active_page"),
+            Output("results-pagination", "style"),
+            Output("results-table", "page_current"),
+        ],
+        [Input("query-result-store", "data"), Input("results-tabs", "active_tab")],
+    )
+    @instrument_callback
+    def update_results_content(query_ref, active_tab):
+        """Switches between the paged results views and updates the record count."""
+        shown, hidden = {}, {"display": "none"}
+        try:
+            data = dataset.current
+            if not query_ref or data.df.empty:
+                return shown, hidden, "", 1, 1, hidden, 0
+
+            result = load_result(query_ref, data)
+            if result.plan_source == "unavailable":
+                return shown, hidden, LLM_UNAVAILABLE_MESSAGE, 1, 1, hidden, 0
+            if result.plan_source == "invalid":
+                return shown, hidden, LLM_INVALID_MESSAGE, 1, 1, hidden, 0
+
+            record_count = len(result.df)
+            if record_count == 0:
+                return shown, hidden, "No records matched your search criteria.", 1, 1, hidden, 0
 
             record_count_message = f"{record_count} records matched your search criteria."
+            pages = page_count(record_count, RESULTS_PAGE_SIZE)
+            pagination_style = shown if pages > 1 else hidden
+
+            # Switching tabs keeps the current pages; a new query starts again from the first page
+            if callback_context.triggered_id == "results-tabs":
+                active_page, page_current = no_update, no_update
+            else:
+                active_page, page_current = 1, 0
+
+            if active_tab == "tabular-tab":
+                return hidden, shown, record_count_message, pages, active_page, hidden, page_current
+            return shown, hidden, record_count_message, pages, active_page, pagination_style, page_current
+        except Exception as e:
+            print(f"Error updating results content: {e}")
+            return shown, hidden, "", 1, 1, hidden, 0
+
+    @app.callback(
+        Output("results-cards", "children"),
+        [Input("query-result-store", "data"), Input("results-pagination", "active_page")],
+    )
+    @instrument_callback
+    def update_results_cards(query_ref, active_page):
+        """Renders the cards for the current page of the Results tab."""
+        try:
+            data = dataset.current
+            if not query_ref or data.df.empty:
+                return html.P("Enter a query and click 'Show Results'.")
+
+            filtered_df = load_result(query_ref, data).df
+            if filtered_df.empty:
+                return html.P("No results found for your query.")
+
+            with stage("results_render"):
+                start, stop = page_bounds(len(filtered_df), (active_page or 1) - 1, RESULTS_PAGE_SIZE)
+                page = column_page(
+                    filtered_df,
+                    np.arange(start, stop),
+                    ["city", "category", "promise_description", "due_date", "status"],
+                )
 
-            if active_tab == "results-tab":
                 results_children = []
-                for _, row in filtered_df.iterrows():
+                for city, category, description, due_date, status in zip(
+                    page["city"], page["category"], page["promise_description"], page["due_date"], page["status"]
+                ):
                     results_children.append(
                         html.Div(
                             [
-                                html.H5(f"{row['city']} - {row['category']}"),
-                                html.P(f"Promise: {row['promise_description']}"),
-                                html.P(f"Due: {row['due_date'].strftime('%Y-%m-%d')}"),
-                                html.Div(["Status: ", get_status_badge(row["status"])]),
+                                html.H5(f"{city} - {category}"),
+                                html.P(f"Promise: {description}"),
+                                html.P(f"Due: {due_date}"),
+                                html.Div(["Status: ", get_status_badge(status)]),
                             ],
                             style={
                                 "border": "1px solid #ddd",
@@ -59,173 +162,269 @@ def register_callbacks(app, df):
                             },
                         )
                     )
-                return results_children, record_count_message
-            
-            elif active_tab == "tabular-tab":
-                desired_columns = ["city", "promise_description", "category", "due_date", "status"]
-                
-                # Ensure all desired columns exist in the filtered_df
-                # If not, handle the error or skip missing columns
-                existing_desired_columns = [col for col in desired_columns if col in filtered_df.columns]
-
-                table_header = [
-                    html.Thead(html.Tr([html.Th(col.replace('_', ' ').title()) for col in existing_desired_columns]))
-                ]
-                table_body = [
-                    html.Tbody(
-                        [
-                            html.Tr(
-                                [html.Td(filtered_df.iloc[i][col]) for col in existing_desired_columns]
-                            )
-                            for i in range(len(filtered_df))
-                        ]
-                    )
-                ]
-                return dbc.Table(table_header + table_body, bordered=True, striped=True, hover=True), record_count_message
+            return results_children
+        except Exception as e:
+            print(f"Error updating results cards: {e}")
+            return html.P("An error occurred while updating results.")
 
-            return html.P("Select a tab."), record_count_message
+    @app.callback(
+        [
+            Output("results-table", "data"),
+            Output("results-table", "page_count"),
+            Output("results-table-info", "children"),
+        ],
+        [
+            Input("query-result-store", "data"),
+            Input("results-tabs", "active_tab"),
+            Input("results-table", "page_current"),
+            Input("results-table", "page_size"),
+            Input("results-table", "sort_by"),
+            Input("results-table", "filter_query"),
+        ],
+    )
+    @instrument_callback
+    def update_results_table(query_ref, active_tab, page_current, page_size, sort_by, filter_query):
+        """Serves one page of the Tabular View, sorted and filtered on the server."""
+        try:
+            if active_tab != "tabular-tab":
+                return no_update, no_update, no_update
+            data = dataset.current
+            if not query_ref or data.df.empty:
+                return [], 1, ""
+
+            result = load_result(query_ref, data)
+            total = len(result.df)
+            if total == 0:
+                return [], 1, ""
+
+            with stage("results_render"):
+                # Sorted and filtered (by the column filters typed into the table header) once per view
+                order = table_view_cache.positions(result, data.version, sort_by, filter_query)
+                start, stop = page_bounds(len(order), page_current, page_size)
+                records = table_records(column_page(result.df, order[start:stop], TABLE_COLUMNS))
+
+            if len(order) == 0:
+                info = f"No rows match the column filters ({total} records in total)."
+            elif filter_query:
+                info = f"Showing rows {start + 1}-{stop} of {len(order)} (filtered from {total})."
+            else:
+                info = f"Showing rows {start + 1}-{stop} of {total}."
+            return records, page_count(len(order), page_size), info
+        except ValueError as e:
+            return [], 1, f"Invalid column filter: {e}"
         except Exception as e:
-            print(f"Error updating results content: {e}")
-            return html.P("An error occurred while updating results."), ""
+            print(f"Error updating results table: {e}")
+            return [], 1, "An error occurred while updating the table."
 
     @app.callback(
         [
-            Output("map", "srcDoc"),
+            Output("map-markers-store", "data"),
             Output("download-button", "disabled"),
-            Output("chat-history-store", "data"),
+            Output("chat-history-count", "data"),
+            Output("chat-history-output", "children"),
         ],
-        [Input("show-results-button", "n_clicks")],
-        [State("query-input", "value"), State("chat-history-store", "data")],
+        [Input("query-result-store", "data")],
+        [State("chat-history-count", "data"), State("history-session-id", "data")],
     )
-    def update_map_and_history(n_clicks, query, chat_history):
-        """Updates the map, download button, and chat history."""
+    @instrument_callback
+    def update_map_and_history(query_ref, history_count, session_id):
+        """
+        Updates the map markers, download button, and chat history.
+
+        The history is patched rather than returned: only the new entry is sent,
+        and the oldest one is dropped once QUERY_HISTORY_MAX_ENTRIES is reached.
+        """
+        history = (no_update, no_update)
         try:
-            if n_clicks == 0 or df.empty:
-                return create_map(df), True, []
+            data = dataset.current
+            if not query_ref or data.df.empty:
+                return (map_cache.get_markers(data.df, data.version), True) + history
 
-            # Update chat history
+            query = query_ref["query"]
             if query:
-                timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                chat_history.append({"query": query, "timestamp": timestamp})
+                history = add_to_history(query, history_count or 0, session_id)
 
-            filtered_df = filter_dataframe_from_query(df, query)
-            map_html = create_map(filtered_df)
-            download_disabled = filtered_df.empty
+            result = load_result(query_ref, data)
+            markers = map_cache.get_markers(result.df, data.version, result.plan)
+            download_disabled = result.df.empty
 
-            return map_html, download_disabled, chat_history
+            return (markers, download_disabled) + history
         except Exception as e:
             print(f"Error updating map and history: {e}")
-            return create_map(df), True, chat_history
+            data = dataset.current
+            return (map_cache.get_markers(data.df, data.version), True) + history
+
+    def add_to_history(query, history_count, session_id):
+        """Returns the chat-history-count and chat-history-output updates for a new query."""
+        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        if query_history.enabled:
+            entry = query_history.add(session_id, query, timestamp)
+            if entry is None:
+                return no_update, no_update
+            count = no_update
+        else:
+            entry = make_entry(history_count, query, timestamp)
+            count = history_count + 1
+
+        # The display lists the newest entry first and holds one element per earlier entry
+        if entry["id"] == 0:
+            return count, [history_element(entry)]
+        display = Patch()
+        display.prepend(history_element(entry))
+        if entry["id"] >= QUERY_HISTORY_MAX_ENTRIES:
+            del display[-1]
+        return count, display
 
     @app.callback(
-        Output("chat-history-output", "children"),
-        Input("chat-history-store", "data"),
+        Output("chat-history-output", "children", allow_duplicate=True),
+        Input("history-session-id", "data"),
+        prevent_initial_call="initial_duplicate",
     )
-    def update_chat_history_display(chat_history):
-        """Updates the visible chat history log."""
+    @instrument_callback
+    def load_chat_history(session_id):
+        """Shows the server-side history of this tab when the page loads."""
         try:
-            if not chat_history:
-                return [html.P("No queries yet.", className="text-muted")]
-
-            history_elements = []
-            for entry in reversed(chat_history):
-                history_elements.append(
-                    html.Div(
-                        [
-                            html.P(f"• {entry['query']}", className="mb-0"),
-                            html.Span(
-                                entry["timestamp"],
-                                className="text-muted",
-                                style={"fontSize": "0.8em"},
-                            ),
-                        ],
-                        style={"marginBottom": "10px"},
-                    )
-                )
-            return history_elements
+            entries = query_history.entries(session_id) if query_history.enabled else []
+            if not entries:
+                return no_update
+            return [history_element(entry) for entry in reversed(entries)]
         except Exception as e:
-            print(f"Error updating chat history display: {e}")
-            return [html.P("An error occurred while updating chat history.")]
+            print(f"Error loading chat history: {e}")
+            return no_update
 
     @app.callback(
-        [Output("download-report", "data"), Output("alert-placeholder", "children")],
-        Input("download-button", "n_clicks"),
-        State("query-input", "value"),
+        [Output("query-input", "value"), Output("show-results-button", "n_clicks")],
+        Input({"type": "history-entry", "index": MATCH}, "n_clicks"),
+        [
+            State({"type": "history-entry", "index": MATCH}, "data-query"),
+            State("show-results-button", "n_clicks"),
+        ],
         prevent_initial_call=True,
     )
-    def generate_report(n_clicks, query):
-        """Generates and serves a professional HTML report with search functionality."""
-        try:
-            # Filter dataframe using the same LLM-powered function
-            filtered_df = filter_dataframe_from_query(df, query)
+    @instrument_callback
+    def rerun_history_query(entry_clicks, query, n_clicks):
+        """
+        Runs a query from the history again by clicking "Show Results" for it.
 
-            if filtered_df.empty:
-                return None, dbc.Alert(
-                    "No data to generate report for the given query.",
-                    color="warning",
-                    dismissable=True,
-                )
-
-            # --- Generate Markdown Content ---
-            md_content = ""
-            for _, row in filtered_df.iterrows():
-                md_content += f"<div class='report-item'>"
-                md_content += f"<h2>{row['city']} - {row['category']}</h2>"
-                md_content += f"<p><strong>Promise:</strong> {row['promise_description']}</p>"
-                md_content += (
-                    f"<p><strong>Due Date:</strong> {row['due_date'].strftime('%Y-%m-%d')}</p>"
-                )
-                md_content += f"<p><strong>Status:</strong> {row['status'].title()}</p>"
-                md_content += f"</div><hr>"
-
-            # --- Convert Markdown to HTML ---
-            html_content = markdown2.markdown(
-                md_content, extras=["tables", "fenced-code-blocks", "break-on-newline"]
-            )
+        MATCH sends only the clicked entry and its query, so the request does
+        not grow with the history, and entries added to it do not fire the
+        callback. The result is usually still in the query engine's result cache.
+        """
+        try:
+            if not entry_clicks or not query:
+                return no_update, no_update
+            return query, (n_clicks or 0) + 1
+        except Exception as e:
+            print(f"Error re-running history query: {e}")
+            return no_update, no_update
 
-            # --- Create Full HTML Document ---
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            report_date = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            filename = f"reports/city_promises_report_{timestamp}.html"
-
-            full_html = f"""
-            <!DOCTYPE html>
-            <html>
-            <head>
-                <title>City Promises Report</title>
-                {REPORT_CSS}
-                {REPORT_SEARCH_SCRIPT}
-            </head>
-            <body>
-                <div class="report-container">
-                    <div class="cover-page">
-                        <h1>City Promises Report</h1>
-                        <p>This report details the status of various city promises based on the query: '{query}'.</p>
-                        <p>Generated on: {report_date}</p>
-                    </div>
-                    <div class="report-content">
-                        <div class="search-bar">
-                            <input type="text" id="searchInput" onkeyup="searchReport()" placeholder="Search for promises, cities, or statuses...">
-                        </div>
-                        <div id="report-content-items">
-                            {html_content}
-                        </div>
-                    </div>
-                </div>
-            </body>
-            </html>
-            """
-
-            with open(filename, "w", encoding="utf-8") as f:
-                f.write(full_html)
+    # Hands the marker payload to the persistent map document, which updates its layers in place.
+    # If the iframe has not loaded yet, the document picks the payload up from window.promiseMapPayload.
+    app.clientside_callback(
+        """
+        function (payload) {
+            window.promiseMapPayload = payload;
+            var frame = document.getElementById("map");
+            if (frame && frame.contentWindow && frame.contentWindow.updatePromiseMarkers) {
+                frame.contentWindow.updatePromiseMarkers(payload);
+            }
+            return window.dash_clientside.no_update;
+        }
+        """,
+        Output("map-sync", "children"),
+        Input("map-markers-store", "data"),
+    )
 
+    def report_progress(key, status):
+        """Maps a report status to the download URL, alert, job id and poll switch outputs."""
+        if status["state"] == "done":
             alert_message = dbc.Alert(
-                f"Report '{os.path.basename(filename)}' generated successfully!",
+                [
+                    "Report generated successfully! ",
+                    html.A("Download again", href=report_url(key), className="alert-link"),
+                ],
                 color="success",
                 dismissable=True,
             )
+            return report_url(key), alert_message, None, True
+        if status["state"] == "running":
+            total = status.get("total") or 0
+            percent = int(100 * status.get("done", 0) / total) if total else 0
+            alert_message = dbc.Alert(
+                [
+                    html.P(f"Generating report for {total} promises...", className="mb-2"),
+                    dbc.Progress(value=percent, label=f"{percent}%", striped=True, animated=True),
+                ],
+                color="info",
+            )
+            return no_update, alert_message, key, False
+        return None, dbc.Alert("An error occurred while generating the report.", color="danger", dismissable=True), None, True
 
-            return dcc.send_file(filename), alert_message
+    @app.callback(
+        [
+            Output("report-download-url", "data"),
+            Output("alert-placeholder", "children"),
+            Output("report-job-store", "data"),
+            Output("report-progress-interval", "disabled"),
+        ],
+        [Input("download-button", "n_clicks"), Input("report-progress-interval", "n_intervals")],
+        [State("query-result-store", "data"), State("report-job-store", "data")],
+        prevent_initial_call=True,
+    )
+    @instrument_callback
+    def generate_report(n_clicks, n_intervals, query_ref, job_key):
+        """
+        Serves a professional HTML report with search functionality. Reports are
+        reused when the same plan was exported before; large ones are generated
+        in the background while this callback polls their progress.
+        """
+        try:
+            if callback_context.triggered_id == "report-progress-interval":
+                if not job_key:
+                    return no_update, no_update, None, True
+                return report_progress(job_key, report_store.status(job_key))
+
+            if not query_ref:
+                return None, dbc.Alert(
+                    "Run a query before downloading a report.",
+                    color="warning",
+                    dismissable=True,
+                ), None, True
+
+            # Reuse the result computed when the query was run
+            query = query_ref["query"]
+            data = dataset.current
+            result = load_result(query_ref, data)
+            filtered_df = result.df
+
+            if filtered_df.empty:
+                return None, dbc.Alert(
+                    "No data to generate report for the given query.",
+                    color="warning",
+                    dismissable=True,
+                ), None, True
+
+            key = report_key(result.plan, data.version, query)
+            return report_progress(key, report_store.request(key, filtered_df, query))
         except Exception as e:
             print(f"Error generating report: {e}")
-            return None, dbc.Alert("An error occurred while generating the report.", color="danger", dismissable=True)
+            return None, dbc.Alert("An error occurred while generating the report.", color="danger", dismissable=True), None, True
+
+    # Starts the browser download of a generated report; the file is streamed by the /reports route
+    app.clientside_callback(
+        """
+        function (url) {
+            if (url) {
+                var link = document.createElement("a");
+                link.href = url;
+                link.download = "";
+                document.body.appendChild(link);
+                link.click();
+                link.remove();
+            }
+            return window.dash_clientside.no_update;
+        }
+        """,
+        Output("report-download-sync", "children"),
+        Input("report-download-url", "data"),
+    )
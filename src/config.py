@@ -2,5 +2,185 @@
 Configuration file for the City Promise Tracker application.
 """
 
+import os
+
+# Root directory of the application (the directory containing promises.csv)
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
 # Define the Gemini model to be used for natural language queries
 GEMINI_MODEL = "models/gemini-pro-latest"
+
+# Version of the prompt sent to the LLM. Bump this whenever the prompt or the
+# response schema in llm_prompt changes so previously cached plans are discarded.
+PROMPT_VERSION = "3"
+
+# The prompt lists the values of status, city and category for columns with
+# at most this many distinct values.
+LLM_PROMPT_MAX_VALUES = int(os.environ.get("LLM_PROMPT_MAX_VALUES", "100"))
+
+# --- LLM Calls ---
+# Gemini requests run on a bounded thread pool: at most LLM_MAX_CONCURRENCY per
+# process, each abandoned after LLM_TIMEOUT_SECONDS (retries included). Transient
+# errors are retried up to LLM_MAX_ATTEMPTS times with jittered exponential
+# backoff. After LLM_BREAKER_FAILURES consecutive failures the circuit breaker
+# fails calls fast for LLM_BREAKER_RESET_SECONDS before probing again.
+LLM_TIMEOUT_SECONDS = float(os.environ.get("LLM_TIMEOUT_SECONDS", "15"))
+LLM_MAX_ATTEMPTS = int(os.environ.get("LLM_MAX_ATTEMPTS", "3"))
+LLM_BACKOFF_SECONDS = float(os.environ.get("LLM_BACKOFF_SECONDS", "0.5"))
+LLM_BACKOFF_MAX_SECONDS = float(os.environ.get("LLM_BACKOFF_MAX_SECONDS", "4"))
+LLM_MAX_CONCURRENCY = int(os.environ.get("LLM_MAX_CONCURRENCY", "4"))
+# How long a call waits for a free slot before failing fast
+LLM_QUEUE_TIMEOUT_SECONDS = float(os.environ.get("LLM_QUEUE_TIMEOUT_SECONDS", "1"))
+LLM_BREAKER_FAILURES = int(os.environ.get("LLM_BREAKER_FAILURES", "5"))
+LLM_BREAKER_RESET_SECONDS = float(os.environ.get("LLM_BREAKER_RESET_SECONDS", "30"))
+
+# Optional micro-batching: LLM queries arriving within LLM_BATCH_WINDOW_SECONDS
+# of each other are sent as one prompt (at most LLM_BATCH_MAX_SIZE queries)
+# that returns a JSON array of plans.
+LLM_BATCH_ENABLED = os.environ.get("LLM_BATCH_ENABLED", "0") != "0"
+LLM_BATCH_WINDOW_SECONDS = float(os.environ.get("LLM_BATCH_WINDOW_SECONDS", "0.05"))
+LLM_BATCH_MAX_SIZE = int(os.environ.get("LLM_BATCH_MAX_SIZE", "8"))
+
+# Send Gemini requests to another endpoint over REST, e.g. a local fake server
+# for testing (http://127.0.0.1:8089, see benchmarks/fake_llm_server.py).
+GEMINI_API_ENDPOINT = os.environ.get("GEMINI_API_ENDPOINT", "")
+
+# --- LLM Provider ---
+# "gemini" calls the Gemini API, "record" does the same and appends every
+# query and answer with its timing to LLM_RECORD_PATH, and "replay" answers
+# from such a recording (LLM_REPLAY_PATH) without network access or an API key.
+# Replayed requests take a delay sampled from the recorded wall times
+# (LLM_REPLAY_LATENCY=recorded), drawn from a log-normal distribution with the
+# given median and sigma (lognormal) or none at all (none); the given shares
+# of requests fail with a 503 error or time out.
+LLM_PROVIDER = os.environ.get("LLM_PROVIDER", "gemini")
+LLM_RECORD_PATH = os.environ.get(
+    "LLM_RECORD_PATH", os.path.join(APP_DIR, "cache", "llm_recording.jsonl")
+)
+LLM_REPLAY_PATH = os.environ.get("LLM_REPLAY_PATH", LLM_RECORD_PATH)
+LLM_REPLAY_LATENCY = os.environ.get("LLM_REPLAY_LATENCY", "recorded")
+LLM_REPLAY_LATENCY_MEDIAN_SECONDS = float(os.environ.get("LLM_REPLAY_LATENCY_MEDIAN_SECONDS", "1.5"))
+LLM_REPLAY_LATENCY_SIGMA = float(os.environ.get("LLM_REPLAY_LATENCY_SIGMA", "0.4"))
+LLM_REPLAY_ERROR_RATE = float(os.environ.get("LLM_REPLAY_ERROR_RATE", "0"))
+LLM_REPLAY_TIMEOUT_RATE = float(os.environ.get("LLM_REPLAY_TIMEOUT_RATE", "0"))
+
+# --- Query Plan Cache ---
+# Plans returned by the LLM are cached in memory (per worker) and in a SQLite
+# file shared by all gunicorn workers on the same instance.
+PLAN_CACHE_ENABLED = os.environ.get("PLAN_CACHE_ENABLED", "1") != "0"
+PLAN_CACHE_MAX_ENTRIES = int(os.environ.get("PLAN_CACHE_MAX_ENTRIES", "1024"))
+PLAN_CACHE_TTL_SECONDS = int(os.environ.get("PLAN_CACHE_TTL_SECONDS", str(24 * 60 * 60)))
+PLAN_CACHE_PATH = os.environ.get(
+    "PLAN_CACHE_PATH", os.path.join(APP_DIR, "cache", "plan_cache.sqlite3")
+)
+
+# --- Data Loading ---
+# promises.csv stores due dates as DD-MM-YYYY
+DATA_DATE_FORMAT = os.environ.get("DATA_DATE_FORMAT", "%d-%m-%Y")
+
+# The typed data is cached as a memory-mappable Feather snapshot (requires
+# pyarrow) and rebuilt only when the CSV's modification time and hash change.
+DATA_SNAPSHOT_ENABLED = os.environ.get("DATA_SNAPSHOT_ENABLED", "1") != "0"
+DATA_SNAPSHOT_DIR = os.environ.get("DATA_SNAPSHOT_DIR", os.path.join(APP_DIR, "cache"))
+
+# promises.csv is checked for changes at most this often (per worker, on
+# incoming requests); a changed file is reloaded in the background.
+DATA_RELOAD_ENABLED = os.environ.get("DATA_RELOAD_ENABLED", "1") != "0"
+DATA_RELOAD_INTERVAL_SECONDS = float(os.environ.get("DATA_RELOAD_INTERVAL_SECONDS", "5"))
+
+# --- Local Query Parser ---
+# Simple queries (status, city, category, date phrases) are parsed locally
+# and never reach Gemini. Set LOCAL_PARSER_ENABLED=0 to always use the LLM.
+LOCAL_PARSER_ENABLED = os.environ.get("LOCAL_PARSER_ENABLED", "1") != "0"
+
+# --- Query Results ---
+# Number of resolved query results (plan + filtered rows) each worker keeps so
+# the results, map and report callbacks can share one computation per click.
+QUERY_RESULT_CACHE_SIZE = int(os.environ.get("QUERY_RESULT_CACHE_SIZE", "64"))
+
+# --- Query Backend ---
+# "pandas" filters the in-memory DataFrame. "sqlite" translates plans into SQL
+# against a local SQLite copy of the data, fetched in pages of SQL_PAGE_SIZE
+# rows. Each data version is stored next to SQL_BACKEND_PATH as
+# <name>.<version>.sqlite3. "auto" uses SQLite from SQL_BACKEND_MIN_ROWS rows.
+QUERY_BACKEND = os.environ.get("QUERY_BACKEND", "pandas")
+SQL_BACKEND_MIN_ROWS = int(os.environ.get("SQL_BACKEND_MIN_ROWS", "5000000"))
+SQL_BACKEND_PATH = os.environ.get(
+    "SQL_BACKEND_PATH", os.path.join(APP_DIR, "cache", "promises.sqlite3")
+)
+SQL_PAGE_SIZE = int(os.environ.get("SQL_PAGE_SIZE", "5000"))
+
+# --- Results Views ---
+# Number of cards or table rows rendered per page in the results panel
+RESULTS_PAGE_SIZE = int(os.environ.get("RESULTS_PAGE_SIZE", "20"))
+
+# Number of sorted and filtered row orders of the Tabular View each worker
+# keeps, so paging through a table does not sort and filter it again
+TABLE_VIEW_CACHE_SIZE = int(os.environ.get("TABLE_VIEW_CACHE_SIZE", "16"))
+
+# Columns shown in the Tabular View
+TABLE_COLUMNS = ["city", "promise_description", "category", "due_date", "status"]
+
+# --- Map ---
+# Maximum number of promises listed in the popup of a shared location
+MAP_POPUP_MAX_ITEMS = int(os.environ.get("MAP_POPUP_MAX_ITEMS", "20"))
+
+# The rendered map document is saved here and reused on later starts, so
+# startup does not need to import folium. An empty value disables the file.
+MAP_DOCUMENT_CACHE_PATH = os.environ.get(
+    "MAP_DOCUMENT_CACHE_PATH", os.path.join(APP_DIR, "cache", "live_map.html")
+)
+
+# Upper bound on the rendered map HTML each worker keeps in memory
+MAP_CACHE_MAX_BYTES = int(os.environ.get("MAP_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+
+# --- Reports ---
+# Directory where generated reports are written
+REPORTS_DIR = os.environ.get("REPORTS_DIR", "reports")
+
+# Number of promises rendered per chunk when streaming a report
+REPORT_CHUNK_SIZE = int(os.environ.get("REPORT_CHUNK_SIZE", "2000"))
+
+# Generated reports are stored under a hash of the query plan and dataset version.
+# The store is trimmed to these limits, least recently used reports first.
+REPORT_STORE_MAX_BYTES = int(os.environ.get("REPORT_STORE_MAX_BYTES", str(512 * 1024 * 1024)))
+REPORT_STORE_MAX_AGE_SECONDS = int(os.environ.get("REPORT_STORE_MAX_AGE_SECONDS", str(7 * 24 * 60 * 60)))
+
+# Reports with at least this many promises are generated in a background thread
+# while the page polls for progress; smaller ones are written inline.
+REPORT_BACKGROUND_MIN_ROWS = int(os.environ.get("REPORT_BACKGROUND_MIN_ROWS", "5000"))
+REPORT_BACKGROUND_WORKERS = int(os.environ.get("REPORT_BACKGROUND_WORKERS", "1"))
+
+# A background job whose progress has not been updated for this long is assumed dead
+REPORT_JOB_STALE_SECONDS = int(os.environ.get("REPORT_JOB_STALE_SECONDS", "120"))
+
+# --- Export ---
+# Rows serialized per chunk (and per Parquet row group) by the /export endpoint
+EXPORT_CHUNK_SIZE = int(os.environ.get("EXPORT_CHUNK_SIZE", "10000"))
+
+# --- Metrics ---
+# Request, callback and stage timings are served in the Prometheus text format
+# at /metrics. METRICS_LOG_REQUESTS also logs every request as a JSON line
+# with its request id and the time spent in each stage.
+METRICS_ENABLED = os.environ.get("METRICS_ENABLED", "1") != "0"
+METRICS_LOG_REQUESTS = os.environ.get("METRICS_LOG_REQUESTS", "0") != "0"
+
+# Each worker writes a snapshot of its metrics here every METRICS_FLUSH_SECONDS,
+# so /metrics can add up every worker. Empty: /metrics serves only the worker
+# that answers the scrape.
+METRICS_DIR = os.environ.get("METRICS_DIR", os.path.join(APP_DIR, "cache", "metrics"))
+METRICS_FLUSH_SECONDS = float(os.environ.get("METRICS_FLUSH_SECONDS", "5"))
+
+# --- Query History ---
+# The history keeps the most recent queries of each browser tab. Every query
+# sends only its new entry to the browser; older entries are trimmed there.
+QUERY_HISTORY_MAX_ENTRIES = int(os.environ.get("QUERY_HISTORY_MAX_ENTRIES", "50"))
+
+# With QUERY_HISTORY_SERVER_SIDE, the history is kept per tab session in a
+# SQLite file shared by all gunicorn workers (instead of in the browser), so it
+# survives page reloads. Sessions idle for longer than the TTL are dropped.
+QUERY_HISTORY_SERVER_SIDE = os.environ.get("QUERY_HISTORY_SERVER_SIDE", "0") != "0"
+QUERY_HISTORY_TTL_SECONDS = int(os.environ.get("QUERY_HISTORY_TTL_SECONDS", str(7 * 24 * 60 * 60)))
+QUERY_HISTORY_PATH = os.environ.get(
+    "QUERY_HISTORY_PATH", os.path.join(APP_DIR, "cache", "query_history.sqlite3")
+)
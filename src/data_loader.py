@@ -0,0 +1,295 @@
+"""
+This module loads promises.csv into a DataFrame with a declared schema.
+
+Columns are parsed with explicit dtypes (categoricals for the low-cardinality
+text columns) and due dates with an explicit format, and
+the result is checked against the schema. The typed data is cached in an
+uncompressed Feather snapshot next to the other caches; the snapshot is memory
+mapped on load and only rebuilt when the CSV changes, so workers skip CSV
+parsing entirely on a warm start. When the CSV changes, the first worker to
+notice rebuilds the snapshot under a file lock while the others wait and then
+map the new snapshot instead of parsing the CSV themselves.
+"""
+
+import fcntl
+import hashlib
+import json
+import os
+import tempfile
+
+import pandas as pd
+
+from config import DATA_DATE_FORMAT, DATA_SNAPSHOT_DIR, DATA_SNAPSHOT_ENABLED
+
+try:
+    import pyarrow as pa
+    import pyarrow.feather as feather
+except ImportError:  # The snapshot is optional; without pyarrow the CSV is parsed every time
+    pa = None
+    feather = None
+
+# Declared dtypes of promises.csv. None keeps pandas' default text dtype;
+# due_date is parsed separately with DATA_DATE_FORMAT.
+PROMISE_SCHEMA = {
+    "city": "category",
+    "promise_id": None,
+    "promise_description": None,
+    "status": "category",
+    # float64: float32 cannot hold the 6-decimal coordinates of promises.csv
+    # exactly, and exports and map payloads must show the values as written
+    "latitude": "float64",
+    "longitude": "float64",
+    "category": "category",
+}
+DATE_COLUMNS = ("due_date",)
+REQUIRED_COLUMNS = tuple(PROMISE_SCHEMA) + DATE_COLUMNS
+KNOWN_STATUSES = ("due", "late", "on-time")
+
+# Bump when the schema or parsing changes so existing snapshots are rebuilt
+SNAPSHOT_FORMAT_VERSION = "2"
+
+
+class ValidationReport:
+    """
+    The outcome of checking a loaded DataFrame against the schema.
+
+    Attributes:
+        rows (int): Rows loaded.
+        missing_columns (list): Schema columns absent from the CSV.
+        extra_columns (list): CSV columns not in the schema (kept as-is).
+        issues (dict): Problem name -> number of affected rows.
+        source (str): "csv" or "snapshot", depending on where the data came from.
+    """
+
+    def __init__(self, rows=0, missing_columns=None, extra_columns=None, issues=None, source="csv"):
+        self.rows = rows
+        self.missing_columns = missing_columns or []
+        self.extra_columns = extra_columns or []
+        self.issues = issues or {}
+        self.source = source
+
+    @property
+    def ok(self):
+        """True if no schema column is missing and no row has a problem."""
+        return not self.missing_columns and not any(self.issues.values())
+
+    def to_dict(self):
+        return {
+            "rows": self.rows,
+            "missing_columns": self.missing_columns,
+            "extra_columns": self.extra_columns,
+            "issues": self.issues,
+            "source": self.source,
+        }
+
+    @classmethod
+    def from_dict(cls, data, source):
+        return cls(data["rows"], data["missing_columns"], data["extra_columns"], data["issues"], source)
+
+    def summary(self):
+        """Returns a one-line description of the report."""
+        problems = [f"{count} {name}" for name, count in self.issues.items() if count]
+        if self.missing_columns:
+            problems.insert(0, f"missing columns {', '.join(self.missing_columns)}")
+        return f"{self.rows} promises loaded from {self.source}; " + (
+            "; ".join(problems) if problems else "no issues"
+        )
+
+
+def read_promises_csv(csv_path):
+    """
+    Parses promises.csv with the declared schema.
+
+    Args:
+        csv_path (str): Path of the CSV file.
+
+    Returns:
+        tuple: (pd.DataFrame, dict) the typed data and the number of due dates
+        that did not match DATA_DATE_FORMAT (they are left as NaT).
+    """
+    header = pd.read_csv(csv_path, nrows=0).columns
+    dtypes = {column: dtype for column, dtype in PROMISE_SCHEMA.items() if dtype and column in header}
+    data_df = pd.read_csv(csv_path, dtype=dtypes)
+
+    bad_dates = {}
+    for column in DATE_COLUMNS:
+        if column in data_df.columns:
+            raw = data_df[column]
+            data_df[column] = pd.to_datetime(raw, format=DATA_DATE_FORMAT, errors="coerce")
+            bad_dates[column] = int((data_df[column].isna() & raw.notna()).sum())
+    return data_df, bad_dates
+
+
+def validate_promises(data_df, bad_dates=None):
+    """
+    Checks a typed promise DataFrame against the schema.
+
+    Args:
+        data_df (pd.DataFrame): The loaded data.
+        bad_dates (dict, optional): Column -> unparseable date count from read_promises_csv.
+
+    Returns:
+        ValidationReport: The problems found.
+    """
+    columns = list(data_df.columns)
+    issues = {}
+    for column, count in (bad_dates or {}).items():
+        issues[f"unparseable {column} values"] = count
+    for column in REQUIRED_COLUMNS:
+        if column in data_df.columns:
+            issues[f"missing {column} values"] = int(data_df[column].isna().sum())
+    if "status" in data_df.columns:
+        statuses = data_df["status"].dropna().astype(str).str.lower()
+        issues["unknown status values"] = int((~statuses.isin(KNOWN_STATUSES)).sum())
+    if "promise_id" in data_df.columns:
+        issues["duplicate promise_id values"] = int(data_df["promise_id"].dropna().duplicated().sum())
+    if "latitude" in data_df.columns and "longitude" in data_df.columns:
+        out_of_range = (data_df["latitude"].abs() > 90) | (data_df["longitude"].abs() > 180)
+        issues["out of range coordinates"] = int(out_of_range.sum())
+
+    return ValidationReport(
+        rows=len(data_df),
+        missing_columns=[c for c in REQUIRED_COLUMNS if c not in columns],
+        extra_columns=[c for c in columns if c not in REQUIRED_COLUMNS],
+        issues=issues,
+    )
+
+
+def file_sha256(path):
+    """Returns the SHA-256 hex digest of a file, read in blocks."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _snapshot_paths(csv_path, snapshot_dir):
+    name = os.path.splitext(os.path.basename(csv_path))[0]
+    base = os.path.join(snapshot_dir, name)
+    return f"{base}.feather", f"{base}.snapshot.json"
+
+
+def _parse_csv(csv_path):
+    data_df, bad_dates = read_promises_csv(csv_path)
+    return data_df, validate_promises(data_df, bad_dates)
+
+
+def _atomic_write(path, write):
+    directory = os.path.dirname(path)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    os.close(fd)
+    try:
+        write(tmp_path)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def _read_snapshot(snapshot_path, csv_path, meta_path):
+    """Returns (DataFrame, ValidationReport) from a current snapshot, or None."""
+    try:
+        with open(meta_path, encoding="utf-8") as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if meta.get("format_version") != SNAPSHOT_FORMAT_VERSION or meta.get("date_format") != DATA_DATE_FORMAT:
+        return None
+    if not os.path.exists(snapshot_path):
+        return None
+
+    stat = os.stat(csv_path)
+    if (meta.get("csv_mtime_ns"), meta.get("csv_size")) != (stat.st_mtime_ns, stat.st_size):
+        # The file was touched; only rebuild if its content actually changed
+        if meta.get("csv_sha256") != file_sha256(csv_path):
+            return None
+        meta["csv_mtime_ns"], meta["csv_size"] = stat.st_mtime_ns, stat.st_size
+        _atomic_write(meta_path, lambda path: _dump_json(path, meta))
+
+    data_df = feather.read_table(snapshot_path, memory_map=True).to_pandas()
+    return data_df, ValidationReport.from_dict(meta["validation"], source="snapshot")
+
+
+def _dump_json(path, data):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f)
+
+
+def _write_snapshot(data_df, report, snapshot_path, csv_path, meta_path):
+    """Writes the typed data and its metadata next to each other."""
+    stat = os.stat(csv_path)
+    meta = {
+        "format_version": SNAPSHOT_FORMAT_VERSION,
+        "date_format": DATA_DATE_FORMAT,
+        "csv_mtime_ns": stat.st_mtime_ns,
+        "csv_size": stat.st_size,
+        "csv_sha256": file_sha256(csv_path),
+        "validation": report.to_dict(),
+    }
+    table = pa.Table.from_pandas(data_df, preserve_index=False)
+    # Uncompressed so the snapshot can be memory mapped instead of decoded
+    _atomic_write(snapshot_path, lambda path: feather.write_feather(table, path, compression="uncompressed"))
+    _atomic_write(meta_path, lambda path: _dump_json(path, meta))
+
+
+def load_promises(csv_path, snapshot_dir=DATA_SNAPSHOT_DIR, use_snapshot=DATA_SNAPSHOT_ENABLED):
+    """
+    Loads the promise data, from the snapshot when it matches the CSV.
+
+    Args:
+        csv_path (str): Path of promises.csv.
+        snapshot_dir (str): Directory holding the Feather snapshot.
+        use_snapshot (bool): Whether to read and write the snapshot.
+
+    Returns:
+        tuple: (pd.DataFrame, ValidationReport).
+
+    Raises:
+        FileNotFoundError: If the CSV does not exist.
+    """
+    if not os.path.exists(csv_path):
+        raise FileNotFoundError(csv_path)
+
+    use_snapshot = use_snapshot and feather is not None
+    snapshot_path, meta_path = _snapshot_paths(csv_path, snapshot_dir)
+    if use_snapshot:
+        try:
+            loaded = _read_snapshot(snapshot_path, csv_path, meta_path)
+            if loaded is not None:
+                return loaded
+        except Exception as e:
+            print(f"Error reading data snapshot, parsing the CSV instead: {e}")
+
+    if not use_snapshot:
+        return _parse_csv(csv_path)
+
+    try:
+        os.makedirs(snapshot_dir, exist_ok=True)
+        lock_file = open(os.path.splitext(meta_path)[0] + ".lock", "a")
+    except OSError as e:
+        print(f"Error writing data snapshot: {e}")
+        return _parse_csv(csv_path)
+
+    with lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            # Another worker may have rebuilt the snapshot while this one waited for the lock
+            loaded = _read_snapshot(snapshot_path, csv_path, meta_path)
+            if loaded is not None:
+                return loaded
+        except Exception as e:
+            print(f"Error reading data snapshot, parsing the CSV instead: {e}")
+
+        data_df, report = _parse_csv(csv_path)
+        try:
+            _write_snapshot(data_df, report, snapshot_path, csv_path, meta_path)
+        except Exception as e:
+            print(f"Error writing data snapshot: {e}")
+    return data_df, report
+
+
+def memory_usage_bytes(data_df):
+    """Returns the deep memory usage of a DataFrame in bytes."""
+    return int(data_df.memory_usage(deep=True, index=False).sum())
@@ -0,0 +1,209 @@
+"""
+This module holds the promise dataset and reloads it when promises.csv changes.
+
+Each load produces an immutable Dataset: the DataFrame plus everything derived
+from it (indexes, version stamp, KPIs and the query engine with its result
+cache). Callbacks read DatasetHolder.current once per call and use that
+version throughout. A changed CSV is loaded and indexed on a background
+thread, and the new version replaces the old one with a single reference
+assignment, so requests never see a half-built dataset and are never blocked
+by a reload.
+"""
+
+import os
+import threading
+import time
+
+import pandas as pd
+
+from config import DATA_RELOAD_ENABLED, DATA_RELOAD_INTERVAL_SECONDS
+from data_loader import load_promises
+from indexes import PromiseIndex
+from query_engine import QueryEngine
+from sql_backend import create_backend
+from utils import dataset_version
+
+
+def compute_kpis(data_df):
+    """
+    Counts the promises shown in the KPI cards.
+
+    Args:
+        data_df (pd.DataFrame): The promise data.
+
+    Returns:
+        dict: "total", "late", "due" and "on_time" counts ("Error" if they cannot be computed).
+    """
+    try:
+        if data_df.empty:
+            return {"total": 0, "late": 0, "due": 0, "on_time": 0}
+        counts = data_df["status"].value_counts()
+        return {
+            "total": len(data_df),
+            "late": int(counts.get("late", 0)),
+            "due": int(counts.get("due", 0)),
+            "on_time": int(counts.get("on-time", 0)),
+        }
+    except Exception as e:
+        print(f"Error calculating KPIs: {e}")
+        return {"total": "Error", "late": "Error", "due": "Error", "on_time": "Error"}
+
+
+def _source_stat(path):
+    """Returns the (mtime_ns, size) of a file, or None if it cannot be read."""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+class Dataset:
+    """
+    One loaded version of the promise data. Treat every attribute as read-only.
+
+    Attributes:
+        df (pd.DataFrame): The promise data.
+        index (PromiseIndex or None): Prebuilt indexes for df (None with the SQL backend).
+        version (str): The dataset version stamp from utils.dataset_version.
+        kpis (dict): The KPI counts from compute_kpis.
+        backend (SQLiteBackend or None): The SQL backend, or None to filter with pandas.
+        engine (QueryEngine): Resolves queries against this version.
+        validation_report (ValidationReport or None): The schema check of the loaded data.
+        source_stat (tuple or None): The CSV's (mtime_ns, size) when it was loaded.
+        loaded_at (float): When this version was built.
+    """
+
+    def __init__(self, df, validation_report=None, source_stat=None):
+        self.df = df
+        self.version = dataset_version(df)
+        self.kpis = compute_kpis(df)
+        self.backend = create_backend(df, self.version)
+        # The SQL backend answers queries from its own indexes; only the pandas path needs PromiseIndex
+        try:
+            self.index = PromiseIndex(df) if not df.empty and self.backend is None else None
+        except Exception as e:
+            print(f"Error building indexes: {e}")
+            self.index = None
+        self.engine = QueryEngine(df, self.index, backend=self.backend)
+        self.validation_report = validation_report
+        self.source_stat = source_stat
+        self.loaded_at = time.time()
+
+
+class DatasetHolder:
+    """
+    Holds the current Dataset and swaps in a new one when the source CSV changes.
+    """
+
+    def __init__(
+        self,
+        csv_path,
+        reload_enabled=DATA_RELOAD_ENABLED,
+        reload_interval=DATA_RELOAD_INTERVAL_SECONDS,
+    ):
+        self.csv_path = csv_path
+        self.reload_enabled = reload_enabled
+        self.reload_interval = reload_interval
+        self._current = Dataset(pd.DataFrame())
+        self._listeners = []
+        self._lock = threading.Lock()
+        self._reloading = False
+        self._last_check = 0.0
+        self._failed_stat = None
+
+    @property
+    def current(self):
+        """The Dataset to use for the rest of a request."""
+        return self._current
+
+    def on_swap(self, listener):
+        """
+        Registers a function called as listener(new, old) after a new version is swapped in.
+
+        Args:
+            listener (callable): Invalidates or rebuilds state derived from the old version.
+        """
+        self._listeners.append(listener)
+
+    def _build(self):
+        source_stat = _source_stat(self.csv_path)
+        df, report = load_promises(self.csv_path)
+        print(f"Data: {report.summary()}")
+        return Dataset(df, report, source_stat)
+
+    def load(self):
+        """
+        Loads the dataset synchronously (at startup). On failure the holder
+        keeps an empty dataset and retries when the CSV changes.
+
+        Returns:
+            Dataset: The current dataset.
+        """
+        try:
+            self._swap(self._build())
+        except FileNotFoundError:
+            print("Error: promises.csv not found. Make sure the file is in the correct directory.")
+        except Exception as e:
+            print(f"An error occurred while loading data: {e}")
+        return self._current
+
+    def poll(self):
+        """
+        Starts a background reload if the CSV changed. Cheap enough to call on
+        every request: it stats the file at most once per reload_interval.
+        """
+        if not self.reload_enabled:
+            return
+        now = time.monotonic()
+        if now - self._last_check < self.reload_interval:
+            return
+        self._last_check = now
+        if _source_stat(self.csv_path) in (None, self._current.source_stat, self._failed_stat):
+            return
+        with self._lock:
+            if self._reloading:
+                return
+            self._reloading = True
+        threading.Thread(target=self.reload, name="dataset-reload", daemon=True).start()
+
+    def reload(self):
+        """
+        Builds the dataset from the CSV and swaps it in if the data changed.
+
+        Returns:
+            bool: True if a new version was swapped in.
+        """
+        source_stat = _source_stat(self.csv_path)
+        try:
+            new = self._build()
+            missing = new.validation_report.missing_columns
+            if missing:
+                raise ValueError(f"missing columns {', '.join(missing)}")
+            if new.version == self._current.version:
+                # Touched but unchanged; remember the new stat so it is not reloaded again
+                self._current.source_stat = new.source_stat
+                return False
+            self._swap(new)
+            print(f"Data reloaded: version {new.version}")
+            return True
+        except Exception as e:
+            print(f"Error reloading data, keeping version {self._current.version}: {e}")
+            # Retry once the file changes again rather than on every poll
+            self._failed_stat = source_stat
+            return False
+        finally:
+            with self._lock:
+                self._reloading = False
+
+    def _swap(self, new):
+        old = self._current
+        self._current = new
+        for listener in self._listeners:
+            try:
+                listener(new, old)
+            except Exception as e:
+                print(f"Error updating state for dataset version {new.version}: {e}")
+        if old.backend is not None and old.backend.version != new.version:
+            # Requests still holding the old version keep their open connections
+            old.backend.close()
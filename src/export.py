@@ -0,0 +1,322 @@
+"""
+This module contains the bulk export endpoint for the promise data.
+
+GET or POST /export streams the rows selected by a natural language query, or
+by a structured query that skips the LLM, as CSV, JSON Lines or Parquet.
+Rows are read and serialized in chunks (Parquet row groups): slices of the
+DataFrame, or pages fetched from the SQL backend, so neither the selection
+nor the response is ever built in memory in full.
+
+Parameters (query string, form fields or a JSON body):
+    query: Natural language query, planned as in the app (local parser, then the LLM).
+    plan: Structured query (a JSON object or its string form); takes precedence over query.
+    format: "csv" (default), "jsonl" or "parquet".
+    columns: Comma-separated list (or JSON list) of columns to include.
+
+A 200 response always comes from a plan that ran; X-Row-Count holds the
+number of rows. Invalid parameters or plans return 400, a query that cannot
+be turned into filters 422, and a query that needs the unavailable LLM 503.
+"""
+
+import json
+
+import numpy as np
+import pandas as pd
+from flask import Response, jsonify, request
+
+from config import EXPORT_CHUNK_SIZE
+from query_plan import QueryPlanError, compile_plan
+from query_parser import plan_query
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # Parquet export is optional
+    pa = None
+    pq = None
+
+EXPORT_FORMATS = {
+    "csv": ("text/csv", "csv"),
+    "jsonl": ("application/x-ndjson", "jsonl"),
+    "parquet": ("application/vnd.apache.parquet", "parquet"),
+}
+
+
+class ExportError(ValueError):
+    """Raised when an export request cannot be served."""
+
+
+class ExportPlanError(ExportError):
+    """Raised when a natural language query cannot be turned into a usable plan."""
+
+
+class ExportUnavailableError(ExportError):
+    """Raised when a query needs the LLM and the LLM cannot answer right now."""
+
+
+def _formatted(chunk):
+    """Formats date columns as YYYY-MM-DD strings, as shown in the app and reports."""
+    for column in chunk.columns:
+        if pd.api.types.is_datetime64_any_dtype(chunk[column]):
+            chunk = chunk.assign(**{column: chunk[column].dt.strftime("%Y-%m-%d")})
+    return chunk
+
+
+def _chunks(data_df, chunk_size):
+    for start in range(0, len(data_df), chunk_size):
+        yield data_df.iloc[start:start + chunk_size]
+
+
+def iter_csv(chunks, schema_df):
+    """
+    Yields the rows as CSV text, one chunk at a time.
+
+    Args:
+        chunks (iterable): DataFrames holding consecutive rows to export.
+        schema_df (pd.DataFrame): An empty frame with the exported columns, for the header.
+
+    Yields:
+        str: The header line, then consecutive CSV chunks.
+    """
+    yield schema_df.iloc[:0].to_csv(index=False)
+    for chunk in chunks:
+        yield _formatted(chunk).to_csv(index=False, header=False)
+
+
+def iter_jsonl(chunks, schema_df):
+    """
+    Yields the rows as JSON Lines, one chunk at a time.
+
+    Args:
+        chunks (iterable): DataFrames holding consecutive rows to export.
+        schema_df (pd.DataFrame): An empty frame with the exported columns.
+
+    Yields:
+        str: Newline-terminated JSON objects, one per row.
+    """
+    for chunk in chunks:
+        if not chunk.empty:
+            yield _formatted(chunk).to_json(orient="records", lines=True, force_ascii=False) + "\n"
+
+
+class _ChunkSink:
+    """A write-only file object that hands written bytes back to a generator."""
+
+    def __init__(self):
+        self.parts = []
+        self.position = 0
+        self.closed = False
+
+    def write(self, data):
+        self.parts.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self):
+        data = b"".join(self.parts)
+        self.parts = []
+        return data
+
+
+def iter_parquet(chunks, schema_df):
+    """
+    Yields the rows as a Parquet file, writing one row group per chunk.
+
+    Args:
+        chunks (iterable): DataFrames holding consecutive rows to export.
+        schema_df (pd.DataFrame): An empty frame with the exported columns and dtypes.
+
+    Yields:
+        bytes: Consecutive parts of the Parquet file.
+
+    Raises:
+        ExportError: If pyarrow is not installed.
+    """
+    if pq is None:
+        raise ExportError("Parquet export requires the pyarrow package.")
+
+    sink = _ChunkSink()
+    writer = None
+    try:
+        for chunk in chunks:
+            if chunk.empty:
+                continue
+            # The first row group fixes the schema (an empty frame would type text columns as null)
+            table = pa.Table.from_pandas(chunk, schema=writer and writer.schema, preserve_index=False)
+            if writer is None:
+                writer = pq.ParquetWriter(sink, table.schema)
+            writer.write_table(table)
+            yield sink.drain()
+        if writer is None:
+            writer = pq.ParquetWriter(sink, pa.Schema.from_pandas(schema_df, preserve_index=False))
+    finally:
+        if writer is not None:
+            writer.close()
+    yield sink.drain()
+
+
+EXPORT_WRITERS = {"csv": iter_csv, "jsonl": iter_jsonl, "parquet": iter_parquet}
+
+
+def _request_params():
+    """Merges query string, form and JSON body parameters."""
+    params = request.values.to_dict()
+    body = request.get_json(silent=True)
+    if isinstance(body, dict):
+        params.update(body)
+    return params
+
+
+def _parse_columns(columns, data_df):
+    if not columns:
+        return list(data_df.columns)
+    if isinstance(columns, str):
+        columns = [c.strip() for c in columns.split(",") if c.strip()]
+    unknown = [c for c in columns if c not in data_df.columns]
+    if unknown:
+        raise ExportError(f"Unknown columns: {', '.join(map(str, unknown))}.")
+    return list(columns)
+
+
+class ExportSelection:
+    """
+    The rows an export request selected, read chunk by chunk while the response streams.
+
+    Attributes:
+        schema_df (pd.DataFrame): An empty frame with the exported columns and dtypes.
+        row_count (int): The number of selected rows.
+    """
+
+    def __init__(self, schema_df, row_count, chunks):
+        self.schema_df = schema_df
+        self.row_count = row_count
+        self._chunks = chunks
+
+    def chunks(self):
+        """Yields the selected rows as consecutive DataFrames of at most EXPORT_CHUNK_SIZE rows."""
+        return self._chunks()
+
+
+def _plan_for_query(data_df, query):
+    """
+    Plans a natural language query as the app does (local parser, then the LLM).
+
+    Raises:
+        ExportUnavailableError: If the query needs the LLM and it could not answer.
+        ExportPlanError: If the query could not be turned into filters.
+    """
+    structured_query, source = plan_query(data_df, query)
+    if source == "unavailable":
+        raise ExportUnavailableError(
+            "This query needs the language model, which is not configured or not responding right now."
+        )
+    if not structured_query:
+        raise ExportPlanError(f"The query {query!r} could not be turned into filters.")
+    return structured_query
+
+
+def select_rows(data_df, params, index=None, backend=None, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Resolves the rows and columns an export request asks for.
+
+    Nothing is copied here: the rows are read chunk by chunk from the
+    DataFrame or, with a SQL backend, page by page from SQLite while the
+    response is written.
+
+    Args:
+        data_df (pd.DataFrame): The full promise data.
+        params (dict): The request parameters (query, plan, columns).
+        index (PromiseIndex, optional): Prebuilt indexes for data_df.
+        backend (SQLiteBackend, optional): Storage backend holding data_df.
+        chunk_size (int): Rows per chunk.
+
+    Returns:
+        ExportSelection: The selected rows, projected to the requested columns.
+
+    Raises:
+        ExportError: If the plan or the column list is invalid (ExportPlanError
+            if a natural language query could not be planned, ExportUnavailableError
+            if it needs the LLM and the LLM could not answer).
+    """
+    columns = _parse_columns(params.get("columns"), data_df)
+    schema_df = data_df.iloc[:0][columns]
+    plan = params.get("plan")
+    if plan:
+        if isinstance(plan, str):
+            try:
+                plan = json.loads(plan)
+            except ValueError as e:
+                raise ExportError(f"Invalid plan JSON: {e}")
+        error_type = ExportError
+    elif params.get("query"):
+        plan = _plan_for_query(data_df, params["query"])
+        error_type = ExportPlanError
+    else:
+        # No filter: stream the whole dataset without copying it
+        return ExportSelection(
+            schema_df, len(data_df), lambda: (chunk[columns] for chunk in _chunks(data_df, chunk_size))
+        )
+
+    try:
+        if backend is not None:
+            row_count = backend.count(plan)
+            return ExportSelection(
+                schema_df, row_count, lambda: backend.iter_pages(plan, columns, page_size=chunk_size)
+            )
+        positions = np.flatnonzero(compile_plan(plan, data_df).evaluate(data_df, index))
+    except QueryPlanError as e:
+        raise error_type(f"Invalid plan: {e}")
+
+    def chunks():
+        for start in range(0, len(positions), chunk_size):
+            yield data_df.iloc[positions[start:start + chunk_size]][columns]
+
+    return ExportSelection(schema_df, len(positions), chunks)
+
+
+def register_export_routes(server, dataset):
+    """
+    Adds the /export route to the Flask server.
+
+    Args:
+        server (flask.Flask): The Flask server behind the Dash app.
+        dataset (DatasetHolder): Holds the promise data to export from.
+    """
+
+    @server.route("/export", methods=["GET", "POST"])
+    def export_promises():
+        params = _request_params()
+        export_format = str(params.get("format", "csv")).lower()
+        if export_format not in EXPORT_FORMATS:
+            return jsonify(error=f"Unsupported format '{export_format}'."), 400
+        if export_format == "parquet" and pq is None:
+            return jsonify(error="Parquet export requires the pyarrow package."), 501
+
+        data = dataset.current
+        try:
+            selection = select_rows(data.df, params, data.index, data.backend)
+        except ExportUnavailableError as e:
+            return jsonify(error=str(e)), 503
+        except ExportPlanError as e:
+            return jsonify(error=str(e)), 422
+        except ExportError as e:
+            return jsonify(error=str(e)), 400
+
+        mimetype, extension = EXPORT_FORMATS[export_format]
+        return Response(
+            EXPORT_WRITERS[export_format](selection.chunks(), selection.schema_df),
+            mimetype=mimetype,
+            headers={
+                "Content-Disposition": f"attachment; filename=city_promises.{extension}",
+                "X-Row-Count": str(selection.row_count),
+            },
+        )
@@ -0,0 +1,170 @@
+"""
+This module contains the column indexes used to filter the promise data.
+
+The indexes are built once when the data loads. Filtering then intersects
+sorted arrays of row positions and only materializes the final rows, instead
+of scanning and copying the full DataFrame for every condition.
+"""
+
+import re
+
+import numpy as np
+import pandas as pd
+
+# Columns with a small set of distinct values that are stored as codes
+CODED_COLUMNS = ("city", "status", "category")
+
+# Columns that get an n-gram index for substring search
+NGRAM_COLUMNS = ("promise_description",)
+
+# Length of the n-grams stored in the substring index
+NGRAM_SIZE = 3
+
+REGEX_METACHARACTERS = re.compile(r"[.^$*+?{}\[\]\\|()]")
+
+
+class PromiseIndex:
+    """
+    Prebuilt indexes over a promise DataFrame.
+
+    Attributes:
+        data_df (pd.DataFrame): The DataFrame the index was built for.
+        n_rows (int): The number of rows indexed.
+        codes (dict): column -> (codes array, distinct values), as from pd.factorize.
+        code_counts (dict): column -> number of rows per code.
+        date_values (np.ndarray): Sorted non-null due dates.
+        ngrams (dict): column -> {n-gram: sorted array of row positions}.
+    """
+
+    def __init__(self, data_df):
+        self.data_df = data_df
+        self.n_rows = len(data_df)
+        self.codes = {}
+        self.code_counts = {}
+        self.ngrams = {}
+        self._lowered = {}
+        self.date_values = None
+
+        for column in CODED_COLUMNS:
+            if column in data_df.columns:
+                codes, uniques = pd.factorize(data_df[column])
+                self.codes[column] = (codes, np.asarray(uniques, dtype=object))
+                self.code_counts[column] = np.bincount(codes[codes >= 0], minlength=len(uniques))
+
+        if "due_date" in data_df.columns and pd.api.types.is_datetime64_any_dtype(data_df["due_date"]):
+            values = data_df["due_date"].to_numpy()
+            self.date_values = np.sort(values[~pd.isna(values)])
+
+        for column in NGRAM_COLUMNS:
+            if column in data_df.columns:
+                lowered = data_df[column].fillna("").astype(str).str.lower().to_numpy()
+                self._lowered[column] = lowered
+                self.ngrams[column] = self._build_ngrams(lowered)
+
+    @staticmethod
+    def _build_ngrams(lowered):
+        """Maps each n-gram to the sorted row positions whose text contains it."""
+        postings = {}
+        for position, text in enumerate(lowered):
+            for gram in {text[i:i + NGRAM_SIZE] for i in range(len(text) - NGRAM_SIZE + 1)}:
+                postings.setdefault(gram, []).append(position)
+        return {gram: np.asarray(rows, dtype=np.intp) for gram, rows in postings.items()}
+
+    def is_for(self, data_df):
+        """Returns True if this index was built for the given DataFrame."""
+        return self.data_df is data_df and self.n_rows == len(data_df)
+
+    def match_value(self, column, value):
+        """
+        Finds rows whose column contains value (case-insensitive), mirroring
+        Series.str.contains.
+
+        Args:
+            column (str): The column to search.
+            value (str): The substring to search for.
+
+        Returns:
+            np.ndarray or None: Sorted row positions, or None if the column is not
+            n-gram indexed or value is a pattern.
+        """
+        if column in self.ngrams:
+            needle = str(value).lower()
+            if REGEX_METACHARACTERS.search(needle):
+                return None
+            candidates = None
+            if len(needle) >= NGRAM_SIZE:
+                grams = sorted(
+                    {needle[i:i + NGRAM_SIZE] for i in range(len(needle) - NGRAM_SIZE + 1)},
+                    key=lambda gram: len(self.ngrams[column].get(gram, ())),
+                )
+                for gram in grams:
+                    rows = self.ngrams[column].get(gram)
+                    if rows is None:
+                        return np.empty(0, dtype=np.intp)
+                    candidates = rows if candidates is None else np.intersect1d(
+                        candidates, rows, assume_unique=True
+                    )
+                    if len(candidates) == 0:
+                        return candidates
+            if candidates is None:
+                candidates = np.arange(self.n_rows)
+            # N-grams only narrow the candidates; confirm the full substring on those rows
+            lowered = self._lowered[column][candidates]
+            keep = np.fromiter((needle in text for text in lowered), dtype=bool, count=len(lowered))
+            return candidates[keep]
+
+        return None
+
+    def estimate_substring(self, column, literal):
+        """
+        Returns an upper bound on the rows containing literal, from the rarest n-gram.
+
+        Args:
+            column (str): The n-gram indexed column.
+            literal (str): The plain search string.
+
+        Returns:
+            int or None: The bound, or None if the column is not n-gram indexed.
+        """
+        if column not in self.ngrams:
+            return None
+        needle = literal.lower()
+        if len(needle) < NGRAM_SIZE:
+            return self.n_rows
+        postings = self.ngrams[column]
+        return min(
+            len(postings.get(needle[i:i + NGRAM_SIZE], ()))
+            for i in range(len(needle) - NGRAM_SIZE + 1)
+        )
+
+    def count_date(self, column, op, value):
+        """
+        Counts rows satisfying a due date comparison without materializing them.
+
+        Args:
+            column (str): The date column.
+            op (str): "$gt", "$gte", "$lt", "$lte", "$eq", "$ne", "$in" or "$between".
+            value: A datetime64 value, an array of them for "$in", or a (low, high) pair.
+
+        Returns:
+            int or None: The count, or None if the column is not indexed.
+        """
+        if column != "due_date" or self.date_values is None:
+            return None
+        values = self.date_values
+        if op == "$between":
+            low, high = value
+            return int(np.searchsorted(values, high, side="right") - np.searchsorted(values, low, side="left"))
+        if op == "$in":
+            return int(sum(self.count_date(column, "$eq", v) for v in value))
+        left = np.searchsorted(values, value, side="left")
+        right = np.searchsorted(values, value, side="right")
+        counts = {
+            "$gt": len(values) - right,
+            "$gte": len(values) - left,
+            "$lt": left,
+            "$lte": right,
+            "$eq": right - left,
+            "$ne": self.n_rows - (right - left),
+        }
+        return int(counts[op])
@@ -2,11 +2,16 @@
 This module contains the layout definition for the City Promise Tracker app.
 """
 
-from dash import dcc, html
+from dash import dcc, html, dash_table
 import dash_bootstrap_components as dbc
+from config import RESULTS_PAGE_SIZE, TABLE_COLUMNS
+from pagination import table_columns
+from query_history import empty_history
 
 
-def create_layout(total_promises, late_promises, due_promises, on_time_promises):
+def create_layout(
+    total_promises, late_promises, due_promises, on_time_promises, map_html=None, session_id=None
+):
     """
     Creates the layout for the Dash application.
 
@@ -15,6 +20,10 @@ def create_layout(total_promises, late_promises, due_promises, on_time_promises)
         late_promises (int): The number of late promises.
         due_promises (int): The number of due promises.
         on_time_promises (int): The number of on-time promises.
+        map_html (str, optional): The persistent map document. It is loaded once;
+            queries only update its markers.
+        session_id (str, optional): Identifies the browser tab for the server-side query
+            history; a tab that already has one keeps it across reloads.
 
     Returns:
         dbc.Container: The layout of the application.
@@ -23,8 +32,14 @@ def create_layout(total_promises, late_promises, due_promises, on_time_promises)
         return dbc.Container(
             fluid=True,
             children=[
-                dcc.Store(id="chat-history-store", data=[]),
-                dcc.Download(id="download-report"),
+                dcc.Store(id="chat-history-count", data=0),
+                dcc.Store(id="history-session-id", data=session_id, storage_type="session"),
+                dcc.Store(id="query-result-store"),
+                dcc.Store(id="map-markers-store"),
+                dcc.Store(id="report-download-url"),
+                dcc.Store(id="report-job-store"),
+                dcc.Interval(id="report-progress-interval", interval=1000, disabled=True),
+                html.Div(id="report-download-sync", style={"display": "none"}),
                 html.Div(
                     id="alert-placeholder",
                     style={
@@ -191,6 +206,7 @@ def create_layout(total_promises, late_promises, due_promises, on_time_promises)
                                 html.H4("Chat History"),
                                 html.Div(
                                     id="chat-history-output",
+                                    children=empty_history(),
                                     style={
                                         "height": "calc(100vh - 500px)",
                                         "overflow-y": "auto",
@@ -211,16 +227,15 @@ def create_layout(total_promises, late_promises, due_promises, on_time_promises)
                         dbc.Col(
                             [
                                 html.H4("Locations"),
-                                dbc.Spinner(
-                                    html.Iframe(
-                                        id="map",
-                                        srcDoc=None,
-                                        style={
-                                            "width": "100%",
-                                            "height": "calc(100vh - 250px)",
-                                        },
-                                    )
+                                html.Iframe(
+                                    id="map",
+                                    srcDoc=map_html,
+                                    style={
+                                        "width": "100%",
+                                        "height": "calc(100vh - 250px)",
+                                    },
                                 ),
+                                html.Div(id="map-sync", style={"display": "none"}),
                             ],
                             width=5,
                             style={
@@ -243,15 +258,64 @@ def create_layout(total_promises, late_promises, due_promises, on_time_promises)
                                     id="results-tabs",
                                     active_tab="results-tab",
                                 ),
-                                dbc.Spinner(
-                                    html.Div(
-                                        id="results-content",
-                                        style={
-                                            "height": "calc(100vh - 300px)",
-                                            "overflow-y": "auto",
-                                            "padding-top": "10px",
-                                        },
-                                    )
+                                html.Div(
+                                    id="results-content",
+                                    style={
+                                        "height": "calc(100vh - 300px)",
+                                        "overflow-y": "auto",
+                                        "padding-top": "10px",
+                                    },
+                                    children=[
+                                        # Results tab: one page of cards at a time
+                                        html.Div(
+                                            id="results-cards-view",
+                                            children=[
+                                                dbc.Spinner(html.Div(id="results-cards")),
+                                                dbc.Pagination(
+                                                    id="results-pagination",
+                                                    max_value=1,
+                                                    active_page=1,
+                                                    first_last=True,
+                                                    previous_next=True,
+                                                    fully_expanded=False,
+                                                    className="justify-content-center mt-2",
+                                                    style={"display": "none"},
+                                                ),
+                                            ],
+                                        ),
+                                        # Tabular tab: paging, sorting and filtering run on the server
+                                        html.Div(
+                                            id="results-table-view",
+                                            style={"display": "none"},
+                                            children=[
+                                                dash_table.DataTable(
+                                                    id="results-table",
+                                                    columns=table_columns(TABLE_COLUMNS),
+                                                    data=[],
+                                                    page_current=0,
+                                                    page_size=RESULTS_PAGE_SIZE,
+                                                    page_count=1,
+                                                    page_action="custom",
+                                                    sort_action="custom",
+                                                    sort_mode="multi",
+                                                    sort_by=[],
+                                                    filter_action="custom",
+                                                    filter_query="",
+                                                    style_table={"overflowX": "auto"},
+                                                    style_cell={
+                                                        "textAlign": "left",
+                                                        "whiteSpace": "normal",
+                                                        "height": "auto",
+                                                    },
+                                                    style_header={"fontWeight": "bold"},
+                                                ),
+                                                html.Div(
+                                                    id="results-table-info",
+                                                    className="text-muted mt-2",
+                                                ),
+                                            ],
+                                        ),
+                                    ],
                                 ),
                             ],
                             width=4,
@@ -0,0 +1,149 @@
+"""
+This module contains the persistent map document used for incremental updates.
+
+The document is rendered once and loaded into the map iframe. Each query then
+sends only a compact marker payload (column arrays of coordinates, popups and
+tooltips per distinct location); a clientside callback hands it to the
+document, which swaps the markers in its cluster layer in place.
+
+folium is imported when the document is first rendered, not when this module
+is imported, and the rendered document is saved to MAP_DOCUMENT_CACHE_PATH, so
+later starts load it from disk without importing folium at all.
+"""
+
+import functools
+import os
+import tempfile
+
+from jinja2 import Template
+
+from config import MAP_DOCUMENT_CACHE_PATH
+from utils import group_locations
+
+DEFAULT_CENTER = [39.8283, -98.5795]
+DEFAULT_ZOOM = 4
+
+# Version of the map document. Bump this whenever create_live_map or the
+# MarkerUpdater script changes so saved documents are rendered again.
+LIVE_MAP_VERSION = "1"
+
+
+@functools.lru_cache(maxsize=None)
+def _marker_updater_class():
+    """Defines the MarkerUpdater element class once folium is imported."""
+    from branca.element import MacroElement
+
+    class _MarkerUpdater(MacroElement):
+        """Defines window.updatePromiseMarkers inside the rendered map document."""
+
+        _template = Template(
+            """
+            {% macro script(this, kwargs) %}
+                window.updatePromiseMarkers = function (payload) {
+                    var map = {{ this._parent.get_name() }};
+                    var cluster = {{ this.cluster.get_name() }};
+                    cluster.clearLayers();
+                    if (!payload || !payload.lat || payload.lat.length === 0) {
+                        map.setView({{ this.center|tojson }}, {{ this.zoom }});
+                        return;
+                    }
+                    var markers = new Array(payload.lat.length);
+                    for (var i = 0; i < payload.lat.length; i++) {
+                        var marker = L.marker([payload.lat[i], payload.lon[i]]);
+                        marker.bindPopup(payload.popup[i], {maxWidth: 300});
+                        marker.bindTooltip(payload.tooltip[i]);
+                        markers[i] = marker;
+                    }
+                    cluster.addLayers(markers);
+                    map.fitBounds(cluster.getBounds(), {maxZoom: 12, padding: [20, 20]});
+                };
+                // Apply a payload that arrived before this document finished loading
+                if (window.parent && window.parent.promiseMapPayload) {
+                    window.updatePromiseMarkers(window.parent.promiseMapPayload);
+                }
+            {% endmacro %}
+            """
+        )
+
+        def __init__(self, cluster, center, zoom):
+            super().__init__()
+            self._name = "MarkerUpdater"
+            self.cluster = cluster
+            self.center = center
+            self.zoom = zoom
+
+    return _MarkerUpdater
+
+
+def create_live_map():
+    """
+    Creates the persistent map document with an empty, updatable cluster layer.
+
+    Returns:
+        str: The HTML for the map iframe's srcDoc.
+    """
+    import folium
+    from folium.plugins import MarkerCluster
+
+    m = folium.Map(location=DEFAULT_CENTER, zoom_start=DEFAULT_ZOOM)
+    cluster = MarkerCluster().add_to(m)
+    m.add_child(_marker_updater_class()(cluster, DEFAULT_CENTER, DEFAULT_ZOOM))
+    return m.get_root().render()
+
+
+def _document_path(cache_path):
+    root, ext = os.path.splitext(cache_path)
+    return f"{root}.v{LIVE_MAP_VERSION}{ext}"
+
+
+def load_live_map(cache_path=MAP_DOCUMENT_CACHE_PATH):
+    """
+    Returns the persistent map document, rendering it only if no saved copy exists.
+
+    Args:
+        cache_path (str): Where the rendered document is saved; empty to always render.
+
+    Returns:
+        str: The HTML for the map iframe's srcDoc.
+    """
+    if not cache_path:
+        return create_live_map()
+    path = _document_path(cache_path)
+    try:
+        with open(path, encoding="utf-8") as f:
+            return f.read()
+    except OSError:
+        pass
+
+    document = create_live_map()
+    try:
+        directory = os.path.dirname(path) or "."
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(document)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        print(f"Error saving the map document: {e}")
+    return document
+
+
+def marker_payload(data_df):
+    """
+    Builds the compact marker payload for a result set.
+
+    Args:
+        data_df (pd.DataFrame): The rows to show on the map.
+
+    Returns:
+        dict: Column arrays 'lat', 'lon', 'popup' and 'tooltip', one entry per distinct location.
+    """
+    if data_df.empty:
+        return {"lat": [], "lon": [], "popup": [], "tooltip": []}
+    locations = group_locations(data_df)
+    return {
+        "lat": locations["latitude"].astype(float).tolist(),
+        "lon": locations["longitude"].astype(float).tolist(),
+        "popup": locations["popup"].tolist(),
+        "tooltip": locations["tooltip"].tolist(),
+    }
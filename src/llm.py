@@ -1,89 +1,215 @@
 """
-This module handles the interaction with the Google Gemini LLM.
+This module handles the interaction with the LLM that plans queries.
+
+Requests are answered by the provider selected with LLM_PROVIDER (see
+llm_providers): the Google Gemini API, Gemini with every answer recorded to a
+JSONL file, or a replay of such a recording for offline load tests. The
+google.generativeai package is imported and configured on the first query
+that needs it, not at import time, so the app starts without paying for the
+import. Without a GEMINI_API_KEY (and outside replay) the app runs in a
+degraded no-LLM mode: queries the local parser understands and plans already
+in the plan cache still work, everything else raises LLMUnavailableError.
+An answer that cannot be used as a plan (invalid JSON, off-schema, no
+conditions) raises LLMPlanError instead of passing for an empty result.
+
+LLM requests go through an LLMExecutor, which bounds how many run at once
+and how long each may take, retries transient errors and fails fast while
+the upstream is unhealthy (see llm_executor). The prompt and the response
+schema come from llm_prompt; the token counts and wall time of every request
+are recorded in llm_usage. One GenerativeModel is created per process and
+reused for every query; with LLM_BATCH_ENABLED, queries from concurrent
+requests are planned together (see plan_batcher).
 """
 
-import os
 import json
-from config import GEMINI_MODEL
-import google.generativeai as genai
+import threading
+import time
+from config import LLM_BATCH_ENABLED
+from llm_executor import LLMExecutor, LLMUnavailableError
+from llm_prompt import plan_from_response
+from llm_providers import create_provider
+from metrics import stage
+from plan_batcher import MicroBatcher
+from plan_cache import plan_cache, make_cache_key
 from dotenv import load_dotenv
 
 # Load environment variables from .env file
 load_dotenv()
 
-# Configure the Gemini API
-try:
-    api_key = os.environ.get("GEMINI_API_KEY")   
 
-    if not api_key or api_key == "YOUR_GEMINI_API_KEY":
-        raise ValueError("GEMINI_API_KEY not found or not set in .env file.")
-    genai.configure(api_key=api_key)
-except (AttributeError, ValueError) as e:
-    # This will catch cases where the API key is missing or invalid
-    raise SystemExit(f"Error configuring Gemini API: {e}") from e
+class _UsageCounter:
+    """Accumulates the tokens and wall time of LLM requests so prompt changes can be measured."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._totals = {"requests": 0, "queries": 0, "prompt_tokens": 0, "output_tokens": 0, "seconds": 0.0}
+        self._max_seconds = 0.0
+        self._last = None
+
+    def record(self, queries, prompt_tokens, output_tokens, seconds):
+        with self._lock:
+            self._totals["requests"] += 1
+            self._totals["queries"] += queries
+            self._totals["prompt_tokens"] += prompt_tokens
+            self._totals["output_tokens"] += output_tokens
+            self._totals["seconds"] += seconds
+            self._max_seconds = max(self._max_seconds, seconds)
+            self._last = {
+                "queries": queries,
+                "prompt_tokens": prompt_tokens,
+                "output_tokens": output_tokens,
+                "seconds": round(seconds, 4),
+            }
+
+    def stats(self):
+        with self._lock:
+            totals = dict(self._totals)
+            stats = dict(totals, max_seconds=round(self._max_seconds, 4), last=self._last)
+        requests = totals["requests"]
+        stats["seconds"] = round(totals["seconds"], 4)
+        stats["avg_prompt_tokens"] = totals["prompt_tokens"] / requests if requests else 0.0
+        stats["avg_output_tokens"] = totals["output_tokens"] / requests if requests else 0.0
+        stats["avg_seconds"] = round(totals["seconds"] / requests, 4) if requests else 0.0
+        return stats
+
+
+class LLMPlanError(Exception):
+    """Raised when the LLM answered but its answer cannot be used as a query plan."""
+
+
+# Answers every LLM request in this process, selected by LLM_PROVIDER
+llm_provider = create_provider()
+# Runs every LLM request in this process
+llm_executor = LLMExecutor()
+llm_usage = _UsageCounter()
+
+
+def is_available():
+    """
+    Tells whether LLM queries are possible (e.g. a Gemini API key is configured).
+
+    Returns:
+        bool: False in the degraded no-LLM mode.
+    """
+    return llm_provider.is_available()
+
+
+def _request(queries: list, df_columns, vocabulary: dict) -> list:
+    """Sends queries to the provider through the executor, records the usage and returns one answer per query."""
+    start = time.perf_counter()
+    # Answer within the executor's deadline; it retries transient errors itself
+    with stage("llm"):
+        response = llm_executor.call(
+            lambda timeout: llm_provider.answer(queries, list(df_columns), vocabulary, timeout)
+        )
+    llm_usage.record(len(queries), response.prompt_tokens, response.output_tokens, time.perf_counter() - start)
+    return response.answers
+
 
+def _plan_batch(group_key: tuple, queries: list) -> list:
+    """Plans a micro-batch of queries with one request; a lone query uses the single-query prompt."""
+    df_columns, frozen_vocabulary = group_key
+    vocabulary = {column: list(values) for column, values in frozen_vocabulary}
+    return [plan_from_response(answer) for answer in _request(queries, df_columns, vocabulary)]
 
-def get_structured_query(query: str, df_columns: list) -> dict:
+
+# Combines LLM queries from concurrent requests when LLM_BATCH_ENABLED is set
+plan_batcher = MicroBatcher(_plan_batch) if LLM_BATCH_ENABLED else None
+
+
+def get_structured_query(query: str, df_columns: list, vocabulary: dict = None) -> dict:
     """
-    Uses Gemini to convert a natural language query into a structured
+    Uses the LLM to convert a natural language query into a structured
     JSON format for filtering a Pandas DataFrame.
 
+    Plans are looked up in the shared plan cache first, so a query that any
+    worker has already answered does not trigger another LLM round trip.
+    With micro-batching enabled, queries from concurrent requests are planned
+    together in one request.
+
     Args:
         query (str): The natural language query from the user.
         df_columns (list): The list of columns in the DataFrame.
+        vocabulary (dict, optional): column -> values listed in the prompt
+            (see llm_prompt.prompt_vocabulary).
 
     Returns:
-        dict: A dictionary with filter conditions, or an empty dictionary if an error occurs.
+        dict: A dictionary with filter conditions.
+
+    Raises:
+        LLMUnavailableError: If no API key is configured, or Gemini did not
+            answer in time or is failing (see llm_executor).
+        LLMPlanError: If the answer is not valid JSON, does not follow the
+            schema or holds no filter conditions.
     """
+    cache_key = make_cache_key(query, df_columns, vocabulary, llm_provider.name)
+    cached_plan = plan_cache.get(cache_key)
+    if cached_plan is not None:
+        return cached_plan
+
+    if not is_available():
+        raise LLMUnavailableError(f"the {llm_provider.name} LLM provider is not configured (GEMINI_API_KEY)")
+
     try:
-        model = genai.GenerativeModel(GEMINI_MODEL)
+        if plan_batcher is not None:
+            frozen_vocabulary = tuple((column, tuple(values)) for column, values in (vocabulary or {}).items())
+            structured_query = plan_batcher.submit((tuple(df_columns), frozen_vocabulary), query)
+        else:
+            structured_query = plan_from_response(_request([query], df_columns, vocabulary)[0])
+    except json.JSONDecodeError as e:
+        raise LLMPlanError(f"the LLM answer is not valid JSON: {e}") from e
+    except LLMUnavailableError:
+        raise
+    except TimeoutError as e:
+        # A batch that did not finish within its deadline
+        raise LLMUnavailableError(str(e)) from e
+    except Exception as e:
+        # An answer the response schema does not allow, or a request the upstream
+        # rejected (e.g. a 400 response); retrying the same query would not help
+        raise LLMPlanError(f"the LLM could not plan the query: {e}") from e
 
-        # Create a detailed prompt for the model to generate a structured JSON response
-        prompt = f"""
-        You are a data analysis assistant. Your task is to convert a natural language query
-        into a structured JSON object that can be used to filter a pandas DataFrame.
+    # Only usable plans are cached; a failed answer is retried on the next request
+    if not structured_query:
+        raise LLMPlanError("the LLM answer holds no filter conditions")
+    plan_cache.set(cache_key, structured_query)
+    return structured_query
 
-        The DataFrame has the following columns: {df_columns}
 
-        The user's query is: "{query}"
+def get_plan_cache_stats() -> dict:
+    """
+    Returns the plan cache hit/miss counters for this worker.
 
-        Based on the query, create a JSON object with keys corresponding to the
-        DataFrame columns and values to filter by.
+    Returns:
+        dict: The counters reported by the plan cache.
+    """
+    return plan_cache.stats()
 
-        - For the 'status' column, the possible values are 'late', 'due', and 'on-time'.
-        - For columns like 'city', 'category', or 'promise_description', the value should be a string to search for.
-        - If the query mentions a specific date or a date range for 'due_date', format it as a dictionary with operators like "$gt" (greater than), "$lt" (less than), or "$eq" (equal to).
 
-        Example 1:
-        Query: "show me all late promises in City A"
-        JSON: {{"status": "late", "city": "City A"}}
+def get_llm_call_stats() -> dict:
+    """
+    Returns the Gemini call counters and circuit breaker state for this worker.
 
-        Example 2:
-        Query: "what are the promises due after 2023"
-        JSON: {{"due_date": {{"$gt": "2023-12-31"}}}}
+    Returns:
+        dict: The counters reported by the LLM executor, plus "usage" with the
+        prompt and output tokens and wall time of the requests, and "batching"
+        with the micro-batching counters (None if batching is disabled), and
+        "provider" with the provider's name and counters.
+    """
+    stats = llm_executor.stats()
+    stats["usage"] = llm_usage.stats()
+    stats["batching"] = plan_batcher.stats() if plan_batcher is not None else None
+    stats["provider"] = dict(llm_provider.stats(), name=llm_provider.name)
+    return stats
 
-        Example 3:
-        Query: "search for infrastructure projects"
-        JSON: {{"category": "Infrastructure"}}
 
-        Now, generate the JSON for the user's query. Return only the JSON object.
-        """
+def invalidate_plan_cache(stale_only: bool = False) -> int:
+    """
+    Drops cached query plans, e.g. after changing the model or the prompt.
 
-        # Generate content and handle potential API errors
-        response = model.generate_content(prompt)
-        
-        # Clean the response to extract only the JSON part
-        # The model might return the JSON wrapped in markdown
-        json_response = response.text.strip().replace("```json", "").replace("```", "")
-        
-        # Parse the JSON string into a Python dictionary
-        return json.loads(json_response)
+    Args:
+        stale_only (bool): Only drop plans produced by another model or prompt version.
 
-    except json.JSONDecodeError as e:
-        print(f"Error decoding JSON from LLM response: {e}")
-        print(f"LLM Response was: {response.text}")
-        return {}
-    except Exception as e:
-        # This will catch other exceptions, such as connection errors or API issues
-        print(f"An unexpected error occurred while processing the LLM response: {e}")
-        return {}
+    Returns:
+        int: The number of shared cache entries removed.
+    """
+    return plan_cache.invalidate(stale_only=stale_only)
@@ -0,0 +1,266 @@
+"""
+This module runs LLM calls with deadlines, retries, a concurrency limit and a
+circuit breaker.
+
+Calls run on a small thread pool. The calling request waits at most until the
+call's deadline; a call that is still running at the deadline keeps its slot
+until the upstream request itself times out, so a hanging upstream can never
+occupy more than max_concurrency threads. Transient failures (timeouts,
+connection errors, 429 and 5xx responses) are retried with full-jitter
+exponential backoff while the deadline allows. Repeated failures open the
+circuit breaker, after which calls fail immediately with LLMUnavailableError
+until a probe call succeeds, so callers fall back to the local parser and
+cached plans instead of waiting on an unhealthy upstream.
+"""
+
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+from config import (
+    LLM_BACKOFF_MAX_SECONDS,
+    LLM_BACKOFF_SECONDS,
+    LLM_BREAKER_FAILURES,
+    LLM_BREAKER_RESET_SECONDS,
+    LLM_MAX_ATTEMPTS,
+    LLM_MAX_CONCURRENCY,
+    LLM_QUEUE_TIMEOUT_SECONDS,
+    LLM_TIMEOUT_SECONDS,
+)
+
+# HTTP status codes worth retrying (google.api_core errors carry them as .code)
+RETRYABLE_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+
+
+class LLMUnavailableError(Exception):
+    """Raised when the LLM cannot answer in time: circuit open, no free slot, deadline exceeded or retries exhausted."""
+
+
+def is_retryable(error):
+    """
+    Tells whether a failed call may succeed if repeated.
+
+    Args:
+        error (Exception): The error raised by the call.
+
+    Returns:
+        bool: True for timeouts, connection errors and 408/429/5xx responses.
+    """
+    # OSError covers timeouts and connection errors, including those raised by requests
+    if isinstance(error, OSError):
+        return True
+    code = getattr(error, "code", None)
+    return isinstance(code, int) and code in RETRYABLE_STATUS_CODES
+
+
+class CircuitBreaker:
+    """
+    Stops calls to an unhealthy upstream.
+
+    The breaker is closed while calls succeed. After failure_threshold
+    consecutive failures it opens and rejects calls for reset_seconds; then it
+    lets a single probe call through (half-open), closing again if the probe
+    succeeds and reopening if it fails.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half-open"
+
+    def __init__(self, failure_threshold=LLM_BREAKER_FAILURES, reset_seconds=LLM_BREAKER_RESET_SECONDS):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._lock = threading.Lock()
+        self._counters = {"opened": 0, "rejected": 0}
+
+    @property
+    def state(self):
+        """The current state: "closed", "open" or "half-open"."""
+        with self._lock:
+            return self._state
+
+    def allow(self):
+        """
+        Asks whether a call may go ahead. In the half-open state only one probe is admitted.
+
+        Returns:
+            bool: False if the call should fail fast.
+        """
+        with self._lock:
+            if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_seconds:
+                self._state = self.HALF_OPEN
+                return True
+            if self._state == self.CLOSED:
+                return True
+            self._counters["rejected"] += 1
+            return False
+
+    def record_success(self):
+        """Closes the breaker after a call reached the upstream."""
+        with self._lock:
+            self._state = self.CLOSED
+            self._failures = 0
+
+    def record_failure(self):
+        """Counts a failed call, opening the breaker at the threshold or after a failed probe."""
+        with self._lock:
+            self._failures += 1
+            if self._state == self.HALF_OPEN or (
+                self._state == self.CLOSED and self._failures >= self.failure_threshold
+            ):
+                self._state = self.OPEN
+                self._opened_at = time.monotonic()
+                self._counters["opened"] += 1
+
+    def stats(self):
+        """
+        Returns the breaker's state and counters.
+
+        Returns:
+            dict: "state", consecutive "failures", and how often it "opened" and "rejected" a call.
+        """
+        with self._lock:
+            return dict(self._counters, state=self._state, failures=self._failures)
+
+
+class LLMExecutor:
+    """
+    Runs LLM calls on a bounded thread pool with per-call deadlines and retries.
+
+    Attributes:
+        max_concurrency (int): Calls allowed in flight at once in this process.
+        timeout (float): Seconds from the start of a call, retries included, until it is abandoned.
+        max_attempts (int): Attempts per call, including the first.
+        breaker (CircuitBreaker): Fails calls fast while the upstream is unhealthy.
+    """
+
+    def __init__(
+        self,
+        max_concurrency=LLM_MAX_CONCURRENCY,
+        timeout=LLM_TIMEOUT_SECONDS,
+        max_attempts=LLM_MAX_ATTEMPTS,
+        backoff=LLM_BACKOFF_SECONDS,
+        backoff_max=LLM_BACKOFF_MAX_SECONDS,
+        queue_timeout=LLM_QUEUE_TIMEOUT_SECONDS,
+        breaker=None,
+    ):
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.backoff_max = backoff_max
+        self.queue_timeout = queue_timeout
+        self.breaker = breaker or CircuitBreaker()
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self._pool = None
+        self._pool_lock = threading.Lock()
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._counters = {"calls": 0, "succeeded": 0, "retries": 0, "timeouts": 0, "errors": 0, "rejected": 0}
+
+    def _get_pool(self):
+        # Created on first use, so a gunicorn master never forks with live pool threads
+        with self._pool_lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=self.max_concurrency, thread_name_prefix="llm")
+            return self._pool
+
+    def _count(self, name):
+        with self._lock:
+            self._counters[name] += 1
+
+    def _run(self, function, timeout):
+        with self._lock:
+            self._in_flight += 1
+        try:
+            return function(timeout)
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+            self._slots.release()
+
+    def _backoff_delay(self, attempt):
+        """Full jitter: a random delay up to the exponential backoff for the attempt."""
+        return random.uniform(0, min(self.backoff_max, self.backoff * 2 ** attempt))
+
+    def call(self, function, timeout=None):
+        """
+        Runs function(remaining_seconds) with retries until it succeeds or the deadline passes.
+
+        Args:
+            function (callable): Makes one upstream request. It receives the
+                seconds left until the deadline and should pass them on as the
+                request timeout.
+            timeout (float, optional): Overrides self.timeout for this call.
+
+        Returns:
+            The function's return value.
+
+        Raises:
+            LLMUnavailableError: If the circuit is open, no slot frees up in
+                time, or every attempt failed with a retryable error.
+            Exception: A non-retryable error from the function (e.g. a 400 response).
+        """
+        self._count("calls")
+        timeout = self.timeout if timeout is None else timeout
+        deadline = time.monotonic() + timeout
+        last_error = TimeoutError(f"no response within {timeout:.1f}s")
+        for attempt in range(self.max_attempts):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            if not self._slots.acquire(timeout=min(remaining, self.queue_timeout)):
+                self._count("rejected")
+                raise LLMUnavailableError(f"{self.max_concurrency} LLM calls already in flight")
+            if not self.breaker.allow():
+                self._slots.release()
+                self._count("rejected")
+                raise LLMUnavailableError("LLM circuit breaker is open")
+
+            future = self._get_pool().submit(self._run, function, remaining)
+            try:
+                result = future.result(timeout=remaining)
+            except FutureTimeoutError:
+                self._count("timeouts")
+                self.breaker.record_failure()
+                last_error = TimeoutError(f"no response within {remaining:.1f}s")
+                break
+            except Exception as e:
+                if not is_retryable(e):
+                    # The upstream answered; the request itself was at fault
+                    self.breaker.record_success()
+                    self._count("errors")
+                    raise
+                self.breaker.record_failure()
+                last_error = e
+            else:
+                self.breaker.record_success()
+                self._count("succeeded")
+                return result
+
+            delay = self._backoff_delay(attempt)
+            if attempt + 1 >= self.max_attempts or time.monotonic() + delay >= deadline:
+                break
+            self._count("retries")
+            time.sleep(delay)
+
+        self._count("errors")
+        raise LLMUnavailableError(f"LLM call failed: {last_error}")
+
+    def stats(self):
+        """
+        Returns the executor's counters for this process.
+
+        Returns:
+            dict: Calls, successes, retries, timeouts, errors, rejected calls,
+            the calls "in_flight" and the circuit breaker's stats.
+        """
+        with self._lock:
+            counters = dict(self._counters, in_flight=self._in_flight)
+        counters["breaker"] = self.breaker.stats()
+        return counters
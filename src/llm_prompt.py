@@ -0,0 +1,212 @@
+"""
+This module builds the Gemini prompt and turns the model's answer into a
+structured query.
+
+The prompt is kept short: the column names, the actual values of the
+low-cardinality columns (status, city, category) so the model can name them
+exactly, a few rules and the query. Instead of asking for free-form JSON, the
+request carries a response schema, so Gemini returns a plain JSON object of
+the form
+
+    {"conditions": [{"column": "status", "op": "eq", "value": "late"}, ...],
+     "any_of": [{"conditions": [...]}, ...]}
+
+where all "conditions" must hold and, if "any_of" is given, at least one of
+its groups as well. plan_from_response converts that into the structured
+query format understood by query_plan.compile_plan.
+"""
+
+import json
+import threading
+
+from config import LLM_PROMPT_MAX_VALUES
+
+# Columns whose distinct values are listed in the prompt
+VOCABULARY_COLUMNS = ("status", "city", "category")
+
+# Operators the model may use, mapped to structured query operators
+RESPONSE_OPERATORS = {
+    "contains": "$contains",
+    "eq": "$eq",
+    "ne": "$ne",
+    "in": "$in",
+    "gt": "$gt",
+    "gte": "$gte",
+    "lt": "$lt",
+    "lte": "$lte",
+    "between": "$between",
+}
+
+# Operators that take the "values" list instead of "value"
+LIST_OPERATORS = ("in", "between")
+
+PROMPT_RULES = """Rules:
+- Use "eq" or "in" with the exact listed values for status, city and category.
+- Use "contains" for words to search for in free text.
+- Dates are YYYY-MM-DD; "between" takes [start, end], inclusive.
+- Put alternatives ("late or in Boston") in any_of groups.
+- Leave out words that filter nothing, such as "show me" or "promises"."""
+
+_vocabulary_lock = threading.Lock()
+_vocabulary_cache = (None, None)
+
+
+def prompt_vocabulary(data_df, max_values=LLM_PROMPT_MAX_VALUES):
+    """
+    Collects the distinct values of the vocabulary columns, reusing the last result for the same DataFrame.
+
+    Args:
+        data_df (pd.DataFrame): The loaded promise data.
+        max_values (int): Columns with more distinct values are left out of the prompt.
+
+    Returns:
+        dict: column -> sorted list of values.
+    """
+    global _vocabulary_cache
+    with _vocabulary_lock:
+        cached_df, vocabulary = _vocabulary_cache
+        if cached_df is data_df:
+            return vocabulary
+
+    vocabulary = {}
+    for column in VOCABULARY_COLUMNS:
+        if column not in data_df.columns:
+            continue
+        values = sorted({str(value) for value in data_df[column].dropna().unique()})
+        if 0 < len(values) <= max_values:
+            vocabulary[column] = values
+
+    with _vocabulary_lock:
+        _vocabulary_cache = (data_df, vocabulary)
+    return vocabulary
+
+
+def _prompt_header(df_columns, vocabulary):
+    lines = [
+        "Convert queries about city promises into filter conditions on a table.",
+        f"Columns: {', '.join(df_columns)}",
+    ]
+    for column, values in (vocabulary or {}).items():
+        lines.append(f"{column} values: {', '.join(values)}")
+    lines.append(PROMPT_RULES)
+    return "\n".join(lines)
+
+
+def build_prompt(query, df_columns, vocabulary=None):
+    """
+    Builds the prompt for one natural language query.
+
+    Args:
+        query (str): The natural language query from the user.
+        df_columns (list): The columns of the DataFrame.
+        vocabulary (dict, optional): column -> values, from prompt_vocabulary.
+
+    Returns:
+        str: The prompt. The answer follows response_schema(df_columns).
+    """
+    return f"{_prompt_header(df_columns, vocabulary)}\nQuery: {json.dumps(query)}"
+
+
+def build_batch_prompt(queries, df_columns, vocabulary=None):
+    """
+    Builds one prompt for several natural language queries.
+
+    Args:
+        queries (list): The natural language queries.
+        df_columns (list): The columns of the DataFrame.
+        vocabulary (dict, optional): column -> values, from prompt_vocabulary.
+
+    Returns:
+        str: The prompt. The answer is an array with one object per query, in order.
+    """
+    numbered = "\n".join(f"{number}. {json.dumps(query)}" for number, query in enumerate(queries, 1))
+    return (
+        f"{_prompt_header(df_columns, vocabulary)}\n"
+        f"Answer with a JSON array of {len(queries)} objects, one per query, in order.\n"
+        f"Queries:\n{numbered}"
+    )
+
+
+def response_schema(df_columns, batch=False):
+    """
+    Builds the JSON schema Gemini's answer must follow.
+
+    Args:
+        df_columns (list): The columns conditions may refer to.
+        batch (bool): Describe an array of answers for a batch prompt.
+
+    Returns:
+        dict: An OpenAPI-style schema for the response_schema generation setting.
+    """
+    condition = {
+        "type": "object",
+        "properties": {
+            "column": {"type": "string", "format": "enum", "enum": list(df_columns)},
+            "op": {"type": "string", "format": "enum", "enum": list(RESPONSE_OPERATORS)},
+            "value": {"type": "string"},
+            "values": {"type": "array", "items": {"type": "string"}},
+        },
+        "required": ["column", "op"],
+    }
+    conditions = {"type": "array", "items": condition}
+    answer = {
+        "type": "object",
+        "properties": {
+            "conditions": conditions,
+            "any_of": {
+                "type": "array",
+                "items": {"type": "object", "properties": {"conditions": conditions}, "required": ["conditions"]},
+            },
+        },
+        "required": ["conditions"],
+    }
+    return {"type": "array", "items": answer} if batch else answer
+
+
+def _conditions_query(conditions):
+    """Turns a list of response conditions into a structured query (all must hold)."""
+    parts = []
+    for condition in conditions or []:
+        if not isinstance(condition, dict):
+            continue
+        column, op = condition.get("column"), condition.get("op")
+        if not column or op not in RESPONSE_OPERATORS:
+            continue
+        value = condition.get("values") if op in LIST_OPERATORS else condition.get("value")
+        if value is None or value == [] or value == "":
+            continue
+        parts.append((column, RESPONSE_OPERATORS[op], value))
+
+    structured_query = {}
+    for column, op, value in parts:
+        spec = structured_query.setdefault(column, {})
+        if op in spec:
+            # Two conditions with the same operator on one column need an explicit $and
+            return {"$and": [{column: {op: value}} for column, op, value in parts]}
+        spec[op] = value
+    return structured_query
+
+
+def plan_from_response(answer):
+    """
+    Converts a schema-constrained answer into a structured query.
+
+    Args:
+        answer (dict): The parsed response, following response_schema.
+
+    Returns:
+        dict: The structured query for query_plan.compile_plan; empty if the
+        answer holds no usable conditions.
+    """
+    if not isinstance(answer, dict):
+        return {}
+    structured_query = _conditions_query(answer.get("conditions"))
+    groups = [_conditions_query(group.get("conditions")) for group in answer.get("any_of") or [] if isinstance(group, dict)]
+    groups = [group for group in groups if group]
+    if not groups:
+        return structured_query
+    # A single group is not an alternative; it must simply hold as well
+    alternatives = groups[0] if len(groups) == 1 else {"$or": groups}
+    if not structured_query:
+        return alternatives
+    return {"$and": [structured_query, alternatives]}
@@ -0,0 +1,399 @@
+"""
+This module contains the providers that answer LLM query-planning requests.
+
+A provider turns a list of natural language queries into one answer per
+query, in the response schema of llm_prompt, with a single upstream request.
+llm.get_structured_query uses the provider selected by LLM_PROVIDER:
+
+    gemini  The Gemini API (requires GEMINI_API_KEY).
+    record  Gemini, with every query, its answer and the request's wall time
+            and token counts appended to a JSONL file (LLM_RECORD_PATH).
+    replay  Answers from such a recording without any network access, after a
+            delay drawn from the recorded wall times or a log-normal
+            distribution, failing a configurable share of requests with 503
+            errors or timeouts. Queries missing from the recording, or
+            recorded with another PROMPT_VERSION, get an answer without
+            conditions.
+
+Record a session against Gemini once, then replay it to load-test the app on
+an isolated machine with realistic LLM timing.
+"""
+
+import functools
+import json
+import math
+import os
+import random
+import threading
+import time
+
+from config import (
+    GEMINI_API_ENDPOINT,
+    GEMINI_MODEL,
+    LLM_PROVIDER,
+    LLM_RECORD_PATH,
+    LLM_REPLAY_ERROR_RATE,
+    LLM_REPLAY_LATENCY,
+    LLM_REPLAY_LATENCY_MEDIAN_SECONDS,
+    LLM_REPLAY_LATENCY_SIGMA,
+    LLM_REPLAY_PATH,
+    LLM_REPLAY_TIMEOUT_RATE,
+    PROMPT_VERSION,
+)
+from llm_prompt import build_batch_prompt, build_prompt, response_schema
+from plan_cache import normalize_query
+
+# Placeholder value shipped in the example .env file
+PLACEHOLDER_API_KEY = "YOUR_GEMINI_API_KEY"
+
+# The answer replayed for queries that are not in the recording
+MISSING_ANSWER = {"conditions": []}
+
+_genai = None
+_genai_lock = threading.Lock()
+
+
+def get_api_key():
+    """
+    Returns the configured Gemini API key.
+
+    Returns:
+        str or None: The key, or None if GEMINI_API_KEY is missing or still the placeholder.
+    """
+    api_key = os.environ.get("GEMINI_API_KEY")
+    if not api_key or api_key == PLACEHOLDER_API_KEY:
+        return None
+    return api_key
+
+
+class ProviderResponse:
+    """
+    The answers to one request.
+
+    Attributes:
+        answers (list): One schema answer (dict) per query, in order.
+        prompt_tokens (int): Tokens in the prompt, as counted by the upstream.
+        output_tokens (int): Tokens in the response.
+    """
+
+    def __init__(self, answers, prompt_tokens=0, output_tokens=0):
+        self.answers = answers
+        self.prompt_tokens = prompt_tokens
+        self.output_tokens = output_tokens
+
+
+class ProviderError(Exception):
+    """An error response from the upstream, with its HTTP status code (see llm_executor.is_retryable)."""
+
+    def __init__(self, code, message):
+        super().__init__(message)
+        self.code = code
+
+
+class LLMProvider:
+    """
+    Answers query-planning requests. Subclasses implement answer().
+    """
+
+    name = "base"
+
+    def is_available(self):
+        """Tells whether the provider can answer requests (e.g. it has its credentials)."""
+        return True
+
+    def answer(self, queries, df_columns, vocabulary, timeout):
+        """
+        Plans queries with one request.
+
+        Args:
+            queries (list): The natural language queries.
+            df_columns (list): The columns of the DataFrame.
+            vocabulary (dict): column -> values listed in the prompt.
+            timeout (float): Seconds the request may take.
+
+        Returns:
+            ProviderResponse: One answer per query.
+        """
+        raise NotImplementedError
+
+    def stats(self):
+        """Returns provider-specific counters."""
+        return {}
+
+
+def _parse_json(text):
+    """Parses a schema-constrained JSON response."""
+    try:
+        return json.loads(text)
+    except json.JSONDecodeError:
+        print(f"LLM Response was: {text}")
+        raise
+
+
+@functools.lru_cache(maxsize=16)
+def _generation_config(df_columns: tuple, batch: bool) -> dict:
+    """Asks for JSON following the response schema, so the answer needs no cleanup."""
+    return {"response_mime_type": "application/json", "response_schema": response_schema(df_columns, batch)}
+
+
+class GeminiProvider(LLMProvider):
+    """
+    Plans queries with the Gemini API.
+
+    google.generativeai is imported and configured on the first request, and
+    one GenerativeModel per process is reused for every request.
+    """
+
+    name = "gemini"
+
+    def __init__(self, model_name=GEMINI_MODEL, endpoint=GEMINI_API_ENDPOINT):
+        self.model_name = model_name
+        self.endpoint = endpoint
+        self._model = None
+
+    def is_available(self):
+        return get_api_key() is not None
+
+    def _get_genai(self):
+        """Imports and configures google.generativeai on first use."""
+        global _genai
+        if _genai is not None:
+            return _genai
+        with _genai_lock:
+            if _genai is None:
+                import google.generativeai as genai
+
+                if self.endpoint:
+                    # e.g. a local fake server; only the REST transport accepts plain http endpoints
+                    genai.configure(
+                        api_key=get_api_key(),
+                        transport="rest",
+                        client_options={"api_endpoint": self.endpoint},
+                    )
+                else:
+                    genai.configure(api_key=get_api_key())
+                _genai = genai
+        return _genai
+
+    def _get_model(self):
+        """Returns this process's GenerativeModel, created on first use."""
+        model = self._model
+        if model is not None and model[0] == os.getpid():
+            return model[1]
+        genai = self._get_genai()
+        with _genai_lock:
+            # A forked worker builds its own client rather than sharing the parent's connections
+            if self._model is None or self._model[0] != os.getpid():
+                self._model = (os.getpid(), genai.GenerativeModel(self.model_name))
+            return self._model[1]
+
+    def answer(self, queries, df_columns, vocabulary, timeout):
+        batch = len(queries) > 1
+        if batch:
+            prompt = build_batch_prompt(queries, df_columns, vocabulary)
+        else:
+            prompt = build_prompt(queries[0], df_columns, vocabulary)
+        response = self._get_model().generate_content(
+            prompt,
+            generation_config=_generation_config(tuple(df_columns), batch),
+            request_options={"timeout": timeout, "retry": None},
+        )
+        answers = _parse_json(response.text)
+        if batch and not isinstance(answers, list):
+            raise ValueError(f"expected a JSON array of {len(queries)} answers")
+        usage = getattr(response, "usage_metadata", None)
+        return ProviderResponse(
+            answers if batch else [answers],
+            getattr(usage, "prompt_token_count", 0) or 0,
+            getattr(usage, "candidates_token_count", 0) or 0,
+        )
+
+
+class RecordingProvider(LLMProvider):
+    """
+    Passes requests to another provider and appends each query and its answer to a JSONL file.
+
+    Each line holds the query, the answer, the request's wall time and token
+    counts, the batch it was part of and the model and prompt version.
+    """
+
+    name = "record"
+
+    def __init__(self, inner, path=LLM_RECORD_PATH):
+        self.inner = inner
+        self.path = path
+        self._lock = threading.Lock()
+        self._recorded = 0
+
+    def is_available(self):
+        return self.inner.is_available()
+
+    def answer(self, queries, df_columns, vocabulary, timeout):
+        start = time.perf_counter()
+        response = self.inner.answer(queries, df_columns, vocabulary, timeout)
+        seconds = time.perf_counter() - start
+
+        recorded_at = time.time()
+        lines = []
+        for batch_index, (query, answer) in enumerate(zip(queries, response.answers)):
+            lines.append(
+                json.dumps(
+                    {
+                        "query": query,
+                        "answer": answer,
+                        "seconds": round(seconds, 4),
+                        "batch_size": len(queries),
+                        "batch_index": batch_index,
+                        "prompt_tokens": response.prompt_tokens,
+                        "output_tokens": response.output_tokens,
+                        "model": GEMINI_MODEL,
+                        "prompt_version": PROMPT_VERSION,
+                        "recorded_at": recorded_at,
+                    }
+                )
+            )
+        try:
+            with self._lock:
+                os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write("\n".join(lines) + "\n")
+                self._recorded += len(lines)
+        except OSError as e:
+            print(f"Error recording LLM answers to {self.path}: {e}")
+        return response
+
+    def stats(self):
+        with self._lock:
+            return {"path": self.path, "recorded": self._recorded}
+
+
+class ReplayProvider(LLMProvider):
+    """
+    Answers from a recording made by RecordingProvider, with simulated latency and failures.
+
+    Attributes:
+        latency (str): "recorded" samples the recorded wall times (log-normal
+            if the recording has none), "lognormal" draws from a log-normal
+            distribution with the given median and sigma, "none" answers at once.
+        error_rate (float): Share of requests failed with a 503 error.
+        timeout_rate (float): Share of requests that never answer and time out.
+    """
+
+    name = "replay"
+
+    def __init__(
+        self,
+        path=LLM_REPLAY_PATH,
+        latency=LLM_REPLAY_LATENCY,
+        median_seconds=LLM_REPLAY_LATENCY_MEDIAN_SECONDS,
+        sigma=LLM_REPLAY_LATENCY_SIGMA,
+        error_rate=LLM_REPLAY_ERROR_RATE,
+        timeout_rate=LLM_REPLAY_TIMEOUT_RATE,
+        seed=None,
+    ):
+        self.path = path
+        self.latency = latency
+        self.median_seconds = median_seconds
+        self.sigma = sigma
+        self.error_rate = error_rate
+        self.timeout_rate = timeout_rate
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._counters = {"requests": 0, "hits": 0, "misses": 0, "errors": 0, "timeouts": 0}
+        self._answers, self._tokens, self._latencies = self._load(path)
+
+    @staticmethod
+    def _load(path):
+        """
+        Reads a recording into answers and token counts by normalized query, and request wall times.
+
+        Entries recorded with another PROMPT_VERSION are skipped: their answers
+        follow a prompt the app no longer sends.
+        """
+        answers, tokens, latencies = {}, {}, []
+        skipped = 0
+        try:
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue
+                    if entry.get("prompt_version") != PROMPT_VERSION:
+                        skipped += 1
+                        continue
+                    key = normalize_query(entry.get("query"))
+                    answers[key] = entry.get("answer") or MISSING_ANSWER
+                    tokens[key] = (entry.get("prompt_tokens", 0), entry.get("output_tokens", 0))
+                    if entry.get("batch_index", 0) == 0 and entry.get("seconds") is not None:
+                        latencies.append(float(entry["seconds"]))
+        except OSError as e:
+            print(f"Error reading LLM recording {path}, every query gets an empty answer: {e}")
+        if skipped:
+            print(f"Skipped {skipped} entries of {path} recorded with another prompt version than {PROMPT_VERSION}")
+        return answers, tokens, latencies
+
+    def _count(self, name, amount=1):
+        with self._lock:
+            self._counters[name] += amount
+
+    def _delay(self):
+        with self._lock:
+            if self.latency == "none":
+                return 0.0
+            if self.latency == "recorded" and self._latencies:
+                return self._random.choice(self._latencies)
+            return self.median_seconds * math.exp(self.sigma * self._random.gauss(0.0, 1.0))
+
+    def answer(self, queries, df_columns, vocabulary, timeout):
+        self._count("requests")
+        with self._lock:
+            roll = self._random.random()
+        if roll < self.timeout_rate:
+            self._count("timeouts")
+            time.sleep(timeout)
+            raise TimeoutError(f"replayed timeout after {timeout:.1f}s")
+        if roll < self.timeout_rate + self.error_rate:
+            self._count("errors")
+            raise ProviderError(503, "replayed error: the model is overloaded")
+
+        delay = self._delay()
+        if delay > timeout:
+            self._count("timeouts")
+            time.sleep(timeout)
+            raise TimeoutError(f"replayed timeout after {timeout:.1f}s")
+        time.sleep(delay)
+
+        answers, prompt_tokens, output_tokens = [], 0, 0
+        for query in queries:
+            key = normalize_query(query)
+            answer = self._answers.get(key)
+            self._count("hits" if answer is not None else "misses")
+            answers.append(answer if answer is not None else MISSING_ANSWER)
+            recorded_prompt, recorded_output = self._tokens.get(key, (0, 0))
+            prompt_tokens = max(prompt_tokens, recorded_prompt)
+            output_tokens += recorded_output
+        return ProviderResponse(answers, prompt_tokens, output_tokens)
+
+    def stats(self):
+        with self._lock:
+            return dict(self._counters, path=self.path, recorded_queries=len(self._answers))
+
+
+def create_provider(name=LLM_PROVIDER):
+    """
+    Creates the provider selected by LLM_PROVIDER.
+
+    Args:
+        name (str): "gemini", "record" or "replay".
+
+    Returns:
+        LLMProvider: The provider.
+    """
+    if name == "record":
+        return RecordingProvider(GeminiProvider())
+    if name == "replay":
+        return ReplayProvider()
+    if name != "gemini":
+        print(f"Unknown LLM_PROVIDER '{name}', using gemini.")
+    return GeminiProvider()
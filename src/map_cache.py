@@ -0,0 +1,153 @@
+"""
+This module contains a size-bounded cache of rendered map output.
+
+The persistent map document is loaded (or rendered) once at startup. Marker payloads are
+keyed by the structured plan that selected their rows plus the dataset version, so repeated
+and popular queries return the cached payload without regrouping the rows, and a
+lookup costs the same whatever the size of the result.
+The payload for the unfiltered data is prerendered at startup and never evicted.
+"""
+
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+
+from config import MAP_CACHE_MAX_BYTES
+from live_map import load_live_map, marker_payload
+from metrics import stage
+
+EMPTY_MAP_KEY = "empty"
+
+
+def map_cache_key(plan, version):
+    """
+    Builds the cache key for the map of a result set.
+
+    A plan selects the same rows from the same data version every time, so
+    the key never needs to look at the rows themselves.
+
+    Args:
+        plan (dict or None): The structured plan that selected the rows, or
+            None for the full dataset.
+        version (str): The dataset version stamp.
+
+    Returns:
+        str: "all|<version>" for the full dataset, otherwise a hex digest of
+        the plan and the version.
+    """
+    if plan is None:
+        return f"all|{version}"
+    payload = json.dumps(plan, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(f"{version}|{payload}".encode("utf-8")).hexdigest()
+
+
+class MapCache:
+    """
+    An LRU cache of marker payloads bounded by their total serialized size.
+    """
+
+    def __init__(self, max_bytes=MAP_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._pinned = {}
+        self._size = 0
+        self._live_map = None
+        self._lock = threading.Lock()
+        self._counters = {"hits": 0, "misses": 0, "evictions": 0}
+
+    def prerender(self, data_df, version):
+        """
+        Renders the persistent map document and the unfiltered payload once and pins them.
+
+        Args:
+            data_df (pd.DataFrame): The full promise data.
+            version (str): The dataset version stamp.
+        """
+        live_map = self._live_map if self._live_map is not None else load_live_map()
+        pinned = {EMPTY_MAP_KEY: marker_payload(data_df.iloc[0:0])}
+        if not data_df.empty:
+            pinned[map_cache_key(None, version)] = marker_payload(data_df)
+        with self._lock:
+            self._live_map = live_map
+            self._pinned.update(pinned)
+
+    def live_map(self):
+        """
+        Returns the persistent map document for the iframe's srcDoc.
+
+        Returns:
+            str: The map HTML, rendered once per worker.
+        """
+        if self._live_map is None:
+            self._live_map = load_live_map()
+        return self._live_map
+
+    def get_markers(self, data_df, version, plan=None):
+        """
+        Returns the marker payload for a result set, building it on a miss.
+
+        Args:
+            data_df (pd.DataFrame): The rows shown on the map.
+            version (str): The dataset version stamp.
+            plan (dict, optional): The structured plan that selected data_df
+                (QueryResult.plan); None if data_df is the full dataset.
+
+        Returns:
+            dict: The payload from live_map.marker_payload. Treat as read-only; it is shared.
+        """
+        key = EMPTY_MAP_KEY if data_df.empty else map_cache_key(plan, version)
+        with self._lock:
+            payload = self._pinned.get(key)
+            if payload is None:
+                entry = self._entries.get(key)
+                if entry is not None:
+                    self._entries.move_to_end(key)
+                    payload = entry[0]
+            if payload is not None:
+                self._counters["hits"] += 1
+                return payload
+            self._counters["misses"] += 1
+
+        with stage("map_render"):
+            payload = marker_payload(data_df)
+        self._store(key, payload, len(json.dumps(payload)))
+        return payload
+
+    def _store(self, key, payload, size):
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                return
+            self._entries[key] = (payload, size)
+            self._size += size
+            while self._size > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self._size -= evicted_size
+                self._counters["evictions"] += 1
+
+    def clear(self):
+        """Drops every cached and prerendered payload, e.g. after the data changes."""
+        with self._lock:
+            self._entries.clear()
+            self._pinned.clear()
+            self._size = 0
+
+    def stats(self):
+        """
+        Returns the cache counters for this worker.
+
+        Returns:
+            dict: Hits, misses, evictions, entry count, size in bytes and hit rate.
+        """
+        with self._lock:
+            counters = dict(self._counters)
+            counters["entries"] = len(self._entries)
+            counters["bytes"] = self._size
+        lookups = counters["hits"] + counters["misses"]
+        counters["hit_rate"] = counters["hits"] / lookups if lookups else 0.0
+        return counters
+
+
+map_cache = MapCache()
@@ -0,0 +1,112 @@
+"""
+This module reports the memory used by the app's worker processes.
+
+Figures come from /proc/<pid>/smaps_rollup (Linux). RSS counts every resident
+page a process maps, including pages shared with the gunicorn master and
+sibling workers; PSS splits each shared page evenly between the processes
+sharing it, so the sum of PSS over the master and its workers is the real
+footprint of the deployment. On other platforms the stats are unavailable.
+"""
+
+import os
+
+from flask import jsonify
+
+# smaps_rollup fields reported, in kB in the file and converted to bytes
+SMAPS_FIELDS = {
+    "Rss": "rss",
+    "Pss": "pss",
+    "Shared_Clean": "shared_clean",
+    "Shared_Dirty": "shared_dirty",
+    "Private_Clean": "private_clean",
+    "Private_Dirty": "private_dirty",
+}
+
+
+def process_memory(pid="self"):
+    """
+    Reads the memory figures of a process.
+
+    Args:
+        pid (int or str): The process id, or "self".
+
+    Returns:
+        dict or None: rss, pss, shared (clean + dirty), private (clean + dirty)
+        and the underlying smaps fields, in bytes. None if unavailable.
+    """
+    try:
+        with open(f"/proc/{pid}/smaps_rollup", encoding="ascii") as f:
+            lines = f.readlines()
+    except OSError:
+        return None
+
+    stats = {}
+    for line in lines:
+        name, _, value = line.partition(":")
+        if name in SMAPS_FIELDS:
+            stats[SMAPS_FIELDS[name]] = int(value.split()[0]) * 1024
+    if not stats:
+        return None
+    stats["shared"] = stats.get("shared_clean", 0) + stats.get("shared_dirty", 0)
+    stats["private"] = stats.get("private_clean", 0) + stats.get("private_dirty", 0)
+    return stats
+
+
+def _children(pid):
+    """Returns the child process ids of pid (e.g. the workers of a gunicorn master)."""
+    children = []
+    try:
+        for task in os.listdir(f"/proc/{pid}/task"):
+            with open(f"/proc/{pid}/task/{task}/children", encoding="ascii") as f:
+                children.extend(int(child) for child in f.read().split())
+    except OSError:
+        pass
+    return sorted(set(children))
+
+
+def worker_memory():
+    """
+    Collects the memory of this process, its parent and the parent's other children.
+
+    Under gunicorn the parent is the master and its children are the workers.
+
+    Returns:
+        dict: "pid" of the serving process, "master" and "workers" stats (each with
+        a "pid"), and "total_pss", the combined footprint. Stats are None where
+        /proc is not available.
+    """
+    master_pid = os.getppid()
+    workers = []
+    for pid in _children(master_pid) or [os.getpid()]:
+        stats = process_memory(pid)
+        if stats is not None:
+            workers.append(dict(stats, pid=pid))
+    master = process_memory(master_pid)
+    if master is not None:
+        master["pid"] = master_pid
+
+    total_pss = sum(w.get("pss", 0) for w in workers) + (master or {}).get("pss", 0)
+    return {"pid": os.getpid(), "master": master, "workers": workers, "total_pss": total_pss}
+
+
+def format_memory(stats):
+    """Formats process stats as a one-line summary in MB."""
+    if not stats:
+        return "memory stats unavailable"
+    return ", ".join(
+        f"{name} {stats.get(name, 0) / (1024 * 1024):.1f} MB" for name in ("rss", "pss", "shared", "private")
+    )
+
+
+def register_memory_routes(server):
+    """
+    Adds /stats/memory, which reports RSS, PSS, shared and private memory of
+    the gunicorn master and every worker.
+
+    Args:
+        server (flask.Flask): The Flask server behind the Dash app.
+    """
+
+    @server.route("/stats/memory")
+    def memory_stats():
+        return jsonify(worker_memory())
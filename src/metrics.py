@@ -0,0 +1,565 @@
+"""
+This module collects request, callback and stage timings and serves them at /metrics.
+
+Three kinds of measurements are kept, per worker process:
+
+    requests   The wall time and response size of every HTTP request,
+               labelled with its route and, for Dash callback requests, the
+               callback that served it.
+    callbacks  The time spent inside each Dash callback
+               (instrument_callback).
+    stages     The time spent in the internal steps of a query: planning,
+               the LLM call, filtering, map marker rendering, result
+               rendering and report writing (stage()).
+
+Counters that other modules already keep (plan, map and result cache hit
+rates, LLM call counts) are read with each snapshot and scrape, through
+collectors registered with register_stats. Everything is rendered in the Prometheus
+text exposition format without any extra dependency.
+
+Gunicorn runs several worker processes, and a scrape reaches only one of
+them. Each worker therefore writes a snapshot of its metrics to a file in
+METRICS_DIR every METRICS_FLUSH_SECONDS (and whenever it serves /metrics),
+and /metrics sums the counters and histograms of every worker's file. The
+counts of a worker that exited are merged into an archive file by the
+gunicorn master (mark_process_dead), so the totals never go down while the
+deployment runs; the directory is emptied when the server starts (reset).
+Gauges cannot be summed, so they are reported per live worker, labelled
+with its pid. With an empty METRICS_DIR each worker serves only its own
+series, labelled with its pid.
+
+With METRICS_LOG_REQUESTS, every request is also logged as one JSON line
+with its request id (the X-Request-ID header, or a generated one returned in
+that header), route, callback, status, duration, response size and the time
+spent in each stage.
+"""
+
+import bisect
+import functools
+import glob
+import json
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+from flask import Response, g, has_request_context, request
+
+from config import METRICS_DIR, METRICS_ENABLED, METRICS_FLUSH_SECONDS, METRICS_LOG_REQUESTS
+
+# Upper bounds of the duration buckets, in seconds
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+# Upper bounds of the size buckets, in bytes
+SIZE_BUCKETS = tuple(1024 * 4**power for power in range(8))  # 1 kB .. 16 MB
+
+METRIC_PREFIX = "promise_tracker"
+
+# Counts of exited workers, merged in by mark_process_dead
+ARCHIVE_FILE = "archive.json"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Histogram:
+    """
+    Counts observations in cumulative buckets, per combination of label values.
+
+    Attributes:
+        name (str): The metric name.
+        documentation (str): The HELP text.
+        labelnames (tuple): The names of the labels observe() takes.
+        buckets (tuple): Bucket upper bounds; +Inf is added.
+    """
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DURATION_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        """Records one observation, e.g. histogram.observe(0.2, route="/")."""
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        position = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][position] += 1
+            series[1] += value
+            series[2] += 1
+
+    def _copy(self):
+        with self._lock:
+            return {key: ([*counts], total, count) for key, (counts, total, count) in self._series.items()}
+
+    def snapshot(self):
+        """Returns the series as JSON-serializable [labels, bucket counts, sum, count] rows."""
+        return [[list(key), counts, total, count] for key, (counts, total, count) in self._copy().items()]
+
+    @staticmethod
+    def merge(snapshots):
+        """Sums snapshot() rows of several processes into one series dict."""
+        series = {}
+        for rows in snapshots:
+            for key, counts, total, count in rows:
+                merged = series.setdefault(tuple(key), [[0] * len(counts), 0.0, 0])
+                merged[0] = [a + b for a, b in zip(merged[0], counts)]
+                merged[1] += total
+                merged[2] += count
+        return series
+
+    def render(self, constant_labels, series=None):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        if series is None:
+            series = self._copy()
+        for key, (counts, total, count) in sorted(series.items()):
+            labels = constant_labels + list(zip(self.labelnames, key))
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                bucket_labels = _format_labels(labels + [("le", _format_value(bound))])
+                lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(labels)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(labels)} {count}")
+        return lines
+
+
+class Counter:
+    """A monotonically increasing count, per combination of label values."""
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def snapshot(self):
+        """Returns the values as JSON-serializable [labels, value] rows."""
+        with self._lock:
+            return [[list(key), value] for key, value in self._values.items()]
+
+    @staticmethod
+    def merge(snapshots):
+        """Sums snapshot() rows of several processes into one value dict."""
+        values = {}
+        for rows in snapshots:
+            for key, value in rows:
+                values[tuple(key)] = values.get(tuple(key), 0) + value
+        return values
+
+    def render(self, constant_labels, values=None):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        if values is None:
+            with self._lock:
+                values = dict(self._values)
+        for key, value in sorted(values.items()):
+            labels = constant_labels + list(zip(self.labelnames, key))
+            lines.append(f"{self.name}{_format_labels(labels)} {_format_value(value)}")
+        return lines
+
+
+class MetricsRegistry:
+    """
+    Holds the metrics of this process and renders them for /metrics.
+
+    Attributes:
+        directory (str): Where the worker snapshots are shared; empty to
+            serve only this process's metrics.
+        flush_seconds (float): How often a worker that served a request
+            writes its snapshot.
+    """
+
+    def __init__(self, directory=METRICS_DIR, flush_seconds=METRICS_FLUSH_SECONDS):
+        self.directory = directory
+        self.flush_seconds = flush_seconds
+        self._metrics = []
+        self._collectors = []
+        self._lock = threading.Lock()
+        self._flusher_pid = None
+        self._snapshot_name = None
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DURATION_BUCKETS):
+        """Creates and registers a Histogram named <METRIC_PREFIX>_<name>."""
+        histogram = Histogram(f"{METRIC_PREFIX}_{name}", documentation, labelnames, buckets)
+        with self._lock:
+            self._metrics.append(histogram)
+        return histogram
+
+    def counter(self, name, documentation, labelnames=()):
+        """Creates and registers a Counter named <METRIC_PREFIX>_<name>."""
+        counter = Counter(f"{METRIC_PREFIX}_{name}", documentation, labelnames)
+        with self._lock:
+            self._metrics.append(counter)
+        return counter
+
+    def register_stats(self, name, documentation, stats):
+        """
+        Exposes the numeric values of a stats dict as gauges, read on every scrape.
+
+        Args:
+            name (str): Gauges are named <METRIC_PREFIX>_<name>_<key>.
+            documentation (str): The HELP text, e.g. "Plan cache counters".
+            stats (callable): Returns a dict such as PlanCache.stats(); nested dicts are flattened.
+        """
+        with self._lock:
+            self._collectors.append((f"{METRIC_PREFIX}_{name}", documentation, stats))
+
+    def _gauges(self):
+        """Returns [name, documentation, key, value] rows read from the registered stats."""
+        with self._lock:
+            collectors = list(self._collectors)
+        gauges = []
+        for name, documentation, stats in collectors:
+            try:
+                values = list(_flatten(stats()))
+            except Exception as e:
+                print(f"Error collecting {name} metrics: {e}")
+                continue
+            gauges.extend([name, documentation, key, value] for key, value in values)
+        return gauges
+
+    @staticmethod
+    def _render_gauges(gauges_by_worker):
+        lines = []
+        documented = set()
+        rows = sorted(
+            (name, key, pid, documentation, value)
+            for pid, gauges in gauges_by_worker.items()
+            for name, documentation, key, value in gauges
+        )
+        for name, key, pid, documentation, value in rows:
+            if (name, key) not in documented:
+                documented.add((name, key))
+                lines.append(f"# HELP {name}_{key} {documentation}: {key}")
+                lines.append(f"# TYPE {name}_{key} gauge")
+            lines.append(f"{name}_{key}{_format_labels([('worker', pid)])} {_format_value(value)}")
+        return lines
+
+    def snapshot(self):
+        """
+        Returns the state of this process's metrics.
+
+        Returns:
+            dict: The pid, each metric's snapshot() rows by name and the gauges.
+        """
+        with self._lock:
+            metrics = list(self._metrics)
+        return {
+            "pid": os.getpid(),
+            "metrics": {metric.name: metric.snapshot() for metric in metrics},
+            "gauges": self._gauges(),
+        }
+
+    def write_snapshot(self):
+        """Writes this process's snapshot to <pid>-<start>.json in the shared directory."""
+        if not self.directory:
+            return
+        with self._lock:
+            if self._snapshot_name is None or not self._snapshot_name.startswith(f"{os.getpid()}-"):
+                # The start time tells a new worker apart from an exited one with the same pid
+                self._snapshot_name = f"{os.getpid()}-{time.time_ns()}.json"
+            name = self._snapshot_name
+        try:
+            _write_json(os.path.join(self.directory, name), self.snapshot())
+        except (OSError, TypeError, ValueError) as e:
+            print(f"Error writing metrics snapshot: {e}")
+
+    def start_flushing(self):
+        """Starts the thread that writes this process's snapshot periodically, once per process."""
+        if not self.directory:
+            return
+        with self._lock:
+            if self._flusher_pid == os.getpid():
+                return
+            self._flusher_pid = os.getpid()
+
+        def flush():
+            while True:
+                time.sleep(self.flush_seconds)
+                self.write_snapshot()
+
+        threading.Thread(target=flush, name="metrics-flush", daemon=True).start()
+
+    def render(self):
+        """
+        Renders every metric in the Prometheus text exposition format.
+
+        With a shared directory, the counters and histograms are summed over
+        every worker of the deployment and the gauges are listed per live worker.
+
+        Returns:
+            str: The exposition, ending with a newline.
+        """
+        if self.directory:
+            return self._render_shared()
+        constant_labels = [("worker", os.getpid())]
+        with self._lock:
+            metrics = list(self._metrics)
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render(constant_labels))
+        lines.extend(self._render_gauges({os.getpid(): self._gauges()}))
+        return "\n".join(lines) + "\n"
+
+    def _render_shared(self):
+        self.write_snapshot()
+        workers = {}
+        for path in glob.glob(os.path.join(self.directory, "*-*.json")):
+            snapshot = _read_json(path)
+            if snapshot is not None:
+                workers[os.path.basename(path)] = snapshot
+        # Read after the snapshots: a snapshot archived in between is then skipped, not counted twice
+        archive = _read_json(os.path.join(self.directory, ARCHIVE_FILE)) or {}
+        archived = set(archive.get("snapshots", []))
+        snapshots = [archive]
+        gauges_by_worker = {}
+        for name, snapshot in workers.items():
+            if name in archived:
+                continue
+            snapshots.append(snapshot)
+            if _process_alive(snapshot.get("pid")):
+                gauges_by_worker[snapshot["pid"]] = snapshot.get("gauges", [])
+
+        with self._lock:
+            metrics = list(self._metrics)
+        lines = []
+        for metric in metrics:
+            merged = metric.merge(snapshot.get("metrics", {}).get(metric.name, []) for snapshot in snapshots)
+            lines.extend(metric.render([], merged))
+        lines.extend(self._render_gauges(gauges_by_worker))
+        return "\n".join(lines) + "\n"
+
+    def reset(self):
+        """
+        Removes the snapshots of a previous run; call once when the server
+        starts, before any worker is forked.
+        """
+        if not self.directory:
+            return
+        for path in glob.glob(os.path.join(self.directory, "*.json*")):
+            try:
+                os.remove(path)
+            except OSError as e:
+                print(f"Error removing metrics snapshot {path}: {e}")
+
+    def mark_process_dead(self, pid):
+        """
+        Merges the counters and histograms of an exited worker into the archive
+        and removes its snapshot. Call from the gunicorn master (child_exit),
+        which is the only writer of the archive.
+
+        Args:
+            pid (int): The pid of the exited worker.
+        """
+        if not self.directory:
+            return
+        archive_path = os.path.join(self.directory, ARCHIVE_FILE)
+        with self._lock:
+            metrics = list(self._metrics)
+        for path in glob.glob(os.path.join(self.directory, f"{pid}-*.json")):
+            snapshot = _read_json(path)
+            if snapshot is None:
+                continue
+            archive = _read_json(archive_path) or {"metrics": {}, "snapshots": []}
+            merged = {}
+            for metric in metrics:
+                rows = [archive["metrics"].get(metric.name, []), snapshot.get("metrics", {}).get(metric.name, [])]
+                merged[metric.name] = [
+                    [list(key), *(value if isinstance(value, list) else [value])]
+                    for key, value in metric.merge(rows).items()
+                ]
+            archive = {"metrics": merged, "snapshots": archive["snapshots"] + [os.path.basename(path)]}
+            try:
+                # The archive lists the snapshot before it is removed, so a scrape never misses it
+                _write_json(archive_path, archive)
+                os.remove(path)
+            except OSError as e:
+                print(f"Error archiving metrics snapshot {path}: {e}")
+
+
+def _write_json(path, data):
+    """Writes data to path atomically, so readers never see a partial file."""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(temp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, separators=(",", ":"))
+    os.replace(temp_path, path)
+
+
+def _read_json(path):
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        # Removed by mark_process_dead between listing and reading it
+        return None
+
+
+def _process_alive(pid):
+    try:
+        os.kill(int(pid), 0)
+    except PermissionError:
+        return True
+    except (OSError, TypeError, ValueError):
+        return False
+    return True
+
+
+def _flatten(stats, prefix=""):
+    """Yields (key, number) for the numeric values of a possibly nested stats dict."""
+    for key, value in (stats or {}).items():
+        key = f"{prefix}{key}".replace("-", "_").replace(".", "_")
+        if isinstance(value, bool):
+            yield key, int(value)
+        elif isinstance(value, (int, float)):
+            yield key, value
+        elif isinstance(value, dict):
+            yield from _flatten(value, f"{key}_")
+
+
+# Without /metrics nothing reads the snapshots, so none are written
+metrics = MetricsRegistry(METRICS_DIR if METRICS_ENABLED else "")
+
+request_seconds = metrics.histogram(
+    "request_seconds", "Wall time of HTTP requests", ("route", "callback")
+)
+response_bytes = metrics.histogram(
+    "response_bytes", "Size of HTTP response bodies", ("route", "callback"), SIZE_BUCKETS
+)
+requests_total = metrics.counter("requests_total", "HTTP requests by status", ("route", "status"))
+callback_seconds = metrics.histogram("callback_seconds", "Time spent inside Dash callbacks", ("callback",))
+stage_seconds = metrics.histogram("stage_seconds", "Time spent in internal query stages", ("stage",))
+
+
+@contextmanager
+def stage(name):
+    """
+    Times an internal stage, e.g. ``with stage("filter"): ...``.
+
+    The duration is observed in stage_seconds and, inside a request, added to
+    that request's log record. Works in background threads too.
+
+    Args:
+        name (str): The stage name.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        stage_seconds.observe(elapsed, stage=name)
+        if has_request_context():
+            stages = g.setdefault("metrics_stages", {})
+            stages[name] = stages.get(name, 0.0) + elapsed
+
+
+def instrument_callback(function):
+    """
+    Times a Dash callback and labels the request it serves. Apply below @app.callback.
+
+    Args:
+        function (callable): The callback.
+
+    Returns:
+        callable: The wrapped callback.
+    """
+    name = function.__name__
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        if has_request_context():
+            g.metrics_callback = name
+        start = time.perf_counter()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            callback_seconds.observe(time.perf_counter() - start, callback=name)
+
+    return wrapper
+
+
+def current_request_id():
+    """
+    Returns the id of the request being served.
+
+    Returns:
+        str or None: The request id, or None outside a request.
+    """
+    return g.get("request_id") if has_request_context() else None
+
+
+def register_metrics_routes(server, log_requests=METRICS_LOG_REQUESTS):
+    """
+    Times every request and adds /metrics, which serves the metrics of every worker.
+
+    Args:
+        server (flask.Flask): The Flask server behind the Dash app.
+        log_requests (bool): Also log each request as a JSON line.
+    """
+
+    @server.before_request
+    def start_request_timer():
+        metrics.start_flushing()
+        g.request_id = request.headers.get("X-Request-ID") or uuid.uuid4().hex
+        g.metrics_start = time.perf_counter()
+
+    @server.after_request
+    def record_request(response):
+        start = g.get("metrics_start")
+        if start is None:
+            return response
+        elapsed = time.perf_counter() - start
+        route = request.url_rule.rule if request.url_rule is not None else "unmatched"
+        callback = g.get("metrics_callback", "")
+        # Streamed responses (reports, exports) have no length up front
+        size = None if response.is_streamed else response.calculate_content_length()
+
+        request_seconds.observe(elapsed, route=route, callback=callback)
+        if size is not None:
+            response_bytes.observe(size, route=route, callback=callback)
+        requests_total.inc(route=route, status=response.status_code)
+        response.headers["X-Request-ID"] = g.request_id
+
+        if log_requests:
+            record = {
+                "event": "request",
+                "request_id": g.request_id,
+                "method": request.method,
+                "route": route,
+                "callback": callback or None,
+                "status": response.status_code,
+                "seconds": round(elapsed, 4),
+                "response_bytes": size,
+                "stages": {name: round(seconds, 4) for name, seconds in g.get("metrics_stages", {}).items()},
+                "worker": os.getpid(),
+            }
+            print(json.dumps(record), flush=True)
+        return response
+
+    @server.route("/metrics")
+    def prometheus_metrics():
+        return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
@@ -0,0 +1,316 @@
+"""
+This module contains helpers for the server-side paged Results and Tabular views.
+
+Only the rows on the visible page are turned into components. Sorting and
+column filtering from the DataTable are applied on the server using column
+arrays, so large result sets never cross the wire in full. The resulting row
+order is cached per result, sort and filter (TableViewCache), so changing
+pages only extracts the rows of the new page.
+"""
+
+import json
+import math
+import re
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from config import TABLE_VIEW_CACHE_SIZE
+from query_plan import compile_plan
+
+# DataTable filter operators (with and without the i/s case prefixes) mapped to plan operators
+FILTER_OPERATORS = {
+    "contains": "$contains",
+    "=": "$eq",
+    "eq": "$eq",
+    "!=": "$ne",
+    "ne": "$ne",
+    ">": "$gt",
+    "gt": "$gt",
+    ">=": "$gte",
+    "ge": "$gte",
+    "<": "$lt",
+    "lt": "$lt",
+    "<=": "$lte",
+    "le": "$lte",
+    "datestartswith": "datestartswith",
+}
+
+# DataTable column types; typed columns get the matching filter operators
+# (e.g. "2025-11" on a datetime column is sent as datestartswith, not contains)
+TABLE_COLUMN_TYPES = {
+    "due_date": "datetime",
+    "latitude": "numeric",
+    "longitude": "numeric",
+}
+
+DATE_PREFIX_PATTERN = re.compile(r"^\d{4}(-\d{1,2}){0,2}$")
+
+FILTER_PART_PATTERN = re.compile(r"^\{(?P<column>[^}]+)\}\s+(?P<operator>\S+)\s+(?P<value>.+)$")
+
+
+def table_columns(columns):
+    """
+    Builds the DataTable column definitions.
+
+    Args:
+        columns (list): The column ids, e.g. TABLE_COLUMNS.
+
+    Returns:
+        list: One {"name", "id"[, "type"]} dict per column.
+    """
+    definitions = []
+    for column in columns:
+        definition = {"name": column.replace("_", " ").title(), "id": column}
+        if column in TABLE_COLUMN_TYPES:
+            definition["type"] = TABLE_COLUMN_TYPES[column]
+        definitions.append(definition)
+    return definitions
+
+
+def page_count(n_rows, page_size):
+    """
+    Returns the number of pages needed for n_rows (at least 1).
+
+    Args:
+        n_rows (int): The number of rows.
+        page_size (int): Rows per page.
+
+    Returns:
+        int: The page count.
+    """
+    return max(1, math.ceil(n_rows / page_size))
+
+
+def page_bounds(n_rows, page_index, page_size):
+    """
+    Returns the (start, stop) row positions of a zero-based page, clamped to the data.
+
+    Args:
+        n_rows (int): The number of rows.
+        page_index (int): The zero-based page number.
+        page_size (int): Rows per page.
+
+    Returns:
+        tuple: (start, stop) suitable for slicing.
+    """
+    last_page = page_count(n_rows, page_size) - 1
+    page_index = min(max(page_index or 0, 0), last_page)
+    start = page_index * page_size
+    return start, min(start + page_size, n_rows)
+
+
+def _strip_quotes(value):
+    value = value.strip()
+    if len(value) >= 2 and value[0] == value[-1] and value[0] in "\"'`":
+        return value[1:-1]
+    return value
+
+
+def _date_prefix_range(prefix):
+    """Turns a date prefix such as "2025", "2025-11" or "2025-11-20" into an inclusive range."""
+    parts = prefix.split("-")
+    start = pd.Timestamp(prefix if len(parts) == 3 else "-".join(parts + ["01"] * (3 - len(parts))))
+    if len(parts) == 1:
+        end = start + pd.offsets.YearEnd(0)
+    elif len(parts) == 2:
+        end = start + pd.offsets.MonthEnd(0)
+    else:
+        end = start
+    return [start.strftime("%Y-%m-%d"), end.strftime("%Y-%m-%d")]
+
+
+def parse_table_filter(filter_query):
+    """
+    Converts a DataTable filter_query into a structured query for compile_plan.
+
+    Args:
+        filter_query (str): e.g. '{city} icontains "Bos" && {due_date} > 2025-11-01'.
+
+    Returns:
+        dict: Structured query conditions (empty if there is no filter).
+
+    Raises:
+        ValueError: If part of the filter cannot be understood.
+    """
+    structured_query = {}
+    if not filter_query:
+        return structured_query
+
+    for part in filter_query.split(" && "):
+        match = FILTER_PART_PATTERN.match(part.strip())
+        if not match:
+            raise ValueError(f"Unsupported filter '{part}'.")
+        column = match.group("column")
+        operator = match.group("operator").lower()
+        if operator not in FILTER_OPERATORS and operator[:1] in ("i", "s"):
+            operator = operator[1:]
+        if operator not in FILTER_OPERATORS:
+            raise ValueError(f"Unsupported filter operator '{operator}'.")
+        value = _strip_quotes(match.group("value"))
+
+        plan_operator = FILTER_OPERATORS[operator]
+        if plan_operator == "$contains" and TABLE_COLUMN_TYPES.get(column) == "datetime":
+            # Text typed into a date column's filter box matches dates starting with it
+            if not DATE_PREFIX_PATTERN.match(value):
+                raise ValueError(f"Enter a date such as 2025, 2025-11 or 2025-11-20 to filter '{column}'.")
+            plan_operator = "datestartswith"
+        if plan_operator == "datestartswith":
+            condition = {"$between": _date_prefix_range(value)}
+        elif plan_operator == "$contains":
+            # Table filters are literal text, not regular expressions
+            condition = {"$contains": re.escape(value)}
+        else:
+            condition = {plan_operator: value}
+        structured_query.setdefault(column, {}).update(condition)
+
+    return structured_query
+
+
+def sort_positions(data_df, sort_by):
+    """
+    Returns the row order for a DataTable sort_by specification.
+
+    Args:
+        data_df (pd.DataFrame): The rows being displayed.
+        sort_by (list): DataTable sort_by entries ({"column_id": ..., "direction": ...}).
+
+    Returns:
+        np.ndarray: Row positions in display order.
+    """
+    if not sort_by:
+        return np.arange(len(data_df))
+
+    keys = []
+    for entry in sort_by:
+        column = entry.get("column_id")
+        if column not in data_df.columns:
+            continue
+        # Dense sort codes let np.lexsort order any dtype, including categoricals and dates
+        codes = pd.factorize(data_df[column], sort=True)[0].astype(np.int64)
+        missing = codes < 0
+        if entry.get("direction") == "desc":
+            codes = -codes
+        codes[missing] = np.iinfo(np.int64).max  # missing values last in either direction
+        keys.append(codes)
+
+    if not keys:
+        return np.arange(len(data_df))
+    # np.lexsort treats the last key as the primary one
+    return np.lexsort(keys[::-1])
+
+
+def column_page(data_df, positions, columns):
+    """
+    Extracts the page rows as display-ready column arrays.
+
+    Args:
+        data_df (pd.DataFrame): The rows being displayed.
+        positions (np.ndarray): Row positions on the page.
+        columns (list): The columns to extract.
+
+    Returns:
+        dict: column -> NumPy array of values (dates formatted as YYYY-MM-DD).
+    """
+    page = {}
+    for column in columns:
+        if column not in data_df.columns:
+            continue
+        series = data_df[column]
+        if pd.api.types.is_datetime64_any_dtype(series):
+            page[column] = series.iloc[positions].dt.strftime("%Y-%m-%d").to_numpy()
+        else:
+            page[column] = series.iloc[positions].to_numpy()
+    return page
+
+
+def table_records(page):
+    """
+    Turns column arrays from column_page into DataTable records.
+
+    Args:
+        page (dict): column -> array of values.
+
+    Returns:
+        list: One dict per row.
+    """
+    columns = list(page)
+    if not columns:
+        return []
+    return [dict(zip(columns, values)) for values in zip(*(page[c].tolist() for c in columns))]
+
+
+class TableViewCache:
+    """
+    An LRU cache of Tabular View row orders, keyed by the dataset version,
+    the result id, the sort and the column filters.
+    """
+
+    def __init__(self, max_entries=TABLE_VIEW_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._counters = {"hits": 0, "misses": 0}
+
+    def positions(self, result, version, sort_by, filter_query):
+        """
+        Returns the rows of a result to display, in display order.
+
+        Args:
+            result (QueryResult): The result shown in the table.
+            version (str): The dataset version stamp.
+            sort_by (list): DataTable sort_by entries.
+            filter_query (str): The DataTable filter_query.
+
+        Returns:
+            np.ndarray: Positions into result.df, filtered and sorted.
+
+        Raises:
+            ValueError: If the column filters cannot be parsed.
+        """
+        key = (version, result.result_id, json.dumps(sort_by or [], sort_keys=True), filter_query or "")
+        with self._lock:
+            positions = self._entries.get(key)
+            if positions is not None:
+                self._entries.move_to_end(key)
+                self._counters["hits"] += 1
+                return positions
+            self._counters["misses"] += 1
+
+        data_df = result.df
+        table_query = parse_table_filter(filter_query)
+        if table_query:
+            rows = np.flatnonzero(compile_plan(table_query, data_df).evaluate(data_df))
+            positions = rows[sort_positions(data_df.iloc[rows], sort_by)]
+        else:
+            positions = sort_positions(data_df, sort_by)
+
+        with self._lock:
+            self._entries[key] = positions
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return positions
+
+    def clear(self):
+        """Drops every cached row order."""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """
+        Returns the cache counters for this worker.
+
+        Returns:
+            dict: Hits, misses, entry count and hit rate.
+        """
+        with self._lock:
+            counters = dict(self._counters)
+            counters["entries"] = len(self._entries)
+        lookups = counters["hits"] + counters["misses"]
+        counters["hit_rate"] = counters["hits"] / lookups if lookups else 0.0
+        return counters
+
+
+table_view_cache = TableViewCache()
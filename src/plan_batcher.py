@@ -0,0 +1,129 @@
+"""
+This module combines concurrent requests into micro-batches.
+
+The first caller to arrive opens a batch and waits up to window_seconds for
+others to join; the batch closes early once it holds max_batch_size distinct
+items. The opening caller then runs the whole batch with one call and hands
+each waiting caller its own result, so a burst of N queries costs one
+upstream round trip instead of N. A caller that finds the batch full starts
+the next one.
+
+Batches are kept apart by a group key (e.g. the DataFrame columns a prompt
+is built for), and identical items in one batch are sent once.
+"""
+
+import threading
+
+from config import LLM_BATCH_MAX_SIZE, LLM_BATCH_WINDOW_SECONDS, LLM_TIMEOUT_SECONDS
+
+
+class _Batch:
+    """The items of one batch and, once it has run, their results."""
+
+    def __init__(self, group_key):
+        self.group_key = group_key
+        self.items = []
+        self.full = threading.Event()
+        self.done = threading.Event()
+        self.results = None
+        self.error = None
+
+
+class MicroBatcher:
+    """
+    Runs items submitted within a short window together through run_batch.
+
+    run_batch(group_key, items) must return one result per item, in order; an
+    exception it raises is raised to every caller in the batch.
+
+    Attributes:
+        window_seconds (float): How long the first item of a batch waits for others.
+        max_batch_size (int): Distinct items after which a batch runs without waiting.
+        wait_timeout (float): How long a caller waits for its batch to finish,
+            on top of the window, before giving up with a TimeoutError.
+    """
+
+    def __init__(
+        self,
+        run_batch,
+        window_seconds=LLM_BATCH_WINDOW_SECONDS,
+        max_batch_size=LLM_BATCH_MAX_SIZE,
+        wait_timeout=LLM_TIMEOUT_SECONDS,
+    ):
+        self.run_batch = run_batch
+        self.window_seconds = window_seconds
+        self.max_batch_size = max_batch_size
+        self.wait_timeout = wait_timeout
+        self._open = {}
+        self._lock = threading.Lock()
+        self._counters = {"items": 0, "batches": 0, "batched_items": 0, "largest_batch": 0}
+
+    def submit(self, group_key, item):
+        """
+        Adds an item to the open batch of its group and waits for its result.
+
+        Args:
+            group_key (hashable): Items with different keys never share a batch.
+            item (hashable): The item to run.
+
+        Returns:
+            The result run_batch produced for the item.
+
+        Raises:
+            TimeoutError: If the batch did not finish in time.
+            Exception: Whatever run_batch raised for the batch.
+        """
+        with self._lock:
+            self._counters["items"] += 1
+            batch = self._open.get(group_key)
+            leader = batch is None
+            if leader:
+                batch = _Batch(group_key)
+                self._open[group_key] = batch
+            if item not in batch.items:
+                batch.items.append(item)
+            if len(batch.items) >= self.max_batch_size:
+                # Later items start a new batch; the leader stops waiting
+                del self._open[group_key]
+                batch.full.set()
+
+        if leader:
+            batch.full.wait(self.window_seconds)
+            with self._lock:
+                if self._open.get(group_key) is batch:
+                    del self._open[group_key]
+            self._run(batch)
+        elif not batch.done.wait(self.window_seconds + self.wait_timeout):
+            raise TimeoutError(f"batch of {len(batch.items)} items did not finish in time")
+
+        if batch.error is not None:
+            raise batch.error
+        return batch.results[batch.items.index(item)]
+
+    def _run(self, batch):
+        try:
+            results = self.run_batch(batch.group_key, list(batch.items))
+            if len(results) != len(batch.items):
+                raise ValueError(f"expected {len(batch.items)} results, got {len(results)}")
+            batch.results = results
+        except Exception as e:
+            batch.error = e
+        finally:
+            batch.done.set()
+            with self._lock:
+                self._counters["batches"] += 1
+                self._counters["batched_items"] += len(batch.items)
+                self._counters["largest_batch"] = max(self._counters["largest_batch"], len(batch.items))
+
+    def stats(self):
+        """
+        Returns the batching counters for this process.
+
+        Returns:
+            dict: Items submitted, batches run, distinct items sent, the largest
+            batch and the average batch size.
+        """
+        with self._lock:
+            counters = dict(self._counters)
+        counters["average_batch"] = counters["batched_items"] / counters["batches"] if counters["batches"] else 0.0
+        return counters
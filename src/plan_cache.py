@@ -0,0 +1,268 @@
+"""
+This module contains a two-tier cache for structured query plans returned by the LLM.
+
+The first tier is an in-process LRU with a time-to-live. The second tier is a
+SQLite file on disk, so every gunicorn worker on the same instance can reuse
+plans produced by the others.
+"""
+
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from config import (
+    GEMINI_MODEL,
+    LLM_PROVIDER,
+    PROMPT_VERSION,
+    PLAN_CACHE_ENABLED,
+    PLAN_CACHE_MAX_ENTRIES,
+    PLAN_CACHE_TTL_SECONDS,
+    PLAN_CACHE_PATH,
+)
+
+
+def normalize_query(query):
+    """
+    Normalizes a natural language query so trivially different phrasings share a cache entry.
+
+    Args:
+        query (str): The natural language query.
+
+    Returns:
+        str: The lower-cased query with collapsed whitespace and no trailing punctuation.
+    """
+    text = re.sub(r"\s+", " ", (query or "").strip().lower())
+    return text.rstrip(" ?.!")
+
+
+def make_cache_key(
+    query, df_columns, vocabulary=None, provider=LLM_PROVIDER, model=GEMINI_MODEL, prompt_version=PROMPT_VERSION
+):
+    """
+    Builds the cache key for a query plan.
+
+    The vocabulary listed in the prompt is part of the key, so plans made
+    before a data reload added or removed a city, category or status are
+    not served for the new data. So is the provider, so answers replayed
+    from a recording never reach the queries of a Gemini-backed app that
+    shares the cache file.
+
+    Args:
+        query (str): The natural language query.
+        df_columns (list): The list of columns in the DataFrame.
+        vocabulary (dict, optional): column -> values listed in the prompt.
+        provider (str): The name of the LLM provider that produces the plan.
+        model (str): The Gemini model that produces the plan.
+        prompt_version (str): The version of the prompt sent to the model.
+
+    Returns:
+        str: A hex digest identifying the plan.
+    """
+    vocabulary = sorted((str(column), list(values)) for column, values in (vocabulary or {}).items())
+    payload = json.dumps(
+        [normalize_query(query), list(df_columns), vocabulary, provider, model, prompt_version],
+        separators=(",", ":"),
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class PlanCache:
+    """
+    An LRU + TTL memory cache backed by a shared SQLite table.
+
+    Entries are stored as JSON strings so callers always get a fresh dict
+    they are free to mutate.
+    """
+
+    def __init__(
+        self,
+        db_path=PLAN_CACHE_PATH,
+        max_entries=PLAN_CACHE_MAX_ENTRIES,
+        ttl_seconds=PLAN_CACHE_TTL_SECONDS,
+        model=GEMINI_MODEL,
+        prompt_version=PROMPT_VERSION,
+    ):
+        self.db_path = db_path
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.model = model
+        self.prompt_version = prompt_version
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._counters = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "stores": 0, "errors": 0}
+
+    # --- SQLite tier ---
+    def _connection(self):
+        """Returns a SQLite connection owned by the current thread and process."""
+        conn = getattr(self._local, "conn", None)
+        if conn is not None and getattr(self._local, "pid", None) == os.getpid():
+            return conn
+
+        os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+        conn = sqlite3.connect(self.db_path, timeout=5)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS query_plans (
+                cache_key TEXT PRIMARY KEY,
+                plan TEXT NOT NULL,
+                model TEXT NOT NULL,
+                prompt_version TEXT NOT NULL,
+                created_at REAL NOT NULL
+            )
+            """
+        )
+        conn.commit()
+        self._local.conn = conn
+        self._local.pid = os.getpid()
+        return conn
+
+    def _disk_get(self, key):
+        row = self._connection().execute(
+            "SELECT plan, created_at FROM query_plans WHERE cache_key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return None, None
+        return row[0], row[1]
+
+    def _disk_set(self, key, plan_json, created_at):
+        conn = self._connection()
+        conn.execute(
+            "INSERT OR REPLACE INTO query_plans (cache_key, plan, model, prompt_version, created_at) "
+            "VALUES (?, ?, ?, ?, ?)",
+            (key, plan_json, self.model, self.prompt_version, created_at),
+        )
+        conn.commit()
+
+    # --- Public API ---
+    def get(self, key):
+        """
+        Looks up a cached plan.
+
+        Args:
+            key (str): A key produced by make_cache_key.
+
+        Returns:
+            dict or None: The cached plan, or None on a miss.
+        """
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                plan_json, created_at = entry
+                if now - created_at <= self.ttl_seconds:
+                    self._memory.move_to_end(key)
+                    self._counters["memory_hits"] += 1
+                    return json.loads(plan_json)
+                del self._memory[key]
+
+        try:
+            plan_json, created_at = self._disk_get(key)
+        except sqlite3.Error as e:
+            print(f"Error reading plan cache: {e}")
+            plan_json, created_at = None, None
+            with self._lock:
+                self._counters["errors"] += 1
+
+        with self._lock:
+            if plan_json is None or now - created_at > self.ttl_seconds:
+                self._counters["misses"] += 1
+                return None
+            self._counters["disk_hits"] += 1
+            self._remember(key, plan_json, created_at)
+        return json.loads(plan_json)
+
+    def set(self, key, plan):
+        """
+        Stores a plan in both tiers.
+
+        Args:
+            key (str): A key produced by make_cache_key.
+            plan (dict): The structured query returned by the LLM.
+        """
+        plan_json = json.dumps(plan, separators=(",", ":"))
+        created_at = time.time()
+        with self._lock:
+            self._remember(key, plan_json, created_at)
+            self._counters["stores"] += 1
+        try:
+            self._disk_set(key, plan_json, created_at)
+        except sqlite3.Error as e:
+            print(f"Error writing plan cache: {e}")
+            with self._lock:
+                self._counters["errors"] += 1
+
+    def _remember(self, key, plan_json, created_at):
+        """Adds an entry to the memory tier. Must be called with the lock held."""
+        self._memory[key] = (plan_json, created_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def invalidate(self, stale_only=False):
+        """
+        Drops cached plans.
+
+        Args:
+            stale_only (bool): If True, only drop disk entries produced by a different
+                model or prompt version, plus expired ones. Otherwise drop everything.
+
+        Returns:
+            int: The number of disk entries removed.
+        """
+        with self._lock:
+            self._memory.clear()
+        try:
+            conn = self._connection()
+            if stale_only:
+                cursor = conn.execute(
+                    "DELETE FROM query_plans WHERE model != ? OR prompt_version != ? OR created_at < ?",
+                    (self.model, self.prompt_version, time.time() - self.ttl_seconds),
+                )
+            else:
+                cursor = conn.execute("DELETE FROM query_plans")
+            conn.commit()
+            return cursor.rowcount
+        except sqlite3.Error as e:
+            print(f"Error invalidating plan cache: {e}")
+            return 0
+
+    def stats(self):
+        """
+        Returns the hit/miss counters for this process.
+
+        Returns:
+            dict: Counter values plus the overall hit rate and memory tier size.
+        """
+        with self._lock:
+            counters = dict(self._counters)
+            counters["memory_entries"] = len(self._memory)
+        lookups = counters["memory_hits"] + counters["disk_hits"] + counters["misses"]
+        hits = counters["memory_hits"] + counters["disk_hits"]
+        counters["hit_rate"] = hits / lookups if lookups else 0.0
+        return counters
+
+
+class NullPlanCache:
+    """A stand-in used when PLAN_CACHE_ENABLED is off."""
+
+    def get(self, key):
+        return None
+
+    def set(self, key, plan):
+        pass
+
+    def invalidate(self, stale_only=False):
+        return 0
+
+    def stats(self):
+        return {"enabled": False}
+
+
+plan_cache = PlanCache() if PLAN_CACHE_ENABLED else NullPlanCache()
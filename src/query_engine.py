@@ -0,0 +1,178 @@
+"""
+This module contains the query-execution layer for the City Promise Tracker app.
+
+A natural language query is resolved to one plan and one result set, which are
+kept under a result id. The callbacks triggered by a single "Show Results" click
+read the shared result instead of each calling the LLM and filtering again.
+"""
+
+import hashlib
+import threading
+from collections import OrderedDict
+
+from config import QUERY_RESULT_CACHE_SIZE
+from metrics import stage
+from plan_cache import normalize_query
+from query_parser import plan_query
+from utils import apply_structured_query
+
+# Plan sources of queries that could not be planned; their results are not reused
+FAILED_PLAN_SOURCES = ("unavailable", "invalid")
+
+
+class QueryResult:
+    """
+    A resolved query: the structured plan and the rows it selects.
+
+    Attributes:
+        result_id (str): The id stored in the browser to look the result up again.
+        query (str): The natural language query.
+        plan (dict or None): The structured query, or None for an empty query.
+        df (pd.DataFrame): The filtered rows. Treat as read-only; it is shared.
+        plan_source (str or None): "local" or "llm", depending on how the plan was produced,
+            "unavailable" if the query needed the LLM and it could not answer, or
+            "invalid" if the LLM's answer could not be used as a plan.
+    """
+
+    def __init__(self, result_id, query, plan, df, plan_source=None):
+        self.result_id = result_id
+        self.query = query
+        self.plan = plan
+        self.df = df
+        self.plan_source = plan_source
+
+
+class _InFlight:
+    """Tracks a computation that other callers can wait on."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class QueryEngine:
+    """
+    Resolves queries against a DataFrame, caching results and single-flighting
+    identical concurrent requests.
+    """
+
+    def __init__(self, data_df, index=None, max_results=QUERY_RESULT_CACHE_SIZE, backend=None):
+        self.data_df = data_df
+        self.index = index
+        self.backend = backend
+        self.max_results = max_results
+        self._results = OrderedDict()
+        self._in_flight = {}
+        self._lock = threading.Lock()
+        self._counters = {"hits": 0, "misses": 0, "shared": 0}
+
+    @staticmethod
+    def make_result_id(query):
+        """
+        Derives a deterministic result id from a query.
+
+        Args:
+            query (str): The natural language query.
+
+        Returns:
+            str: A short hex id. Identical queries map to the same id in every worker.
+        """
+        return hashlib.sha256(normalize_query(query).encode("utf-8")).hexdigest()[:16]
+
+    def execute(self, query):
+        """
+        Resolves a query to a plan and a result set, reusing any cached or
+        in-flight computation for the same query. A cached result that could
+        not be planned ("unavailable" or "invalid") is computed again, so
+        running the query again retries the LLM.
+
+        Args:
+            query (str): The natural language query.
+
+        Returns:
+            QueryResult: The shared result.
+        """
+        result_id = self.make_result_id(query)
+
+        with self._lock:
+            cached = self._results.get(result_id)
+            if cached is not None and cached.plan_source not in FAILED_PLAN_SOURCES:
+                self._results.move_to_end(result_id)
+                self._counters["hits"] += 1
+                return cached
+            call = self._in_flight.get(result_id)
+            leader = call is None
+            if leader:
+                call = _InFlight()
+                self._in_flight[result_id] = call
+                self._counters["misses"] += 1
+            else:
+                self._counters["shared"] += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = self._compute(result_id, query)
+            with self._lock:
+                self._results[result_id] = call.result
+                while len(self._results) > self.max_results:
+                    self._results.popitem(last=False)
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._in_flight.pop(result_id, None)
+            call.done.set()
+
+    def get(self, result_id, query):
+        """
+        Returns a previously executed result, recomputing it if this worker has
+        not seen it (e.g. the click was served by another gunicorn worker).
+
+        Args:
+            result_id (str): The id returned by execute.
+            query (str): The query the id was derived from.
+
+        Returns:
+            QueryResult: The shared result.
+        """
+        with self._lock:
+            cached = self._results.get(result_id)
+            if cached is not None:
+                self._results.move_to_end(result_id)
+                self._counters["hits"] += 1
+                return cached
+        return self.execute(query)
+
+    def _compute(self, result_id, query):
+        """Runs the planning and filtering for a query."""
+        if not query:
+            return QueryResult(result_id, query, None, self.data_df)
+
+        with stage("plan"):
+            plan, plan_source = plan_query(self.data_df, query)
+        with stage("filter"):
+            result_df = apply_structured_query(self.data_df, plan, self.index, self.backend)
+        return QueryResult(result_id, query, plan, result_df, plan_source)
+
+    def stats(self):
+        """
+        Returns the result cache counters of this engine.
+
+        Returns:
+            dict: Hits, misses (computed), requests that joined an in-flight
+            computation, cached results and the hit rate.
+        """
+        with self._lock:
+            counters = dict(self._counters)
+            counters["entries"] = len(self._results)
+        lookups = counters["hits"] + counters["misses"] + counters["shared"]
+        counters["hit_rate"] = (counters["hits"] + counters["shared"]) / lookups if lookups else 0.0
+        return counters
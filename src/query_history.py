@@ -0,0 +1,240 @@
+"""
+This module keeps the query history of each browser tab on the server.
+
+By default the history lives in the browser (the chat history display), and
+this module only supplies the entry format and the display element. Each
+element carries its query, so clicking it runs the query again without a
+lookup. With
+QUERY_HISTORY_SERVER_SIDE, entries are stored per tab session in a SQLite
+file instead, so every gunicorn worker sees the same history and it survives
+page reloads. Each session keeps its QUERY_HISTORY_MAX_ENTRIES most recent
+entries; sessions idle for longer than QUERY_HISTORY_TTL_SECONDS are pruned.
+
+Entries are numbered per session from 0, so an entry's id also tells how many
+entries came before it. The callbacks rely on that to trim the display
+without reading it back from the browser.
+"""
+
+import os
+import sqlite3
+import threading
+import time
+
+from dash import html
+
+from config import (
+    QUERY_HISTORY_MAX_ENTRIES,
+    QUERY_HISTORY_PATH,
+    QUERY_HISTORY_SERVER_SIDE,
+    QUERY_HISTORY_TTL_SECONDS,
+)
+
+
+def make_entry(entry_id, query, timestamp):
+    """
+    Builds a history entry.
+
+    Args:
+        entry_id (int): The position of the entry in its session, from 0.
+        query (str): The natural language query.
+        timestamp (str): When the query was run, as shown in the history.
+
+    Returns:
+        dict: The entry.
+    """
+    return {"id": entry_id, "query": query, "timestamp": timestamp}
+
+
+def history_element(entry):
+    """
+    Renders one history entry; clicking it runs the query again.
+
+    Args:
+        entry (dict): An entry built by make_entry.
+
+    Returns:
+        html.Div: The element shown in the chat history.
+    """
+    return html.Div(
+        [
+            html.P(f"• {entry['query']}", className="mb-0"),
+            html.Span(
+                entry["timestamp"],
+                className="text-muted",
+                style={"fontSize": "0.8em"},
+            ),
+        ],
+        id={"type": "history-entry", "index": entry["id"]},
+        n_clicks=0,
+        title="Run this query again",
+        style={"marginBottom": "10px", "cursor": "pointer"},
+        # Read by the re-run callback, so clicking needs neither the store nor a lookup
+        **{"data-query": entry["query"]},
+    )
+
+
+def empty_history():
+    """Returns the children of the chat history before the first query."""
+    return [html.P("No queries yet.", className="text-muted")]
+
+
+class QueryHistory:
+    """
+    Bounded per-session query histories in a SQLite table shared by all workers.
+    """
+
+    enabled = True
+
+    def __init__(
+        self,
+        db_path=QUERY_HISTORY_PATH,
+        max_entries=QUERY_HISTORY_MAX_ENTRIES,
+        ttl_seconds=QUERY_HISTORY_TTL_SECONDS,
+    ):
+        self.db_path = db_path
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._counters = {"added": 0, "loaded": 0, "errors": 0}
+
+    def _connection(self):
+        """Returns a SQLite connection owned by the current thread and process."""
+        conn = getattr(self._local, "conn", None)
+        if conn is not None and getattr(self._local, "pid", None) == os.getpid():
+            return conn
+
+        os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+        conn = sqlite3.connect(self.db_path, timeout=5)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS query_history (
+                session_id TEXT NOT NULL,
+                entry_id INTEGER NOT NULL,
+                query TEXT NOT NULL,
+                timestamp TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                PRIMARY KEY (session_id, entry_id)
+            )
+            """
+        )
+        conn.commit()
+        self._local.conn = conn
+        self._local.pid = os.getpid()
+        return conn
+
+    def _count(self, name):
+        with self._lock:
+            self._counters[name] += 1
+
+    def add(self, session_id, query, timestamp):
+        """
+        Appends a query to a session's history and trims the oldest entries.
+
+        Args:
+            session_id (str): The tab session.
+            query (str): The natural language query.
+            timestamp (str): When the query was run.
+
+        Returns:
+            dict or None: The new entry, or None if it could not be stored.
+        """
+        try:
+            conn = self._connection()
+            with conn:
+                # BEGIN IMMEDIATE keeps two workers from numbering the same entry
+                conn.execute("BEGIN IMMEDIATE")
+                (entry_id,) = conn.execute(
+                    "SELECT COALESCE(MAX(entry_id) + 1, 0) FROM query_history WHERE session_id = ?",
+                    (session_id,),
+                ).fetchone()
+                conn.execute(
+                    "INSERT INTO query_history (session_id, entry_id, query, timestamp, created_at) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    (session_id, entry_id, query, timestamp, time.time()),
+                )
+                conn.execute(
+                    "DELETE FROM query_history WHERE session_id = ? AND entry_id <= ?",
+                    (session_id, entry_id - self.max_entries),
+                )
+        except sqlite3.Error as e:
+            print(f"Error writing query history: {e}")
+            self._count("errors")
+            return None
+        self._count("added")
+        return make_entry(entry_id, query, timestamp)
+
+    def entries(self, session_id):
+        """
+        Returns a session's history.
+
+        Args:
+            session_id (str): The tab session.
+
+        Returns:
+            list: The entries, oldest first.
+        """
+        try:
+            rows = self._connection().execute(
+                "SELECT entry_id, query, timestamp FROM query_history WHERE session_id = ? "
+                "ORDER BY entry_id DESC LIMIT ?",
+                (session_id, self.max_entries),
+            ).fetchall()
+        except sqlite3.Error as e:
+            print(f"Error reading query history: {e}")
+            self._count("errors")
+            return []
+        self._count("loaded")
+        return [make_entry(*row) for row in reversed(rows)]
+
+    def prune(self):
+        """
+        Drops sessions without a query for longer than the TTL.
+
+        Returns:
+            int: The number of entries removed.
+        """
+        try:
+            conn = self._connection()
+            with conn:
+                cursor = conn.execute(
+                    "DELETE FROM query_history WHERE session_id IN ("
+                    "SELECT session_id FROM query_history GROUP BY session_id HAVING MAX(created_at) < ?)",
+                    (time.time() - self.ttl_seconds,),
+                )
+            return cursor.rowcount
+        except sqlite3.Error as e:
+            print(f"Error pruning query history: {e}")
+            return 0
+
+    def stats(self):
+        """
+        Returns the counters for this process.
+
+        Returns:
+            dict: Entries added, histories loaded and SQLite errors.
+        """
+        with self._lock:
+            return dict(self._counters)
+
+
+class NullQueryHistory:
+    """A stand-in used when the history is kept in the browser."""
+
+    enabled = False
+
+    def add(self, session_id, query, timestamp):
+        return None
+
+    def entries(self, session_id):
+        return []
+
+    def prune(self):
+        return 0
+
+    def stats(self):
+        return {"enabled": False}
+
+
+query_history = QueryHistory() if QUERY_HISTORY_SERVER_SIDE else NullQueryHistory()
@@ -0,0 +1,316 @@
+"""
+This module contains a deterministic, rule-based parser for simple queries.
+
+Queries made only of known statuses, cities, categories and date phrases
+(e.g. "late promises in Boston" or "water projects due after 2025") are turned
+into the same structured-query dict the LLM returns, without a network call.
+Anything the parser cannot fully account for falls through to Gemini.
+"""
+
+import calendar
+import re
+import threading
+from datetime import date
+
+import llm
+from llm_prompt import prompt_vocabulary
+from config import LOCAL_PARSER_ENABLED
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:-[a-z0-9]+)*")
+
+# Words that carry no filtering meaning in the queries our users type
+STOPWORDS = {
+    "a", "about", "all", "an", "any", "are", "at", "display", "every", "find", "for",
+    "from", "get", "give", "in", "is", "items", "list", "me", "of", "please", "project",
+    "projects", "promise", "promises", "related", "search", "show", "that", "the",
+    "there", "these", "those", "to", "view", "what", "which", "with",
+}
+
+# Alternative spellings for status values, used only when the target status exists in the data
+STATUS_SYNONYMS = {
+    ("overdue",): "late",
+    ("delayed",): "late",
+    ("behind",): "late",
+    ("upcoming",): "due",
+    ("pending",): "due",
+    ("on", "time"): "on-time",
+    ("ontime",): "on-time",
+    ("on-track",): "on-time",
+    ("on", "track"): "on-time",
+}
+
+DATE_OPERATORS = {
+    "after": "after", "since": "after",
+    "before": "before", "until": "before",
+    # "due by 2025" includes 2025 itself: on or before the last day of the period
+    "by": "by",
+    "in": "within", "during": "within", "on": "within",
+}
+
+MONTHS = {name.lower(): i for i, name in enumerate(calendar.month_name) if name}
+MONTHS.update({name.lower(): i for i, name in enumerate(calendar.month_abbr) if name})
+
+
+def _tokenize(text):
+    """Splits text into lower-case word tokens."""
+    return TOKEN_PATTERN.findall(str(text).lower())
+
+
+def _parse_date_expression(tokens, start, today):
+    """
+    Parses a date expression starting at tokens[start].
+
+    Supported forms are a year ("2025"), a month and year ("november 2025"),
+    an ISO date ("2025-11-15"), a DD-MM-YYYY date ("15-11-2025") and the
+    relative years "this year", "next year" and "last year".
+
+    Returns:
+        tuple: (first_day, last_day, tokens_consumed), or None if no date was found.
+    """
+    if start >= len(tokens):
+        return None
+    token = tokens[start]
+
+    if re.fullmatch(r"\d{4}", token):
+        year = int(token)
+        return date(year, 1, 1), date(year, 12, 31), 1
+
+    match = re.fullmatch(r"(\d{4})-(\d{1,2})-(\d{1,2})", token)
+    if match:
+        year, month, day = (int(g) for g in match.groups())
+    else:
+        match = re.fullmatch(r"(\d{1,2})-(\d{1,2})-(\d{4})", token)
+        if match:
+            day, month, year = (int(g) for g in match.groups())
+    if match:
+        try:
+            day_value = date(year, month, day)
+        except ValueError:
+            return None
+        return day_value, day_value, 1
+
+    if token in MONTHS and start + 1 < len(tokens) and re.fullmatch(r"\d{4}", tokens[start + 1]):
+        month, year = MONTHS[token], int(tokens[start + 1])
+        last_day = calendar.monthrange(year, month)[1]
+        return date(year, month, 1), date(year, month, last_day), 2
+
+    if start + 1 < len(tokens) and tokens[start + 1] == "year":
+        offsets = {"this": 0, "next": 1, "last": -1}
+        if token in offsets:
+            year = today.year + offsets[token]
+            return date(year, 1, 1), date(year, 12, 31), 2
+
+    return None
+
+
+class LocalQueryParser:
+    """
+    Parses simple queries using a vocabulary built from the loaded DataFrame.
+    """
+
+    def __init__(self, data_df, today=None):
+        self.today = today
+        self.phrases = {}
+        self.max_phrase_length = 1
+
+        if "status" in data_df.columns:
+            statuses = {str(v).lower(): str(v) for v in data_df["status"].dropna().unique()}
+            for value_lower, value in statuses.items():
+                self._add_phrase(_tokenize(value_lower), "status", value)
+            for words, status in STATUS_SYNONYMS.items():
+                if status in statuses:
+                    self._add_phrase(list(words), "status", statuses[status])
+
+        for column in ("city", "category"):
+            if column not in data_df.columns:
+                continue
+            for value in data_df[column].dropna().unique():
+                words = _tokenize(value)
+                self._add_phrase(words, column, str(value))
+                if column == "category" and words:
+                    # Accept both "road" and "roads" for a category named "Roads"
+                    last = words[-1]
+                    variant = last[:-1] if last.endswith("s") else last + "s"
+                    self._add_phrase(words[:-1] + [variant], column, str(value))
+
+    def _add_phrase(self, words, column, value):
+        if not words:
+            return
+        # Ambiguous phrases (e.g. a city and a category with the same name) are left to the LLM
+        key = tuple(words)
+        existing = self.phrases.get(key)
+        if existing is not None and existing != (column, value):
+            self.phrases[key] = None
+            return
+        self.phrases[key] = (column, value)
+        self.max_phrase_length = max(self.max_phrase_length, len(words))
+
+    def parse(self, query):
+        """
+        Parses a query into a structured-query dict.
+
+        Args:
+            query (str): The natural language query.
+
+        Returns:
+            dict or None: The structured query, or None if any part of the query
+            could not be understood.
+        """
+        tokens = _tokenize(query)
+        today = self.today or date.today()
+        structured_query = {}
+        i = 0
+
+        while i < len(tokens):
+            token = tokens[i]
+
+            # Date phrases: "[due] after 2025", "due before november 2026", "in 2025", "due next year"
+            parsed = None
+            date_start = i + 1 if token == "due" and i + 1 < len(tokens) else i
+            operator = DATE_OPERATORS.get(tokens[date_start])
+            if operator is not None:
+                parsed = _parse_date_expression(tokens, date_start + 1, today)
+            if parsed is None and token == "due":
+                operator, date_start = "within", i
+                parsed = _parse_date_expression(tokens, i + 1, today)
+            if parsed is not None:
+                if "due_date" in structured_query:
+                    return None
+                first_day, last_day, consumed = parsed
+                if operator == "after":
+                    condition = {"$gt": last_day.isoformat()}
+                elif operator == "before":
+                    condition = {"$lt": first_day.isoformat()}
+                elif operator == "by":
+                    condition = {"$lte": last_day.isoformat()}
+                elif first_day == last_day:
+                    condition = {"$eq": first_day.isoformat()}
+                else:
+                    condition = {
+                        "$gt": date.fromordinal(first_day.toordinal() - 1).isoformat(),
+                        "$lt": date.fromordinal(last_day.toordinal() + 1).isoformat(),
+                    }
+                structured_query["due_date"] = condition
+                i = date_start + 1 + consumed
+                continue
+
+            # Vocabulary phrases, longest match first ("new york" before "new")
+            matched = False
+            for length in range(min(self.max_phrase_length, len(tokens) - i), 0, -1):
+                key = tuple(tokens[i:i + length])
+                if key not in self.phrases:
+                    continue
+                entry = self.phrases[key]
+                if entry is None:
+                    return None
+                column, value = entry
+                # Values come from the data's own vocabulary, so they match exactly (a bare
+                # string would be a case-insensitive regex: "kansas" in "Arkansas City")
+                condition = {"$eq": value}
+                if structured_query.get(column, condition) != condition:
+                    # Two different values for one column need OR semantics; let the LLM handle it
+                    return None
+                structured_query[column] = condition
+                i += length
+                matched = True
+                break
+            if matched:
+                continue
+
+            if token in STOPWORDS:
+                i += 1
+                continue
+
+            return None
+
+        return structured_query or None
+
+
+class _PlanSourceCounter:
+    """Counts how each query was planned so the LLM traffic saved can be measured."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts = {"local": 0, "llm": 0}
+
+    def record(self, source):
+        with self._lock:
+            self._counts[source] = self._counts.get(source, 0) + 1
+
+    def stats(self):
+        with self._lock:
+            counts = dict(self._counts)
+        total = sum(counts.values())
+        counts["local_ratio"] = counts["local"] / total if total else 0.0
+        return counts
+
+
+plan_sources = _PlanSourceCounter()
+_parser_lock = threading.Lock()
+_parser_cache = (None, None)
+
+
+def get_parser(data_df):
+    """
+    Returns a LocalQueryParser for the DataFrame, reusing the last one built.
+
+    Args:
+        data_df (pd.DataFrame): The loaded promise data.
+
+    Returns:
+        LocalQueryParser: The parser whose vocabulary matches data_df.
+    """
+    global _parser_cache
+    with _parser_lock:
+        cached_df, parser = _parser_cache
+        if cached_df is not data_df:
+            parser = LocalQueryParser(data_df)
+            _parser_cache = (data_df, parser)
+        return parser
+
+
+def plan_query(data_df, query):
+    """
+    Resolves a natural language query to a structured query, trying the local
+    parser before falling back to the LLM.
+
+    Args:
+        data_df (pd.DataFrame): The loaded promise data.
+        query (str): The natural language query.
+
+    Returns:
+        tuple: (structured_query, source) where source is "local" or "llm", or
+        "unavailable" if the query needs the LLM and it is not configured, not
+        answering in time or failing, or "invalid" if the LLM's answer could
+        not be used as a plan.
+    """
+    if LOCAL_PARSER_ENABLED:
+        structured_query = get_parser(data_df).parse(query)
+        if structured_query is not None:
+            plan_sources.record("local")
+            return structured_query, "local"
+
+    try:
+        structured_query = llm.get_structured_query(
+            query, data_df.columns.tolist(), prompt_vocabulary(data_df)
+        )
+    except llm.LLMUnavailableError as e:
+        print(f"LLM unavailable for query {query!r}: {e}")
+        plan_sources.record("unavailable")
+        return {}, "unavailable"
+    except llm.LLMPlanError as e:
+        print(f"LLM could not plan query {query!r}: {e}")
+        plan_sources.record("invalid")
+        return {}, "invalid"
+    plan_sources.record("llm")
+    return structured_query, "llm"
+
+
+def get_plan_source_stats():
+    """
+    Returns how many queries were planned locally versus by the LLM in this worker.
+
+    Returns:
+        dict: Counts per source and the share of queries handled locally.
+    """
+    return plan_sources.stats()
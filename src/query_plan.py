@@ -0,0 +1,384 @@
+"""
+This module compiles structured queries into executable filter plans.
+
+A structured query (the JSON produced by the LLM or the local parser) is
+validated against the DataFrame schema and turned into a tree of conditions.
+The tree is evaluated into a single boolean mask with NumPy operations,
+evaluating the most selective conditions first and only testing the rows that
+can still match. No intermediate DataFrames are created.
+
+Supported forms:
+    {"city": "Boston"}                          case-insensitive substring/regex match
+    {"city": ["Boston", "Miami"]}               shorthand for $in
+    {"status": {"$eq": "late"}}                 exact (case-insensitive) match
+    {"status": {"$ne": "late"}}
+    {"category": {"$in": ["Roads", "Water"]}}
+    {"due_date": {"$gt": "2025-01-01", "$lte": "2025-12-31"}}
+    {"due_date": {"$between": ["2025-01-01", "2025-06-30"]}}
+    {"$or": [{"status": "late"}, {"city": "Boston"}]}
+    {"$and": [...]}
+"""
+
+import re
+
+import numpy as np
+import pandas as pd
+
+from indexes import REGEX_METACHARACTERS
+
+COMPARISON_OPERATORS = ("$gt", "$gte", "$lt", "$lte")
+TEXT_OPERATORS = ("$contains", "$eq", "$ne", "$in")
+ORDERED_OPERATORS = COMPARISON_OPERATORS + ("$eq", "$ne", "$in", "$between")
+
+# Rough selectivity guesses used when no index can give an exact count
+DEFAULT_SELECTIVITY = {
+    "$contains": 0.2,
+    "$eq": 0.1,
+    "$ne": 0.9,
+    "$in": 0.2,
+    "$gt": 0.4,
+    "$gte": 0.4,
+    "$lt": 0.4,
+    "$lte": 0.4,
+    "$between": 0.25,
+}
+
+
+class QueryPlanError(ValueError):
+    """Raised when a structured query does not fit the DataFrame schema."""
+
+
+def _column_kind(series):
+    """Classifies a column as "datetime", "numeric" or "text"."""
+    if pd.api.types.is_datetime64_any_dtype(series):
+        return "datetime"
+    if pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series):
+        return "numeric"
+    return "text"
+
+
+def column_kinds(data_df):
+    """
+    Classifies every column of a DataFrame.
+
+    Args:
+        data_df (pd.DataFrame): The DataFrame.
+
+    Returns:
+        dict: column -> "datetime", "numeric" or "text".
+    """
+    return {column: _column_kind(data_df[column]) for column in data_df.columns}
+
+
+class EvaluationContext:
+    """
+    Column arrays shared by all conditions of one plan evaluation.
+
+    Arrays are extracted from the DataFrame once, and codes for low-cardinality
+    columns come from the prebuilt PromiseIndex when one is available.
+    """
+
+    def __init__(self, data_df, index=None):
+        self.data_df = data_df
+        self.n_rows = len(data_df)
+        self.index = index if index is not None and index.is_for(data_df) else None
+        self._values = {}
+        self._codes = {}
+
+    def values(self, column):
+        """Returns the column as a NumPy array."""
+        if column not in self._values:
+            self._values[column] = self.data_df[column].to_numpy()
+        return self._values[column]
+
+    def codes(self, column):
+        """
+        Returns (codes, uniques) for columns that are cheap to match by distinct value,
+        or None if the column should be matched element-wise.
+        """
+        if column in self._codes:
+            return self._codes[column]
+        series = self.data_df[column]
+        if self.index is not None and column in self.index.codes:
+            result = self.index.codes[column]
+        elif isinstance(series.dtype, pd.CategoricalDtype):
+            result = (series.cat.codes.to_numpy(), np.asarray(series.cat.categories, dtype=object))
+        else:
+            result = None
+        self._codes[column] = result
+        return result
+
+
+class Condition:
+    """A single comparison against one column."""
+
+    def __init__(self, column, kind, op, value, literal=None):
+        self.column = column
+        self.kind = kind
+        self.op = op
+        self.value = value
+        # The plain search string for $contains without regex syntax, usable with the n-gram index
+        self.literal = literal
+
+    def __repr__(self):
+        return f"Condition({self.column!r}, {self.op!r}, {self.value!r})"
+
+    def estimate(self, ctx):
+        """Returns the estimated fraction of rows matching this condition."""
+        index = ctx.index
+        if index is not None and ctx.n_rows:
+            if self.kind == "text" and self.column in index.codes:
+                _, uniques = index.codes[self.column]
+                matched = index.code_counts[self.column][self._matching_codes(uniques)].sum() / ctx.n_rows
+                return 1.0 - matched if self.op == "$ne" else matched
+            if self.kind == "text" and self.literal is not None:
+                upper_bound = index.estimate_substring(self.column, self.literal)
+                if upper_bound is not None:
+                    return upper_bound / ctx.n_rows
+            if self.kind == "datetime" and self.op in ORDERED_OPERATORS:
+                count = index.count_date(self.column, self.op, self.value)
+                if count is not None:
+                    return count / ctx.n_rows
+        return DEFAULT_SELECTIVITY.get(self.op, 0.5)
+
+    def _matching_codes(self, uniques):
+        """Returns the codes of the distinct values this text condition accepts."""
+        if self.op == "$contains":
+            pattern = self.value
+            keep = np.fromiter((pattern.search(str(u)) is not None for u in uniques), dtype=bool, count=len(uniques))
+        else:
+            lowered = np.array([str(u).lower() for u in uniques], dtype=object)
+            wanted = self.value if self.op == "$in" else {self.value}
+            keep = np.isin(lowered, list(wanted))
+        return np.flatnonzero(keep)
+
+    def evaluate(self, ctx, rows):
+        """
+        Evaluates the condition.
+
+        Args:
+            ctx (EvaluationContext): Shared column arrays.
+            rows (np.ndarray or None): Row positions to test, or None for every row.
+
+        Returns:
+            np.ndarray: A boolean array aligned with rows (or with every row).
+        """
+        if self.kind == "text":
+            return self._evaluate_text(ctx, rows)
+
+        values = ctx.values(self.column)
+        values = values if rows is None else values[rows]
+        op, value = self.op, self.value
+        if op == "$gt":
+            return values > value
+        if op == "$gte":
+            return values >= value
+        if op == "$lt":
+            return values < value
+        if op == "$lte":
+            return values <= value
+        if op == "$eq":
+            return values == value
+        if op == "$ne":
+            return values != value
+        if op == "$in":
+            return np.isin(values, value)
+        low, high = value
+        return (values >= low) & (values <= high)
+
+    def _evaluate_text(self, ctx, rows):
+        negate = self.op == "$ne"
+        coded = ctx.codes(self.column)
+        if coded is not None:
+            codes, uniques = coded
+            codes = codes if rows is None else codes[rows]
+            mask = np.isin(codes, self._matching_codes(uniques))
+            return ~mask if negate else mask
+
+        if self.op == "$contains" and ctx.index is not None and self.literal is not None:
+            # The n-gram index pays off unless earlier conditions already left fewer rows
+            upper_bound = ctx.index.estimate_substring(self.column, self.literal)
+            use_index = upper_bound is not None and (rows is None or len(rows) > upper_bound)
+            positions = ctx.index.match_value(self.column, self.literal) if use_index else None
+            if positions is not None:
+                hits = np.zeros(ctx.n_rows, dtype=bool)
+                hits[positions] = True
+                return hits if rows is None else hits[rows]
+
+        values = ctx.values(self.column)
+        values = values if rows is None else values[rows]
+        if self.op == "$contains":
+            pattern = self.value
+            mask = np.fromiter(
+                (isinstance(v, str) and pattern.search(v) is not None for v in values),
+                dtype=bool,
+                count=len(values),
+            )
+            return mask
+        lowered = np.array([None if pd.isna(v) else str(v).lower() for v in values], dtype=object)
+        wanted = self.value if self.op == "$in" else {self.value}
+        mask = np.isin(lowered, list(wanted))
+        return ~mask if negate else mask
+
+
+class BooleanNode:
+    """An $and / $or combination of child nodes."""
+
+    def __init__(self, op, children):
+        self.op = op
+        self.children = children
+
+    def __repr__(self):
+        return f"BooleanNode({self.op!r}, {self.children!r})"
+
+    def estimate(self, ctx):
+        estimates = [child.estimate(ctx) for child in self.children]
+        if self.op == "$and":
+            return float(np.prod(estimates))
+        return 1.0 - float(np.prod([1.0 - e for e in estimates]))
+
+    def evaluate(self, ctx, rows):
+        n = ctx.n_rows if rows is None else len(rows)
+        positions = np.arange(ctx.n_rows) if rows is None else rows
+        ordered = sorted(self.children, key=lambda child: child.estimate(ctx))
+
+        if self.op == "$and":
+            # Most selective first; later conditions only see rows that still match
+            mask = np.ones(n, dtype=bool)
+            for child in ordered:
+                alive = np.flatnonzero(mask)
+                if len(alive) == 0:
+                    break
+                mask[alive] = child.evaluate(ctx, positions[alive])
+            return mask
+
+        # Least selective first; later conditions only see rows not yet matched
+        mask = np.zeros(n, dtype=bool)
+        for child in reversed(ordered):
+            pending = np.flatnonzero(~mask)
+            if len(pending) == 0:
+                break
+            mask[pending] = child.evaluate(ctx, positions[pending])
+        return mask
+
+
+class QueryPlan:
+    """A compiled, validated structured query."""
+
+    def __init__(self, root):
+        self.root = root
+
+    def __repr__(self):
+        return f"QueryPlan({self.root!r})"
+
+    def evaluate(self, data_df, index=None):
+        """
+        Evaluates the plan into one boolean mask over data_df.
+
+        Args:
+            data_df (pd.DataFrame): The DataFrame the plan was compiled for.
+            index (PromiseIndex, optional): Prebuilt indexes for data_df.
+
+        Returns:
+            np.ndarray: A boolean mask with one entry per row.
+        """
+        ctx = EvaluationContext(data_df, index)
+        return self.root.evaluate(ctx, None)
+
+
+def _coerce_scalar(column, kind, value):
+    """Converts a JSON value to something comparable with the column's values."""
+    if isinstance(value, (dict, list)):
+        raise QueryPlanError(f"Expected a single value for '{column}', got {value!r}.")
+    if kind == "datetime":
+        try:
+            return pd.Timestamp(value).to_datetime64()
+        except (ValueError, TypeError) as e:
+            raise QueryPlanError(f"Invalid date {value!r} for '{column}'.") from e
+    if kind == "numeric":
+        try:
+            return float(value)
+        except (ValueError, TypeError) as e:
+            raise QueryPlanError(f"Invalid number {value!r} for '{column}'.") from e
+    return str(value).lower()
+
+
+def _compile_text_pattern(value):
+    """Compiles a case-insensitive pattern with Series.str.contains semantics."""
+    try:
+        return re.compile(str(value), re.IGNORECASE)
+    except re.error:
+        return re.compile(re.escape(str(value)), re.IGNORECASE)
+
+
+def _compile_column(column, kind, spec):
+    """Compiles the conditions for one column into Condition nodes."""
+    if isinstance(spec, list):
+        spec = {"$in": spec}
+    if not isinstance(spec, dict):
+        if kind == "text":
+            literal = None if REGEX_METACHARACTERS.search(str(spec)) else str(spec)
+            return [Condition(column, kind, "$contains", _compile_text_pattern(spec), literal)]
+        spec = {"$eq": spec}
+
+    allowed = TEXT_OPERATORS if kind == "text" else ORDERED_OPERATORS
+    conditions = []
+    for op, value in spec.items():
+        if op not in allowed:
+            raise QueryPlanError(f"Operator '{op}' is not supported for {kind} column '{column}'.")
+        if op == "$in":
+            if not isinstance(value, list):
+                raise QueryPlanError(f"'$in' for '{column}' expects a list.")
+            coerced = [_coerce_scalar(column, kind, v) for v in value]
+            value = set(coerced) if kind == "text" else np.array(coerced)
+        elif op == "$between":
+            if not isinstance(value, list) or len(value) != 2:
+                raise QueryPlanError(f"'$between' for '{column}' expects [low, high].")
+            value = (_coerce_scalar(column, kind, value[0]), _coerce_scalar(column, kind, value[1]))
+        elif op == "$contains":
+            literal = None if REGEX_METACHARACTERS.search(str(value)) else str(value)
+            conditions.append(Condition(column, kind, op, _compile_text_pattern(value), literal))
+            continue
+        else:
+            value = _coerce_scalar(column, kind, value)
+        conditions.append(Condition(column, kind, op, value))
+    return conditions
+
+
+def _compile_node(structured_query, schema):
+    if not isinstance(structured_query, dict):
+        raise QueryPlanError(f"Expected an object, got {structured_query!r}.")
+
+    children = []
+    for key, spec in structured_query.items():
+        if key in ("$and", "$or"):
+            if not isinstance(spec, list) or not spec:
+                raise QueryPlanError(f"'{key}' expects a non-empty list of conditions.")
+            subnodes = [_compile_node(sub, schema) for sub in spec]
+            children.append(subnodes[0] if len(subnodes) == 1 else BooleanNode(key, subnodes))
+        elif key in schema:
+            children.extend(_compile_column(key, schema[key], spec))
+        else:
+            raise QueryPlanError(f"Unknown column '{key}'.")
+
+    if not children:
+        raise QueryPlanError("The query has no conditions.")
+    return children[0] if len(children) == 1 else BooleanNode("$and", children)
+
+
+def compile_plan(structured_query, data_df):
+    """
+    Validates a structured query against the DataFrame schema and compiles it.
+
+    Args:
+        structured_query (dict): Filter conditions keyed by column name.
+        data_df (pd.DataFrame): The DataFrame the plan will run against.
+
+    Returns:
+        QueryPlan: The executable plan.
+
+    Raises:
+        QueryPlanError: If the query references unknown columns or operators,
+            or has values of the wrong type.
+    """
+    return QueryPlan(_compile_node(structured_query, column_kinds(data_df)))
@@ -0,0 +1,262 @@
+"""
+This module contains the content-addressed store for generated reports.
+
+Reports are stored under a hash of the query plan, the query text on the cover
+and the dataset version, so a repeated request is served from the existing file. Large reports are written
+by a background thread while the page polls a small JSON status file next to
+the report; the status file lives on disk so any gunicorn worker can answer the
+poll. The store is trimmed by age and total size, least recently used first;
+status and temporary files left behind by failed or abandoned jobs are removed
+once they have not been updated for REPORT_JOB_STALE_SECONDS.
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import abort, send_from_directory
+
+from config import (
+    REPORTS_DIR,
+    REPORT_STORE_MAX_BYTES,
+    REPORT_STORE_MAX_AGE_SECONDS,
+    REPORT_BACKGROUND_MIN_ROWS,
+    REPORT_BACKGROUND_WORKERS,
+    REPORT_JOB_STALE_SECONDS,
+)
+from metrics import stage
+from reports import write_report
+
+# Bump when the report layout changes so old files are not served for new requests
+REPORT_FORMAT_VERSION = "2"
+
+
+def report_key(plan, version, query):
+    """
+    Builds the content address of a report.
+
+    The query is part of the key because it is printed on the cover page, so
+    two queries resolving to the same plan get their own report.
+
+    Args:
+        plan (dict or None): The structured query (None for an unfiltered report).
+        version (str): The dataset version stamp.
+        query (str): The query shown on the cover page.
+
+    Returns:
+        str: A hex digest identifying the report.
+    """
+    payload = json.dumps([plan, version, query or "", REPORT_FORMAT_VERSION], sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:32]
+
+
+class ReportStore:
+    """
+    Generates, deduplicates and evicts report files in one directory.
+    """
+
+    def __init__(
+        self,
+        directory=REPORTS_DIR,
+        max_bytes=REPORT_STORE_MAX_BYTES,
+        max_age_seconds=REPORT_STORE_MAX_AGE_SECONDS,
+        background_min_rows=REPORT_BACKGROUND_MIN_ROWS,
+        workers=REPORT_BACKGROUND_WORKERS,
+    ):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_age_seconds = max_age_seconds
+        self.background_min_rows = background_min_rows
+        self.workers = workers
+        self._executor = None
+        self._executor_pid = None
+        self._lock = threading.Lock()
+
+    def report_path(self, key):
+        """Returns the file path of a report."""
+        return os.path.join(self.directory, f"{key}.html")
+
+    def _status_path(self, key):
+        return os.path.join(self.directory, f"{key}.json")
+
+    def _write_status(self, key, state, done=0, total=0, error=None):
+        status = {"state": state, "done": done, "total": total, "updated_at": time.time()}
+        if error:
+            status["error"] = error
+        tmp_path = f"{self._status_path(key)}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(status, f)
+        os.replace(tmp_path, self._status_path(key))
+
+    def status(self, key):
+        """
+        Returns the state of a report.
+
+        Args:
+            key (str): The report key.
+
+        Returns:
+            dict: "state" is "done", "running", "error" or "missing", plus
+            "done"/"total" promise counts while running.
+        """
+        if os.path.exists(self.report_path(key)):
+            return {"state": "done"}
+        try:
+            with open(self._status_path(key), encoding="utf-8") as f:
+                status = json.load(f)
+        except (OSError, ValueError):
+            return {"state": "missing"}
+        if status.get("state") == "running" and time.time() - status.get("updated_at", 0) > REPORT_JOB_STALE_SECONDS:
+            # The worker running the job died; let the next request start it again
+            return {"state": "missing"}
+        return status
+
+    def request(self, key, data_df, query):
+        """
+        Makes sure a report exists or is being generated.
+
+        Small reports are written before returning; large ones are handed to a
+        background thread. An existing report is served as-is.
+
+        Args:
+            key (str): The report key from report_key.
+            data_df (pd.DataFrame): The promises to include.
+            query (str): The query shown on the cover page.
+
+        Returns:
+            dict: The report status, as returned by status().
+        """
+        status = self.status(key)
+        if status["state"] in ("done", "running"):
+            return status
+
+        os.makedirs(self.directory, exist_ok=True)
+        self._write_status(key, "running", 0, len(data_df))
+        if len(data_df) < self.background_min_rows:
+            self._generate(key, data_df, query)
+        else:
+            self._get_executor().submit(self._generate, key, data_df, query)
+        return self.status(key)
+
+    def _get_executor(self):
+        # Created lazily and per process, so it survives gunicorn forking workers
+        with self._lock:
+            if self._executor is None or self._executor_pid != os.getpid():
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.workers, thread_name_prefix="report-writer"
+                )
+                self._executor_pid = os.getpid()
+            return self._executor
+
+    def _generate(self, key, data_df, query):
+        """Writes a report, recording progress in its status file."""
+        try:
+            with stage("report_write"):
+                write_report(
+                    self.report_path(key),
+                    data_df,
+                    query,
+                    progress=lambda done, total: self._write_status(key, "running", done, total),
+                )
+            os.remove(self._status_path(key))
+        except Exception as e:
+            print(f"Error generating report {key}: {e}")
+            self._write_status(key, "error", error=str(e))
+        self.evict()
+
+    def touch(self, key):
+        """Marks a report as recently used."""
+        try:
+            os.utime(self.report_path(key))
+        except OSError:
+            pass
+
+    def evict(self):
+        """
+        Deletes reports older than max_age_seconds, then the least recently used
+        ones until the store fits in max_bytes. Status and temporary files of
+        jobs that stopped updating them are deleted too.
+
+        Returns:
+            int: The number of files deleted.
+        """
+        try:
+            entries = []
+            leftovers = []
+            now = time.time()
+            for name in os.listdir(self.directory):
+                path = os.path.join(self.directory, name)
+                if name.endswith(".html"):
+                    stat = os.stat(path)
+                    entries.append((stat.st_mtime, stat.st_size, path))
+                elif name.endswith((".json", ".tmp")):
+                    # Running jobs rewrite these on every chunk; anything older was abandoned
+                    if now - os.stat(path).st_mtime > REPORT_JOB_STALE_SECONDS:
+                        leftovers.append(path)
+        except OSError as e:
+            print(f"Error scanning report store: {e}")
+            return 0
+
+        removed = 0
+        for path in leftovers:
+            try:
+                os.remove(path)
+                removed += 1
+            except OSError:
+                pass
+
+        entries.sort()
+        total = sum(size for _, size, _ in entries)
+        for mtime, size, path in entries:
+            if now - mtime <= self.max_age_seconds and total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+                total -= size
+                removed += 1
+            except OSError:
+                pass
+        return removed
+
+
+def report_url(key):
+    """
+    Returns the URL under which a stored report is served.
+
+    Args:
+        key (str): The report key.
+
+    Returns:
+        str: The download URL.
+    """
+    return f"/reports/{key}.html"
+
+
+def register_report_routes(server, store):
+    """
+    Adds a route that streams stored reports from disk, so downloads do not
+    pass through a Dash callback response.
+
+    Args:
+        server (flask.Flask): The Flask server behind the Dash app.
+        store (ReportStore): The store the reports live in.
+    """
+
+    @server.route("/reports/<key>.html")
+    def download_report(key):
+        if not key.isalnum():
+            abort(404)
+        store.touch(key)
+        return send_from_directory(
+            os.path.abspath(store.directory),
+            f"{key}.html",
+            as_attachment=True,
+            download_name=f"city_promises_report_{key[:8]}.html",
+            mimetype="text/html",
+        )
+
+
+report_store = ReportStore()
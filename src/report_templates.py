@@ -13,6 +13,7 @@ REPORT_CSS = """
     .report-content h2 { color: #004085; border-bottom: 1px solid #ddd; padding-bottom: 10px; }
     .report-content { line-height: 1.6; }
     .report-item { margin-bottom: 20px; padding: 20px; border: 1px solid #eee; border-radius: 5px; }
+    .report-item[hidden] + hr { display: none; }
     .search-bar { margin-bottom: 20px; }
     .search-bar input { width: 70%; padding: 10px; border: 1px solid #ddd; border-radius: 5px; }
     .search-bar button { padding: 10px 15px; border: none; background: #004085; color: white; border-radius: 5px; cursor: pointer; }
@@ -22,37 +23,163 @@ REPORT_CSS = """
 """
 
 # --- HTML Report Search Script ---
+# Searches the prebuilt token index embedded at the end of the report
+# (#report-search-index: {"tokens": [...], "postings": [[item ids], ...]}).
+# Input is debounced, items are shown/hidden by toggling their hidden flag, and
+# highlighting is only applied to matching items as they scroll into view.
 REPORT_SEARCH_SCRIPT = """
 <script>
-    function searchReport() {
-        let input = document.getElementById('searchInput');
-        let filter = input.value.toUpperCase();
-        let content = document.getElementById('report-content-items');
-        let items = content.getElementsByClassName('report-item');
-        let found = false;
-
-        for (let i = 0; i < items.length; i++) {
-            let item = items[i];
-            let text = item.textContent || item.innerText;
-            
-            // Clear previous highlighting
-            item.innerHTML = item.innerHTML.replace(/<mark>/g, "").replace(/<\/mark>/g, "");
-
-            if (text.toUpperCase().indexOf(filter) > -1) {
-                item.style.display = "";
-                found = true;
-                
-                // Add new highlighting
-                if (filter) {
-                    let regex = new RegExp(filter, "gi");
-                    item.innerHTML = item.innerHTML.replace(regex, function(match) {
-                        return "<mark>" + match + "</mark>";
-                    });
+    (function () {
+        let WORD_PATTERN = /[\\p{L}\\p{N}]+/gu;
+        let tokens = null, postings = null, items = null, shown = null;
+        let terms = [], highlighted = [], onScreen = new Set(), observer = null, timer = null;
+
+        function load() {
+            if (items) return;
+            let data = JSON.parse(document.getElementById("report-search-index").textContent);
+            tokens = data.tokens;
+            postings = data.postings;
+            items = Array.prototype.slice.call(document.getElementsByClassName("report-item"));
+            shown = new Uint8Array(items.length).fill(1);
+            observer = new IntersectionObserver(function (entries) {
+                entries.forEach(function (entry) {
+                    if (entry.isIntersecting) {
+                        onScreen.add(entry.target);
+                        highlight(entry.target);
+                    } else {
+                        onScreen.delete(entry.target);
+                    }
+                });
+            });
+            items.forEach(function (item) { observer.observe(item); });
+        }
+
+        function matches(words) {
+            let result = null;
+            words.forEach(function (word) {
+                let hits = new Uint8Array(items.length);
+                for (let t = 0; t < tokens.length; t++) {
+                    if (tokens[t].indexOf(word) !== -1) {
+                        let ids = postings[t];
+                        for (let i = 0; i < ids.length; i++) hits[ids[i]] = 1;
+                    }
+                }
+                if (result) {
+                    for (let j = 0; j < hits.length; j++) result[j] &= hits[j];
+                } else {
+                    result = hits;
+                }
+            });
+            return result;
+        }
+
+        function escapeRegExp(text) {
+            return text.replace(/[.*+?^${}()|[\\]\\\\]/g, "\\\\$&");
+        }
+
+        function unhighlight(item) {
+            let marks = item.getElementsByTagName("mark");
+            while (marks.length) {
+                let mark = marks[0];
+                mark.parentNode.replaceChild(document.createTextNode(mark.textContent), mark);
+            }
+            item.normalize();
+        }
+
+        function highlight(item) {
+            if (!terms.length || item.hidden || item.dataset.highlighted) return;
+            let pattern = new RegExp("(" + terms.map(escapeRegExp).join("|") + ")", "gi");
+            let walker = document.createTreeWalker(item, NodeFilter.SHOW_TEXT);
+            let nodes = [];
+            while (walker.nextNode()) nodes.push(walker.currentNode);
+            nodes.forEach(function (node) {
+                let parts = node.nodeValue.split(pattern);
+                if (parts.length < 2) return;
+                let fragment = document.createDocumentFragment();
+                parts.forEach(function (part, i) {
+                    if (!part) return;
+                    if (i % 2) {
+                        let mark = document.createElement("mark");
+                        mark.textContent = part;
+                        fragment.appendChild(mark);
+                    } else {
+                        fragment.appendChild(document.createTextNode(part));
+                    }
+                });
+                node.parentNode.replaceChild(fragment, node);
+            });
+            item.dataset.highlighted = "1";
+            highlighted.push(item);
+        }
+
+        function runSearch() {
+            load();
+            let query = document.getElementById("searchInput").value.toLowerCase();
+            terms = query.match(WORD_PATTERN) || [];
+            let visible = terms.length ? matches(terms) : null;
+
+            highlighted.forEach(function (item) {
+                unhighlight(item);
+                delete item.dataset.highlighted;
+            });
+            highlighted = [];
+
+            for (let i = 0; i < items.length; i++) {
+                let show = visible ? visible[i] : 1;
+                if (show !== shown[i]) {
+                    items[i].hidden = !show;
+                    shown[i] = show;
                 }
-            } else {
-                item.style.display = "none";
             }
+            onScreen.forEach(highlight);
         }
-    }
+
+        window.searchReport = function () {
+            clearTimeout(timer);
+            timer = setTimeout(runSearch, 200);
+        };
+    })();
 </script>
 """
+
+# --- HTML Report Document ---
+# The document is streamed in three parts: header, one REPORT_ITEM per promise,
+# and a footer carrying the search index built while the items were written.
+REPORT_HEADER = """<!DOCTYPE html>
+<html>
+<head>
+    <meta charset="utf-8">
+    <title>City Promises Report</title>
+    {css}
+    {script}
+</head>
+<body>
+    <div class="report-container">
+        <div class="cover-page">
+            <h1>City Promises Report</h1>
+            <p>This report details the status of various city promises based on the query: '{query}'.</p>
+            <p>Generated on: {report_date}</p>
+        </div>
+        <div class="report-content">
+            <div class="search-bar">
+                <input type="text" id="searchInput" oninput="searchReport()" placeholder="Search for promises, cities, or statuses...">
+            </div>
+            <div id="report-content-items">
+"""
+
+REPORT_ITEM = (
+    "<div class='report-item' data-id='{item_id}'>"
+    "<h2>{city} - {category}</h2>"
+    "<p><strong>Promise:</strong> {description}</p>"
+    "<p><strong>Due Date:</strong> {due_date}</p>"
+    "<p><strong>Status:</strong> {status}</p>"
+    "</div><hr>\n"
+)
+
+REPORT_FOOTER = """            </div>
+        </div>
+    </div>
+    <script type="application/json" id="report-search-index">{search_index}</script>
+</body>
+</html>
+"""
@@ -0,0 +1,185 @@
+"""
+This module generates the downloadable HTML reports.
+
+Reports are rendered in chunks straight from column arrays and streamed to a
+file (or any iterable consumer such as an HTTP response), so memory use stays
+flat regardless of how many promises the report contains.
+"""
+
+import html
+import json
+import os
+import re
+import tempfile
+from array import array
+from datetime import datetime
+
+import pandas as pd
+
+from config import REPORT_CHUNK_SIZE
+from report_templates import (
+    REPORT_CSS,
+    REPORT_SEARCH_SCRIPT,
+    REPORT_HEADER,
+    REPORT_ITEM,
+    REPORT_FOOTER,
+)
+
+
+# Must split words the same way as WORD_PATTERN in REPORT_SEARCH_SCRIPT
+WORD_PATTERN = re.compile(r"[^\W_]+")
+
+
+class SearchIndexBuilder:
+    """
+    Collects a token -> report item ids index while the report items are
+    written, for the search box embedded in the report.
+    """
+
+    def __init__(self):
+        self.postings = {}
+        self._label_tokens = {}
+
+    def _label(self, value):
+        """Returns the tokens of a repeated value such as a city, caching them."""
+        tokens = self._label_tokens.get(value)
+        if tokens is None:
+            tokens = self._label_tokens[value] = WORD_PATTERN.findall(value.lower())
+        return tokens
+
+    def add(self, item_id, text, labels=()):
+        """
+        Indexes one report item.
+
+        Args:
+            item_id (int): The item's position in the report.
+            text (str): Free text, such as the promise description.
+            labels (iterable): Short values repeated across items (city, status, ...).
+        """
+        tokens = set(WORD_PATTERN.findall(text.lower()))
+        for label in labels:
+            tokens.update(self._label(label))
+        for token in tokens:
+            item_ids = self.postings.get(token)
+            if item_ids is None:
+                item_ids = self.postings[token] = array("I")
+            item_ids.append(item_id)
+
+    def to_json(self):
+        """
+        Serializes the index for embedding in a <script type="application/json"> tag.
+
+        Returns:
+            str: {"tokens": [...], "postings": [[item ids], ...]} with tokens sorted.
+        """
+        tokens = sorted(self.postings)
+        postings = ",".join("[" + ",".join(map(str, self.postings[token])) + "]" for token in tokens)
+        payload = '{"tokens":%s,"postings":[%s]}' % (json.dumps(tokens, separators=(",", ":")), postings)
+        # Keep a "</script>" inside the data from closing the tag early
+        return payload.replace("</", "<\\/")
+
+
+def _strings(series):
+    """Returns the string values of a Series slice as a list."""
+    return series.fillna("").astype(str).tolist()
+
+
+def iter_report_items(data_df, chunk_size=REPORT_CHUNK_SIZE, search_index=None):
+    """
+    Yields the report items as HTML, one chunk of promises at a time.
+
+    Args:
+        data_df (pd.DataFrame): The promises to include.
+        chunk_size (int): The number of promises rendered per chunk.
+        search_index (SearchIndexBuilder, optional): Receives the words of each item.
+
+    Yields:
+        str: The HTML for up to chunk_size report items.
+    """
+    escape = html.escape
+    for start in range(0, len(data_df), chunk_size):
+        chunk = data_df.iloc[start:start + chunk_size]
+        due_dates = pd.to_datetime(chunk["due_date"]).dt.strftime("%Y-%m-%d").fillna("")
+        columns = list(zip(
+            _strings(chunk["city"]),
+            _strings(chunk["category"]),
+            _strings(chunk["promise_description"]),
+            due_dates.tolist(),
+            _strings(chunk["status"].astype(str).str.title()),
+        ))
+        if search_index is not None:
+            for offset, (city, category, description, due_date, status) in enumerate(columns):
+                search_index.add(start + offset, description, (city, category, due_date, status))
+        yield "".join(
+            REPORT_ITEM.format(
+                item_id=start + offset,
+                city=escape(city),
+                category=escape(category),
+                description=escape(description),
+                due_date=due_date,
+                status=escape(status),
+            )
+            for offset, (city, category, description, due_date, status) in enumerate(columns)
+        )
+
+
+def iter_report_html(data_df, query, report_date=None, chunk_size=REPORT_CHUNK_SIZE, progress=None):
+    """
+    Yields the complete report document in pieces. The search index is built
+    while the items are rendered and written in the footer.
+
+    Args:
+        data_df (pd.DataFrame): The promises to include.
+        query (str): The query the report was generated for.
+        report_date (str, optional): The generation time shown on the cover page.
+        chunk_size (int): The number of promises rendered per chunk.
+        progress (callable, optional): Called as progress(done, total) after each chunk.
+
+    Yields:
+        str: Consecutive parts of the HTML document.
+    """
+    if report_date is None:
+        report_date = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    yield REPORT_HEADER.format(
+        css=REPORT_CSS,
+        script=REPORT_SEARCH_SCRIPT,
+        query=html.escape(query or ""),
+        report_date=report_date,
+    )
+    total = len(data_df)
+    search_index = SearchIndexBuilder()
+    for i, items in enumerate(iter_report_items(data_df, chunk_size, search_index)):
+        yield items
+        if progress is not None:
+            progress(min((i + 1) * chunk_size, total), total)
+    yield REPORT_FOOTER.format(search_index=search_index.to_json())
+
+
+def write_report(path, data_df, query, chunk_size=REPORT_CHUNK_SIZE, progress=None):
+    """
+    Streams a report to a file. The file is written under a temporary name and
+    moved into place when complete, so readers never see a partial report.
+
+    Args:
+        path (str): The destination file.
+        data_df (pd.DataFrame): The promises to include.
+        query (str): The query the report was generated for.
+        chunk_size (int): The number of promises rendered per chunk.
+        progress (callable, optional): Called as progress(done, total) after each chunk.
+
+    Returns:
+        str: The path of the written report.
+    """
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            for part in iter_report_html(data_df, query, chunk_size=chunk_size, progress=progress):
+                f.write(part)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return path
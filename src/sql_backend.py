@@ -0,0 +1,416 @@
+"""
+This module contains the SQLite storage backend for filtering promises.
+
+Structured queries are compiled with query_plan.compile_plan, so validation and
+value coercion are shared with the pandas path, and the compiled plan is
+translated into one parameterized SQL statement. The rows live in a local
+SQLite file with indexes on the filter columns. Consumers either stream the
+matching rows page by page as typed DataFrames (iter_pages, used by /export)
+or fetch only their row positions (positions, used by the query engine to
+select rows from the DataFrame it already holds); a result is never built
+from SQL in full.
+
+Each dataset version gets its own database file (<path>.<version>.sqlite3),
+so a backend never reads rows of another version, even while a reload builds
+the next one. Workers reuse an existing file; builds and deletions take an
+exclusive lock on "<path>.build.lock", so the first worker to need a new
+version builds it while the others wait. Every process using a file holds a
+shared lock on "<file>.lock", and the last one to close it after a reload
+deletes it (close).
+
+Storage layout of the "promises" table:
+    row_id            INTEGER PRIMARY KEY, the row's position in the DataFrame
+    <text column>     TEXT, plus "<column>__lower" holding the lowercased value
+    <numeric column>  REAL
+    <date column>     INTEGER, nanoseconds since the epoch
+"""
+
+import fcntl
+import functools
+import glob
+import os
+import re
+import sqlite3
+import tempfile
+import threading
+
+import numpy as np
+import pandas as pd
+
+from config import QUERY_BACKEND, SQL_BACKEND_MIN_ROWS, SQL_BACKEND_PATH, SQL_PAGE_SIZE
+from query_plan import BooleanNode, Condition, column_kinds, compile_plan
+
+TABLE_NAME = "promises"
+LOWER_SUFFIX = "__lower"
+
+# Columns that get a SQL index (text columns are indexed on their lowercased copy)
+INDEXED_COLUMNS = ("city", "status", "category", "due_date")
+
+# Rows inserted per executemany call while building the database
+BUILD_BATCH_SIZE = 10000
+
+COMPARISON_SQL = {"$gt": ">", "$gte": ">=", "$lt": "<", "$lte": "<=", "$eq": "="}
+
+
+def versioned_path(base_path, version):
+    """
+    Returns the database file of one dataset version.
+
+    Args:
+        base_path (str): SQL_BACKEND_PATH, e.g. "cache/promises.sqlite3".
+        version (str): The dataset version stamp.
+
+    Returns:
+        str: e.g. "cache/promises.<version>.sqlite3".
+    """
+    root, extension = os.path.splitext(base_path)
+    return f"{root}.{version}{extension or '.sqlite3'}"
+
+
+def _build_lock_path(base_path):
+    return base_path + ".build.lock"
+
+
+def _remove_if_unused(db_path):
+    """
+    Deletes a database file and its lock file unless a process still holds the lock.
+
+    The caller holds the build lock, so no process is about to start using the file.
+    """
+    lock_path = db_path + ".lock"
+    try:
+        with open(lock_path, "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            for path in (db_path, lock_path):
+                if os.path.exists(path):
+                    os.remove(path)
+        return True
+    except BlockingIOError:
+        return False
+    except OSError as e:
+        print(f"Error removing SQLite backend file {db_path}: {e}")
+        return False
+
+
+def _quote(identifier):
+    """Quotes a column name for use in SQL."""
+    return '"' + str(identifier).replace('"', '""') + '"'
+
+
+@functools.lru_cache(maxsize=256)
+def _compile_regex(pattern):
+    return re.compile(pattern, re.IGNORECASE)
+
+
+def _regexp(pattern, value):
+    """Implements SQLite's "value REGEXP pattern" with re.search semantics."""
+    if value is None:
+        return 0
+    return 1 if _compile_regex(pattern).search(value) is not None else 0
+
+
+def _sql_value(kind, dtype, value):
+    """Converts a coerced plan value to the stored representation."""
+    if kind == "datetime":
+        return int(np.datetime64(value, "ns").astype(np.int64))
+    if kind == "numeric":
+        if np.issubdtype(dtype, np.floating):
+            # NumPy compares float32 columns in float32; round the value the same way
+            return float(dtype.type(value))
+        return float(value)
+    return value
+
+
+def translate_plan(plan, schema_df):
+    """
+    Translates a compiled plan into a SQL WHERE clause.
+
+    Args:
+        plan (QueryPlan): The plan from compile_plan.
+        schema_df (pd.DataFrame): A DataFrame with the data's columns and dtypes.
+
+    Returns:
+        tuple: (where_sql, params) for a parameterized query.
+    """
+    params = []
+
+    def node_sql(node):
+        if isinstance(node, BooleanNode):
+            joiner = " AND " if node.op == "$and" else " OR "
+            return "(" + joiner.join(node_sql(child) for child in node.children) + ")"
+        return condition_sql(node)
+
+    def condition_sql(condition: Condition):
+        column, op, value = condition.column, condition.op, condition.value
+        if condition.kind == "text":
+            if op == "$contains":
+                if condition.literal is not None:
+                    params.append(condition.literal.lower())
+                    return f"instr({_quote(column + LOWER_SUFFIX)}, ?) > 0"
+                params.append(value.pattern)
+                return f"{_quote(column)} REGEXP ?"
+            # $eq / $ne / $in compare lowercased values, as the pandas path does
+            target = _quote(column + LOWER_SUFFIX)
+            values = sorted(value) if op == "$in" else [value]
+        else:
+            target = _quote(column)
+            kind, dtype = condition.kind, schema_df[column].dtype
+            if op == "$between":
+                params.extend(_sql_value(kind, dtype, v) for v in value)
+                return f"{target} BETWEEN ? AND ?"
+            values = [_sql_value(kind, dtype, v) for v in (value if op == "$in" else [value])]
+
+        params.extend(values)
+        if op == "$in":
+            return f"{target} IN ({', '.join('?' * len(values))})"
+        if op == "$ne":
+            # Missing values never equal anything, so they match $ne (as NaN != x does)
+            return f"({target} IS NULL OR {target} <> ?)"
+        return f"{target} {COMPARISON_SQL[op]} ?"
+
+    return node_sql(plan.root), params
+
+
+class SQLiteBackend:
+    """
+    Filters promises with SQL against a local SQLite copy of the data.
+
+    Attributes:
+        base_path (str): The path the versioned database files are named after.
+        db_path (str): The database file of this version (versioned_path).
+        version (str): The dataset version the database was built from.
+        page_size (int): Rows fetched per page.
+    """
+
+    def __init__(self, data_df, version, base_path=SQL_BACKEND_PATH, page_size=SQL_PAGE_SIZE):
+        self.base_path = base_path
+        self.db_path = versioned_path(base_path, version)
+        self.version = version
+        self.page_size = page_size
+        # Only the schema is kept in memory: compile_plan reads dtypes, pages are cast back to them
+        self.schema_df = data_df.iloc[:0].copy()
+        self.kinds = column_kinds(data_df)
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+        with open(_build_lock_path(base_path), "a") as build_lock:
+            # Held while checking and building, so concurrent workers build a version once
+            fcntl.flock(build_lock, fcntl.LOCK_EX)
+            if self._stored_version() != version:
+                self._build(data_df)
+                self._remove_unused_versions()
+            # Taken before the build lock is released, so close() elsewhere cannot delete the file
+            self._lock_file = open(self.db_path + ".lock", "a")
+            fcntl.flock(self._lock_file, fcntl.LOCK_SH)
+
+    def close(self):
+        """
+        Stops using this version's database and deletes it once no process uses it.
+
+        Call after a newer version was swapped in. Connections already open keep
+        reading the deleted file until their threads drop them.
+        """
+        if self._lock_file.closed:
+            return
+        self._lock_file.close()
+        with open(_build_lock_path(self.base_path), "a") as build_lock:
+            fcntl.flock(build_lock, fcntl.LOCK_EX)
+            _remove_if_unused(self.db_path)
+
+    # --- Building ---
+    def _stored_version(self):
+        try:
+            conn = sqlite3.connect(f"file:{self.db_path}?mode=ro", uri=True)
+            try:
+                row = conn.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()
+            finally:
+                conn.close()
+        except sqlite3.Error:
+            return None
+        return row[0] if row else None
+
+    def _remove_unused_versions(self):
+        """Deletes the files of other versions that no process uses any more, e.g. from earlier runs."""
+        root, extension = os.path.splitext(self.base_path)
+        for path in glob.glob(f"{glob.escape(root)}.*{extension or '.sqlite3'}"):
+            if path != self.db_path:
+                _remove_if_unused(path)
+
+    def _column_definitions(self):
+        definitions = ["row_id INTEGER PRIMARY KEY"]
+        for column, kind in self.kinds.items():
+            if kind == "text":
+                definitions.append(f"{_quote(column)} TEXT")
+                definitions.append(f"{_quote(column + LOWER_SUFFIX)} TEXT")
+            elif kind == "numeric":
+                definitions.append(f"{_quote(column)} REAL")
+            else:
+                definitions.append(f"{_quote(column)} INTEGER")
+        return definitions
+
+    def _stored_columns(self, chunk, start):
+        """Converts a DataFrame chunk to column lists in table order (missing values as None)."""
+        columns = [list(range(start, start + len(chunk)))]
+        for column, kind in self.kinds.items():
+            series = chunk[column]
+            missing = series.isna().to_numpy()
+            if kind == "datetime":
+                values = series.to_numpy("datetime64[ns]").view(np.int64).tolist()
+            elif kind == "numeric":
+                values = series.astype(float).tolist()
+            else:
+                values = series.astype(object).astype(str).tolist()
+            values = [None if m else v for v, m in zip(values, missing)]
+            columns.append(values)
+            if kind == "text":
+                columns.append([None if v is None else v.lower() for v in values])
+        return columns
+
+    def _build(self, data_df):
+        """Writes the data to a new database file and moves it into place."""
+        directory = os.path.dirname(self.db_path) or "."
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        os.close(fd)
+        try:
+            conn = sqlite3.connect(tmp_path)
+            try:
+                conn.execute("PRAGMA journal_mode=OFF")
+                conn.execute("PRAGMA synchronous=OFF")
+                definitions = self._column_definitions()
+                conn.execute(f"CREATE TABLE {TABLE_NAME} ({', '.join(definitions)})")
+                insert = f"INSERT INTO {TABLE_NAME} VALUES ({', '.join('?' * len(definitions))})"
+                for start in range(0, len(data_df), BUILD_BATCH_SIZE):
+                    chunk = data_df.iloc[start:start + BUILD_BATCH_SIZE]
+                    conn.executemany(insert, zip(*self._stored_columns(chunk, start)))
+                for column in INDEXED_COLUMNS:
+                    if column in self.kinds:
+                        stored = column + LOWER_SUFFIX if self.kinds[column] == "text" else column
+                        conn.execute(
+                            f"CREATE INDEX {_quote('idx_' + column)} ON {TABLE_NAME} ({_quote(stored)})"
+                        )
+                conn.execute("CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT)")
+                conn.execute("INSERT INTO meta VALUES ('version', ?)", (self.version,))
+                conn.execute("ANALYZE")
+                conn.commit()
+            finally:
+                conn.close()
+            os.replace(tmp_path, self.db_path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    # --- Querying ---
+    def _connection(self):
+        """Returns a read-only SQLite connection owned by the current thread and process."""
+        conn = getattr(self._local, "conn", None)
+        if conn is not None and getattr(self._local, "pid", None) == os.getpid():
+            return conn
+        conn = sqlite3.connect(f"file:{self.db_path}?mode=ro", uri=True, check_same_thread=False)
+        conn.create_function("regexp", 2, _regexp, deterministic=True)
+        self._local.conn = conn
+        self._local.pid = os.getpid()
+        return conn
+
+    def _to_frame(self, rows, columns):
+        """Turns fetched rows back into a DataFrame with the original dtypes."""
+        frame = pd.DataFrame.from_records(rows, columns=["row_id"] + columns)
+        frame = frame.set_index("row_id")
+        frame.index = frame.index.astype(np.int64)
+        frame.index.name = None
+        for column in columns:
+            dtype = self.schema_df[column].dtype
+            if self.kinds[column] == "datetime":
+                frame[column] = pd.to_datetime(frame[column], unit="ns").astype(dtype)
+            else:
+                frame[column] = frame[column].astype(dtype)
+        return frame
+
+    def iter_pages(self, structured_query, columns=None, page_size=None):
+        """
+        Runs a structured query and yields the matching rows page by page.
+
+        Args:
+            structured_query (dict): Filter conditions keyed by column name.
+            columns (list, optional): The columns to return (default all).
+            page_size (int, optional): Rows per page (default self.page_size).
+
+        Yields:
+            pd.DataFrame: Consecutive pages of matching rows in their original order,
+            indexed by row position.
+
+        Raises:
+            QueryPlanError: If the query does not fit the schema.
+        """
+        plan = compile_plan(structured_query, self.schema_df)
+        where_sql, params = translate_plan(plan, self.schema_df)
+        columns = list(columns or self.schema_df.columns)
+        select = ", ".join(["row_id"] + [_quote(c) for c in columns])
+        cursor = self._connection().execute(
+            f"SELECT {select} FROM {TABLE_NAME} WHERE {where_sql} ORDER BY row_id", params
+        )
+        try:
+            while True:
+                rows = cursor.fetchmany(page_size or self.page_size)
+                if not rows:
+                    break
+                yield self._to_frame(rows, columns)
+        finally:
+            cursor.close()
+
+    def positions(self, structured_query):
+        """
+        Runs a structured query and returns the positions of the matching rows.
+
+        Only the row ids cross from SQLite, so the app can select the rows
+        from the DataFrame it already holds (data_df.iloc[positions]) instead
+        of rebuilding every matching row from SQL.
+
+        Args:
+            structured_query (dict): Filter conditions keyed by column name.
+
+        Returns:
+            np.ndarray: Sorted int64 row positions, as from np.flatnonzero(plan.evaluate(data_df)).
+
+        Raises:
+            QueryPlanError: If the query does not fit the schema.
+        """
+        plan = compile_plan(structured_query, self.schema_df)
+        where_sql, params = translate_plan(plan, self.schema_df)
+        cursor = self._connection().execute(
+            f"SELECT row_id FROM {TABLE_NAME} WHERE {where_sql} ORDER BY row_id", params
+        )
+        try:
+            return np.fromiter((row[0] for row in cursor), dtype=np.int64)
+        finally:
+            cursor.close()
+
+    def count(self, structured_query):
+        """Returns the number of rows matching a structured query."""
+        plan = compile_plan(structured_query, self.schema_df)
+        where_sql, params = translate_plan(plan, self.schema_df)
+        return self._connection().execute(f"SELECT COUNT(*) FROM {TABLE_NAME} WHERE {where_sql}", params).fetchone()[0]
+
+
+def create_backend(data_df, version, backend=QUERY_BACKEND, min_rows=SQL_BACKEND_MIN_ROWS):
+    """
+    Creates the storage backend configured for a dataset.
+
+    Args:
+        data_df (pd.DataFrame): The promise data.
+        version (str): The dataset version stamp.
+        backend (str): "pandas", "sqlite" or "auto".
+        min_rows (int): The row count from which "auto" picks SQLite.
+
+    Returns:
+        SQLiteBackend or None: None means filtering the DataFrame with pandas.
+    """
+    if data_df.empty or backend == "pandas" or (backend == "auto" and len(data_df) < min_rows):
+        return None
+    if backend not in ("sqlite", "auto"):
+        print(f"Unknown QUERY_BACKEND '{backend}', using pandas.")
+        return None
+    try:
+        return SQLiteBackend(data_df, version)
+    except (sqlite3.Error, OSError) as e:
+        print(f"Error building the SQLite backend, using pandas: {e}")
+        return None
@@ -0,0 +1,119 @@
+"""
+This module measures where the app's startup time goes.
+
+app.py wraps each group of imports and each startup step (data load, map
+prerender, cache maintenance) in a stage of the startup timer. Imports are
+charged to the first stage that needs them, so a module shared by several app
+modules shows up under the first one imported. The report also lists which of
+the deferred heavy modules have been imported so far and how long the first
+request arrived after startup. It is logged once at startup and served at
+/stats/startup.
+
+For a per-module breakdown of the imports themselves, run
+    python -X importtime -c "import app" 2> importtime.txt
+from the src directory.
+
+Only the standard library is imported here, so the timer can be started
+before anything else.
+"""
+
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+# Modules imported on first use rather than at startup
+DEFERRED_MODULES = ("google.generativeai", "folium")
+
+
+class StartupTimer:
+    """
+    Records the duration of named startup stages.
+
+    Attributes:
+        stages (list): (name, seconds) pairs in the order they ran.
+        first_request_seconds (float or None): Seconds from the timer's creation
+            to the first request, once one has arrived.
+    """
+
+    def __init__(self):
+        self._started = time.perf_counter()
+        self._ready = None
+        self._lock = threading.Lock()
+        self.stages = []
+        self.first_request_seconds = None
+
+    @contextmanager
+    def stage(self, name):
+        """
+        Times the enclosed block as one stage.
+
+        Args:
+            name (str): The stage name shown in the report.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages.append((name, time.perf_counter() - start))
+
+    def ready(self):
+        """Marks the end of startup (the app can serve requests)."""
+        self._ready = time.perf_counter() - self._started
+
+    def mark_first_request(self):
+        """Records the arrival of the first request. Cheap to call on every request."""
+        if self.first_request_seconds is not None:
+            return
+        with self._lock:
+            if self.first_request_seconds is None:
+                self.first_request_seconds = time.perf_counter() - self._started
+
+    def report(self):
+        """
+        Returns the startup timings.
+
+        Returns:
+            dict: "stages" (name and seconds, in order), "total_seconds" until
+            ready(), "first_request_seconds" and "deferred_modules" (whether each
+            deferred module has been imported yet).
+        """
+        return {
+            "stages": [{"name": name, "seconds": round(seconds, 4)} for name, seconds in self.stages],
+            "total_seconds": round(self._ready, 4) if self._ready is not None else None,
+            "first_request_seconds": (
+                round(self.first_request_seconds, 4) if self.first_request_seconds is not None else None
+            ),
+            "deferred_modules": {name: name in sys.modules for name in DEFERRED_MODULES},
+        }
+
+    def format(self):
+        """Formats the report as a multi-line table in milliseconds."""
+        report = self.report()
+        width = max([len(stage["name"]) for stage in report["stages"]] + [5])
+        lines = ["Startup timing:"]
+        for stage in report["stages"]:
+            lines.append(f"  {stage['name']:<{width}} {stage['seconds'] * 1000:8.1f} ms")
+        if report["total_seconds"] is not None:
+            lines.append(f"  {'total':<{width}} {report['total_seconds'] * 1000:8.1f} ms")
+        loaded = [name for name, imported in report["deferred_modules"].items() if imported]
+        lines.append(f"  deferred modules imported: {', '.join(loaded) or 'none'}")
+        return "\n".join(lines)
+
+
+def register_startup_routes(server, timer):
+    """
+    Adds /stats/startup, which reports the startup timings of this worker.
+
+    Args:
+        server (flask.Flask): The Flask server behind the Dash app.
+        timer (StartupTimer): The timer app.py recorded its startup with.
+    """
+    from flask import jsonify
+
+    @server.route("/stats/startup")
+    def startup_stats():
+        return jsonify(timer.report())
+
+
+startup_timer = StartupTimer()
@@ -2,43 +2,77 @@
 This module contains utility functions for the City Promise Tracker app.
 """
 
-import folium
+import hashlib
 import pandas as pd
 import dash_bootstrap_components as dbc
 from dash import html
-import llm
+from query_parser import plan_query
+from query_plan import compile_plan, QueryPlanError
+from config import MAP_POPUP_MAX_ITEMS
+
+def _escape_html(series):
+    """HTML-escapes a string Series with vectorized replacements."""
+    return (
+        series.astype(str)
+        .str.replace("&", "&amp;", regex=False)
+        .str.replace("<", "&lt;", regex=False)
+        .str.replace(">", "&gt;", regex=False)
+        .str.replace('"', "&quot;", regex=False)
+    )
+
+
+def group_locations(data_df, max_popup_items=MAP_POPUP_MAX_ITEMS):
+    """
+    Groups promises that share identical coordinates into one entry per location.
+
+    Args:
+        data_df (pd.DataFrame): A DataFrame with 'latitude', 'longitude', 'city'
+            and 'promise_description' columns.
+        max_popup_items (int): The most promises listed in one combined popup.
+
+    Returns:
+        pd.DataFrame: One row per distinct location with 'latitude', 'longitude',
+        'count', 'popup' (HTML) and 'tooltip' columns.
+    """
+    located = data_df[["latitude", "longitude", "city", "promise_description"]].dropna(
+        subset=["latitude", "longitude"]
+    )
+    labels = "<b>" + _escape_html(located["city"]) + "</b><br>" + _escape_html(located["promise_description"])
+
+    grouped = labels.groupby([located["latitude"], located["longitude"]], sort=False)
+    locations = pd.DataFrame(
+        {
+            "count": grouped.size(),
+            "popup": grouped.agg(lambda items: "<hr>".join(items.iloc[:max_popup_items])),
+            "tooltip": _escape_html(located["city"]).groupby(
+                [located["latitude"], located["longitude"]], sort=False
+            ).first(),
+        }
+    ).reset_index()
+
+    overflow = locations["count"] > max_popup_items
+    locations.loc[overflow, "popup"] += (
+        "<hr><i>and " + (locations.loc[overflow, "count"] - max_popup_items).astype(str) + " more</i>"
+    )
+    several = locations["count"] > 1
+    locations.loc[several, "tooltip"] += " (" + locations.loc[several, "count"].astype(str) + " promises)"
+    return locations
+
 
-def create_map(data_df):
+def dataset_version(data_df):
     """
-    Creates a Folium map with markers for the given dataframe.
+    Returns a version stamp for the promise data, used to key caches.
 
     Args:
-        data_df (pd.DataFrame): A DataFrame with 'latitude' and 'longitude' columns.
+        data_df (pd.DataFrame): The promise data.
 
     Returns:
-        str: The HTML representation of the Folium map.
+        str: A short hex digest that changes whenever any value changes.
     """
-    try:
-        if data_df.empty:
-            # Return a default map if the dataframe is empty
-            return folium.Map(location=[39.8283, -98.5795], zoom_start=4).get_root().render()
-
-        # Create a Folium map centered on the average location
-        map_center = [data_df["latitude"].mean(), data_df["longitude"].mean()]
-        m = folium.Map(location=map_center, zoom_start=6)
-
-        for _, row in data_df.iterrows():
-            folium.Marker(
-                location=[row["latitude"], row["longitude"]],
-                popup=f"<b>{row['city']}</b><br>{row['promise_description']}",
-                tooltip=row["city"],
-            ).add_to(m)
-
-        return m.get_root().render()
-    except Exception as e:
-        print(f"Error creating map: {e}")
-        # Return a default map in case of an error
-        return folium.Map(location=[39.8283, -98.5795], zoom_start=4).get_root().render()
+    if data_df.empty:
+        return "empty"
+    row_hashes = pd.util.hash_pandas_object(data_df, index=False).to_numpy()
+    return hashlib.sha256(row_hashes.tobytes()).hexdigest()[:16]
 
 
 def get_status_badge(status):
@@ -68,13 +102,51 @@ def get_status_badge(status):
         return dbc.Badge("Error", color="danger")
 
 
-def filter_dataframe_from_query(data_df, query):
+def apply_structured_query(data_df, structured_query, index=None, backend=None):
     """
-    Filters the DataFrame based on a natural language query using the LLM.
+    Filters the DataFrame using a structured query produced by the LLM.
+
+    The query is validated and compiled into a QueryPlan, evaluated into a
+    single boolean mask, and only the matching rows are materialized. With a
+    SQL backend the plan is run as SQL instead, and the matching row
+    positions select the same rows.
+
+    Args:
+        data_df (pd.DataFrame): The DataFrame to filter.
+        structured_query (dict): Filter conditions keyed by column name.
+        index (PromiseIndex, optional): Prebuilt indexes for data_df, used for
+            selectivity estimates and indexed lookups.
+        backend (SQLiteBackend, optional): Storage backend holding data_df.
+
+    Returns:
+        pd.DataFrame: The filtered DataFrame.
+    """
+    try:
+        if not structured_query:
+            return pd.DataFrame()  # Return empty df if LLM fails
+
+        if backend is not None:
+            return data_df.iloc[backend.positions(structured_query)]
+        plan = compile_plan(structured_query, data_df)
+        return data_df[plan.evaluate(data_df, index)]
+    except QueryPlanError as e:
+        print(f"Invalid structured query {structured_query!r}: {e}")
+        return pd.DataFrame()
+    except Exception as e:
+        print(f"Error filtering dataframe: {e}")
+        return pd.DataFrame()
+
+
+def filter_dataframe_from_query(data_df, query, index=None, backend=None):
+    """
+    Filters the DataFrame based on a natural language query. Simple queries are
+    parsed locally; anything else is sent to the LLM.
 
     Args:
         data_df (pd.DataFrame): The DataFrame to filter.
         query (str): The natural language query.
+        index (PromiseIndex, optional): Prebuilt indexes for data_df.
+        backend (SQLiteBackend, optional): Storage backend holding data_df.
 
     Returns:
         pd.DataFrame: The filtered DataFrame.
@@ -83,32 +155,10 @@ def filter_dataframe_from_query(data_df, query):
         if not query:
             return data_df.copy()
 
-        # Get structured query from LLM
-        structured_query = llm.get_structured_query(query, data_df.columns.tolist())
-
-        if not structured_query:
-            return pd.DataFrame()  # Return empty df if LLM fails
+        # Get structured query from the local parser or the LLM
+        structured_query, _ = plan_query(data_df, query)
 
-        filtered_df = data_df.copy()
-
-        for key, value in structured_query.items():
-            if key in filtered_df.columns:
-                if isinstance(value, dict):
-                    # Handle date ranges or other complex queries
-                    for op, val in value.items():
-                        if op == "$gt":
-                            filtered_df = filtered_df[filtered_df[key] > pd.to_datetime(val)]
-                        elif op == "$lt":
-                            filtered_df = filtered_df[filtered_df[key] < pd.to_datetime(val)]
-                        elif op == "$eq":
-                            filtered_df = filtered_df[filtered_df[key] == pd.to_datetime(val)]
-                else:
-                    # Handle simple string matching (case-insensitive)
-                    filtered_df = filtered_df[
-                        filtered_df[key].str.contains(value, case=False, na=False)
-                    ]
-        
-        return filtered_df
+        return apply_structured_query(data_df, structured_query, index, backend)
     except Exception as e:
         print(f"Error filtering dataframe: {e}")
         return pd.DataFrame()
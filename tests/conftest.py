@@ -0,0 +1,10 @@
+"""
+Makes the app modules (src/) and the synthetic data generator (benchmarks/) importable from the tests.
+"""
+
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "src"))
+sys.path.insert(0, os.path.join(ROOT, "benchmarks"))
@@ -0,0 +1,86 @@
+"""
+Checks that the SQLite backend selects exactly the rows the pandas path selects.
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from indexes import PromiseIndex
+from sql_backend import SQLiteBackend
+from synthetic_data import generate_promises
+from utils import apply_structured_query, dataset_version
+
+PLANS = {
+    "city": {"city": {"$eq": "Seattle"}},
+    "city any case": {"city": "seattle"},
+    "late+city": {"status": "late", "city": "Chicago"},
+    "city in": {"city": {"$in": ["Boston", "Denver", "Nowhere"]}},
+    "not late": {"status": {"$ne": "late"}},
+    "date range": {"due_date": {"$between": ["2025-03-01", "2025-03-31"]}},
+    "due by": {"due_date": {"$lte": "2025-12-31"}},
+    "late+date": {"status": {"$eq": "late"}, "due_date": {"$gt": "2025-06-01"}},
+    "text": {"promise_description": "bridge"},
+    "text regex": {"promise_description": {"$contains": "^(repair|fix) "}},
+    "latitude": {"latitude": {"$between": [40.0, 42.5]}},
+    "or": {"$or": [{"category": {"$eq": "Water"}}, {"status": {"$eq": "late"}}]},
+    "nested": {"$and": [{"$or": [{"city": "Boston"}, {"city": "Miami"}]}, {"category": {"$ne": "Roads"}}]},
+    "no match": {"city": "Nowhere"},
+}
+
+
+@pytest.fixture(scope="module")
+def promises():
+    data_df = generate_promises(5000, seed=1)
+    # Missing values in every kind of column
+    rng = np.random.default_rng(1)
+    for column in ("city", "promise_description", "due_date", "latitude"):
+        data_df.loc[rng.choice(len(data_df), 50, replace=False), column] = None
+    return data_df
+
+
+@pytest.fixture(scope="module")
+def backend(promises, tmp_path_factory):
+    path = tmp_path_factory.mktemp("sql") / "promises.sqlite3"
+    return SQLiteBackend(promises, dataset_version(promises), str(path), page_size=700)
+
+
+@pytest.mark.parametrize("name", PLANS)
+def test_backend_selects_the_pandas_rows(promises, backend, name):
+    plan = PLANS[name]
+    expected = apply_structured_query(promises, plan, PromiseIndex(promises))
+
+    actual = apply_structured_query(promises, plan, backend=backend)
+
+    pd.testing.assert_frame_equal(actual, expected)
+    assert backend.count(plan) == len(expected)
+
+
+@pytest.mark.parametrize("name", PLANS)
+def test_pages_stream_the_pandas_rows(promises, backend, name):
+    plan = PLANS[name]
+    columns = ["city", "due_date", "status", "latitude"]
+    expected = apply_structured_query(promises, plan)[columns]
+
+    pages = list(backend.iter_pages(plan, columns))
+
+    assert all(len(page) <= backend.page_size for page in pages)
+    if expected.empty:
+        assert pages == []
+    else:
+        pd.testing.assert_frame_equal(pd.concat(pages), expected)
+
+
+def test_each_version_has_its_own_file(promises, tmp_path):
+    path = str(tmp_path / "promises.sqlite3")
+    old = SQLiteBackend(promises, "old", path)
+    new = SQLiteBackend(promises.iloc[:100], "new", path)
+
+    assert old.db_path != new.db_path
+    plan = {"status": {"$ne": "no such status"}}
+    assert old.count(plan) == len(promises)
+    assert new.count(plan) == 100
+
+    old.close()
+    assert not (tmp_path / "promises.old.sqlite3").exists()
+    assert (tmp_path / "promises.new.sqlite3").exists()